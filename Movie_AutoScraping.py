@@ -1,12 +1,35 @@
 import os
-import re
 import sys
 import time
-import datetime
 import argparse
-import subprocess
 import configparser
+from concurrent.futures import ThreadPoolExecutor
+import dedup
+import fingerprint
+import probe
 import file_clean
+import journal
+import junk_filter
+import library_index
+import metadata_cache
+import pipeline
+import scraper
+import rename_planner
+import transfer
+import watcher
+import stat_cache
+
+# The postfix flags (c, no, u, uc) of each section of MAS_config.ini
+SECTION_FLAGS = {
+    'sub': (True, False, False, False),
+    'no_sub': (False, True, False, False),
+    'hack': (False, False, True, False),
+    'hack_sub': (False, False, False, True),
+}
+
+# The section kept when the same file is in the source folders of several sections, the first one wins
+SECTION_PRIORITY = ['hack_sub', 'hack', 'sub', 'no_sub']
+
 
 def countdown(seconds):
     """Show countdown"""
@@ -21,6 +44,417 @@ def countdown(seconds):
     print()
 
 
+def apply_file_plan(config, plan):
+    """Apply a file_clean plan with the file operation settings of the config, journaled as a new run"""
+    run_journal = journal.Journal()
+    try:
+        file_clean.apply_plan(plan, config.getint('general', 'workers', fallback=8),
+                              config.getboolean('general', 'adaptive', fallback=True),
+                              config.getint('general', 'retries', fallback=3), run_journal)
+        run_journal.end()
+    finally:
+        run_journal.close()
+    print(f"Journal of the run: '{run_journal.path}', undo it with --undo {run_journal.run_id}")
+
+
+def replay_journals(config, resume_ids, undo_ids):
+    """Resume the given unfinished runs (all of them for an empty list) or undo the given runs"""
+    workers = config.getint('general', 'workers', fallback=8)
+    adaptive = config.getboolean('general', 'adaptive', fallback=True)
+    retries = config.getint('general', 'retries', fallback=3)
+    if undo_ids:
+        for run_id in undo_ids:
+            journal.undo(run_id, workers, adaptive, retries)
+        return
+    resume_ids = resume_ids or journal.unfinished_runs()
+    if not resume_ids:
+        print("No unfinished run to resume.")
+    for run_id in resume_ids:
+        journal.resume(run_id, workers, adaptive, retries)
+
+
+def junk_settings(config):
+    """Return the junk_filter.JunkFilter of the config, whose durations are in minutes"""
+    return junk_filter.JunkFilter(config.getfloat('general', 'junk_min_duration', fallback=10) * 60,
+                                  config.getfloat('general', 'junk_sample_duration', fallback=30) * 60)
+
+
+def identical_folders(config, section, inbox=False):
+    """Return the (folder, rank) of all the sections and the rank of the section source for fingerprint
+
+    The dest folders come first, a file already organised is always kept, then the source folders by
+    SECTION_PRIORITY. The source folder of the section is left out, as the plan comes from it, unless
+    the plan comes from the inbox.
+    """
+    folders = []
+    source_rank = len(SECTION_PRIORITY)
+    for other in SECTION_PRIORITY:
+        if other in config and os.path.isdir(config[other]['dest']):
+            folders.append((config[other]['dest'], 0))
+    for rank, other in enumerate(SECTION_PRIORITY, 1):
+        if other == section:
+            source_rank = rank
+            if not inbox:
+                continue
+        if other in config and os.path.isdir(config[other]['source']):
+            folders.append((config[other]['source'], rank))
+    return folders, source_rank
+
+
+def open_cache(config):
+    """Return the stat_cache.StatCache of the config, None if the cache is disabled"""
+    if config.getboolean('general', 'cache', fallback=True):
+        return stat_cache.StatCache(dir_mtime=config.get('general', 'dir_mtime', fallback='auto'))
+    return None
+
+
+def close_cache(cache, name):
+    if cache is not None:
+        print(f"[{name}] Cache: {cache.hits} unchanged, {cache.misses} new or changed files, "
+              f"{len(cache.pruned_dirs)} unchanged folders not listed.")
+        cache.close()
+
+
+def owned_policy(config):
+    """Return the policy of the files already in the library, one of library_index.OWNED_POLICIES"""
+    policy = config.get('general', 'owned', fallback='off')
+    if policy not in library_index.OWNED_POLICIES:
+        print(f"Unknown owned policy '{policy}', the library is not checked.")
+        return 'off'
+    return policy
+
+
+def open_library(config):
+    """Return the library_index.LibraryIndex of the dest folders, None if the owned policy is 'off'
+
+    A dest folder never indexed is indexed now, the others are only refreshed after scraping.
+    """
+    if owned_policy(config) == 'off':
+        return None
+    library = library_index.LibraryIndex()
+    for section in SECTION_FLAGS:
+        if section not in config or not os.path.isdir(config[section]['dest']):
+            continue
+        if not library.indexed(config[section]['dest']):
+            print(f"[{section}] Indexing the library in '{config[section]['dest']}'...")
+            library.refresh(config[section]['dest'], config.getint('general', 'workers', fallback=8))
+    if library.probed:
+        print(f"Library: {len(library.entries)} video files indexed, {library.probed} probed.")
+    return library
+
+
+def refresh_library(config, sections):
+    """Index the files just organised into the dest folders of the sections"""
+    if owned_policy(config) == 'off':
+        return
+    library = library_index.LibraryIndex()
+    for section in sections:
+        if os.path.isdir(config[section]['dest']):
+            scanned = library.refresh(config[section]['dest'], config.getint('general', 'workers', fallback=8))
+            print(f"[{section}] Library updated, {scanned} folders scanned.")
+    library.close()
+
+
+def check_owned(config, section, plan, library):
+    """Return the plan of a section with the files already in the library handled by the owned policy"""
+    if library is None:
+        return plan
+    plan, owned = library_index.find_owned(plan, library, owned_policy(config))
+    if owned:
+        print(f"[{section}] {owned} files already owned in the library.")
+    return plan
+
+
+def checks_enabled(config):
+    """Whether the plans are checked for identical files, duplicates or owned files, which needs the whole plan"""
+    return (config.getboolean('general', 'fingerprint', fallback=False)
+            or config.getboolean('general', 'dedup', fallback=False)
+            or owned_policy(config) != 'off')
+
+
+def check_plan(config, section, plan, inbox=False, library=None):
+    """Return the plan of a section with its identical, duplicate and owned files marked, when enabled"""
+    if config.getboolean('general', 'fingerprint', fallback=False):
+        print(f"[{section}] Looking for identical files in the source and dest folders of all the sections...")
+        folders, source_rank = identical_folders(config, section, inbox)
+        index = fingerprint.FingerprintIndex()
+        plan = fingerprint.resolve_identical(plan, source_rank, folders, index)
+        print(f"[{section}] Fingerprints: {index.hashed} files partially hashed, {index.full_hashed} fully hashed.")
+        index.close()
+    plan = check_owned(config, section, plan, library)
+    if config.getboolean('general', 'dedup', fallback=False) or owned_policy(config) == 'dedup':
+        print(f"[{section}] Looking for duplicates in the source and dest folders...")
+        probe_cache = probe.ProbeCache() if config.getboolean('general', 'cache', fallback=True) else None
+        plan = dedup.resolve_duplicates(plan, [config[section]['dest']], probe_cache, library)
+        if probe_cache is not None:
+            print(f"[{section}] Probe cache: {probe_cache.hits} known, {probe_cache.misses} probed files.")
+            probe_cache.close()
+    return plan
+
+
+def plan_section(config, section, report, executor=None, library=None):
+    """Walk the source folder of a section and return its change plan
+
+    The plan is checked against the stat cache and, when enabled, for identical files and duplicates.
+    Without these checks, the changes are reported as the walk goes. The rename collisions are resolved
+    in the plan before it is reported, with the collisions policy of the config. The video probes run on
+    the given executor, shared by the sections planned at the same time.
+    """
+    folder_path = config[section]['source']
+    if not folder_path.endswith('/'):
+        folder_path += '/'
+
+    streaming = not checks_enabled(config)
+    cache = open_cache(config)
+    collisions = []
+    plan = file_clean.plan_file_clean(folder_path, *SECTION_FLAGS[section], cache, junk_settings(config),
+                                      config.getint('general', 'workers', fallback=8), executor,
+                                      report if streaming else None, {staging_folder(folder_path)},
+                                      config.get('general', 'collisions', fallback='suffix'), collisions)
+    close_cache(cache, section)
+    if not streaming:
+        plan = check_plan(config, section, plan, library=library)
+        report.write_all(plan)
+        report.write_collisions(collisions)
+    return plan
+
+
+def plan_inbox(config, report, library=None):
+    """Walk the inbox folder once, write its changes to the report and return the plan of each section
+
+    Each file goes to the section of the category inferred from its name and subtitle files, see
+    file_clean.plan_inbox.
+    """
+    folder_path = config['inbox']['source']
+    if not folder_path.endswith('/'):
+        folder_path += '/'
+
+    cache = open_cache(config)
+    collisions = []
+    mode_plans = file_clean.plan_inbox(folder_path, cache, junk_settings(config),
+                                       config.getint('general', 'workers', fallback=8), {staging_folder(folder_path)},
+                                       config.get('general', 'collisions', fallback='suffix'), collisions)
+    close_cache(cache, 'inbox')
+    plans = {}
+    for section, flags in SECTION_FLAGS.items():
+        plan = mode_plans[file_clean.postfix_mode(*flags)]
+        if not plan:
+            continue
+        if section not in config:
+            print(f"[inbox] {len(plan)} files of [{section}] left in the inbox, the section is not configured.")
+            continue
+        plans[section] = check_plan(config, section, plan, inbox=True, library=library)
+        report.write_all(plans[section])
+    report.write_collisions(collisions)
+    return plans
+
+
+def plan_sections(config, sections, report, library=None):
+    """Plan the sections at the same time, all writing to the report, return the plan of each section
+
+    The source folders are walked concurrently, one thread each, and the video probes of all the
+    sections share a single pool of workers threads.
+    """
+    workers = config.getint('general', 'workers', fallback=8)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as probe_executor, \
+            ThreadPoolExecutor(max_workers=len(sections)) as section_executor:
+        futures = {section: section_executor.submit(plan_section, config, section, report, probe_executor, library)
+                   for section in sections}
+        return {section: future.result() for section, future in futures.items()}
+
+
+def open_metadata_cache(config):
+    """Return the metadata_cache.MetadataCache of the config, None if it is disabled"""
+    if not config.getboolean('general', 'metadata_cache', fallback=True):
+        return None
+    days = 86400
+    return metadata_cache.MetadataCache(ttl=config.getfloat('general', 'metadata_ttl', fallback=30) * days,
+                                        failed_ttl=config.getfloat('general', 'metadata_failed_ttl', fallback=1) * days,
+                                        max_bytes=config.getint('general', 'metadata_cache_size', fallback=1024) << 20)
+
+
+def regenerate_metadata(config):
+    """Write the NFO and artwork missing in the dest folders of all the sections from the metadata cache"""
+    cache = metadata_cache.MetadataCache()
+    for section in SECTION_FLAGS:
+        if section in config and os.path.isdir(config[section]['dest']):
+            written = cache.regenerate(config[section]['dest'])
+            print(f"[{section}] {written} files written from the metadata cache.")
+    cache.close()
+
+
+def staging_folder(source_folder):
+    """Return the folder of a source folder where MDC organises the files of a dest on another mount"""
+    return os.path.join(source_folder, transfer.STAGING_FOLDER)
+
+
+def organise_mode(config):
+    """Return the organise mode of the config, one of transfer.ORGANISE_MODES"""
+    mode = config.get('general', 'organise', fallback='move')
+    if mode not in transfer.ORGANISE_MODES:
+        print(f"Unknown organise mode '{mode}', the files are moved.")
+        return 'move'
+    return mode
+
+
+def link_jobs(plan, mode, input_folder, success_output_path, failed_output_path, journal, strategies, label):
+    """Return the ScrapeJobs of the video files of a plan in the 'reflink' or 'hardlink' organise mode
+
+    Each file gets a link under its cleaned name in input_folder, in the staging folder of the source
+    folder, MDC moves the link and the file stays in place. The files organised by an earlier run are
+    left out. The (path, size, mtime, label) of each job is added to strategies, keyed by the path of
+    the job, label is the strategy the file ends up organised with. Also return the part of the plan
+    for the files that can not be linked (the change of the file and the junk deleted in its folder):
+    the caller applies it and has MDC move the cleaned files, as in the 'move' mode.
+    """
+    taken = set()
+    jobs = []
+    unlinked = set()
+    for file_path, name in file_clean.video_names(plan):
+        if file_path.startswith(failed_output_path + os.sep):
+            continue
+        # Two files of the plan can have the same cleaned name
+        link_name = name
+        number = 1
+        while link_name in taken:
+            link_name = rename_planner.suffixed(name, number)
+            number += 1
+        taken.add(link_name)
+        link_path = os.path.join(input_folder, link_name)
+        try:
+            file_stat = os.stat(file_path)
+            if journal.organised(file_path, file_stat.st_size, file_stat.st_mtime):
+                continue
+            strategy = transfer.link_file(file_path, link_path, mode)
+        except OSError as e:
+            print(f"Failed '{file_path}': {e}")
+            continue
+        if strategy is None:
+            unlinked.add(file_path)
+        else:
+            jobs.append(scraper.ScrapeJob(link_path, success_output_path, failed_output_path, linked=True))
+            strategies[link_path] = (file_path, file_stat.st_size, file_stat.st_mtime, label)
+    folders = set(os.path.dirname(file_path) for file_path in unlinked)
+    fallback_plan = tuple(change for change in plan
+                          if os.path.join(change.dirpath, change.file_name) in unlinked
+                          or (change.action == 'delete' and change.dirpath in folders))
+    return jobs, fallback_plan
+
+
+def scrape(config, plans, source_folder=None):
+    """Run MDC on the video files of the applied plan of each section, return False if MDC is not found
+
+    The files of all the sections are scraped by a single scraper.scrape_files call, each into the dest
+    folder of its section. The files that fail go to the failed folder of the source folder they come
+    from, the source folder of their section unless a source_folder (the inbox) is given.
+
+    When the dest folder is on another mount than the source folder, MDC organises the files in the
+    staging folder of the source folder instead, and transfer.transfer_tree moves them to the dest
+    afterwards, along with the files an interrupted run left there. In the 'reflink' and 'hardlink'
+    organise modes, MDC gets a link of each file instead of the file (see link_jobs).
+    """
+    mdc_path = scraper.find_mdc(config.get('general', 'mdc', fallback='./mdc'))
+    if mdc_path is None:
+        print("MDC program not found, skip scraping.")
+        return False
+
+    mode = organise_mode(config)
+    journal = transfer.TransferJournal()
+    jobs = []
+    staged = []
+    strategies = {}
+    for section, plan in plans.items():
+        source = source_folder or config[section]['source']
+        failed_output_path = os.path.join(source, 'failed')
+        success_output_path = config[section]['dest']
+        fallback = 'rename'
+        if not transfer.same_mount(source, config[section]['dest']):
+            success_output_path = os.path.join(staging_folder(source), section)
+            staged.append((success_output_path, config[section]['dest']))
+            fallback = 'copy'
+        if mode == 'move':
+            jobs.extend(scraper.ScrapeJob(file_path, success_output_path, failed_output_path)
+                        for file_path in file_clean.video_files_after(plan)
+                        if not file_path.startswith(failed_output_path + os.sep))
+            continue
+        input_folder = os.path.join(staging_folder(source), 'input', section)
+        # A link in the staging folder of a dest on another mount is copied there afterwards
+        label = mode if fallback == 'rename' else f"{mode} + copy"
+        linked_jobs, fallback_plan = link_jobs(plan, mode, input_folder, success_output_path, failed_output_path,
+                                               journal, strategies, label)
+        jobs.extend(linked_jobs)
+        if fallback_plan:
+            # The files that can not be linked are cleaned in place, then moved by MDC
+            apply_file_plan(config, fallback_plan)
+            for file_path in file_clean.video_files_after(fallback_plan):
+                jobs.append(scraper.ScrapeJob(file_path, success_output_path, failed_output_path))
+                strategies[file_path] = (file_path, None, None, fallback)
+    cache = open_metadata_cache(config)
+    scrape_results = scraper.scrape_files(jobs, mdc_path,
+                                          config.getint('general', 'scrape_workers', fallback=4),
+                                          config.getint('general', 'scrape_timeout', fallback=600), cache=cache)
+    if cache is not None:
+        cache.close()
+
+    if strategies:
+        counts = {}
+        for result in scrape_results:
+            if result.status == 'done' and result.job.path in strategies:
+                file_path, size, mtime, strategy = strategies[result.job.path]
+                print(f"({strategy.upper()}) '{file_path}'")
+                counts[strategy] = counts.get(strategy, 0) + 1
+                if result.job.linked:
+                    journal.mark_organised(file_path, size, mtime, strategy)
+        print(f"Organised {sum(counts.values())} files: "
+              + ", ".join(f"{count} {strategy}" for strategy, count in sorted(counts.items())) + ".")
+
+    for staging_path, dest in staged:
+        if os.path.isdir(staging_path):
+            print(f"\nTransferring '{staging_path}' to '{dest}'...\n")
+            transfer.transfer_tree(staging_path, dest, config.getint('general', 'transfer_workers', fallback=2),
+                                   config.getfloat('general', 'transfer_bandwidth', fallback=0) * 1e6, journal)
+    journal.close()
+    refresh_library(config, plans)
+    return True
+
+
+def process_paths(config, section, paths):
+    """Clean, rename and scrape the given files of a section, without walking its folder"""
+    print(f"\n[{section}] {len(paths)} new files")
+    plan = file_clean.plan_files(paths, *SECTION_FLAGS[section], junk=junk_settings(config),
+                                 collisions=config.get('general', 'collisions', fallback='suffix'))
+    library = open_library(config)
+    if library is not None:
+        plan = check_owned(config, section, plan, library)
+        library.close()
+    if organise_mode(config) == 'move':
+        apply_file_plan(config, plan)
+    scrape(config, {section: plan})
+
+
+def watch(config):
+    """Watch the source folders of all the sections and process the new files as they arrive"""
+    folders = {}
+    skip = []
+    for section in SECTION_FLAGS:
+        if section in config and os.path.isdir(config[section]['source']):
+            folders[config[section]['source']] = section
+            skip.append(os.path.join(config[section]['source'], 'failed'))
+            skip.append(staging_folder(config[section]['source']))
+        else:
+            print(f"The source folder of [{section}] is not exist, not watched.")
+    if not folders:
+        print("No folder to watch, exit.")
+        return
+
+    try:
+        watcher.watch_folders(folders, lambda section, paths: process_paths(config, section, paths),
+                              config.getint('general', 'watch_debounce', fallback=5),
+                              config.getint('general', 'watch_stable', fallback=30), skip)
+    except KeyboardInterrupt:
+        print("\nWatch stopped by user.")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Process video files.')
     # parser.add_argument('-s', '--source', type=str, required=True, help='Source folder path')
@@ -32,11 +466,25 @@ if __name__ == "__main__":
     parser.add_argument('-u', '--hack', action='store_true', help='Scrape all movies default with hacked')
     parser.add_argument('-uc', '--hack_sub', action='store_true', help='Scrape all movies default with hacked AND '
                                                                        'subtitle')
+    parser.add_argument('-a', '--all', action='store_true', help='Process the source folders of all the sections '
+                                                                 'in one run, with one report')
+    parser.add_argument('-i', '--inbox', action='store_true', help='Process the [inbox] source folder, the category '
+                                                                   'of each file is inferred from its name')
+    parser.add_argument('-w', '--watch', action='store_true', help='Keep running, watch all the source folders and '
+                                                                   'process the new files as they arrive')
+    parser.add_argument('--resume', nargs='*', metavar='RUN_ID', help='Run the operations left by the given runs, '
+                                                                      'all the unfinished runs by default, no walk')
+    parser.add_argument('--undo', nargs='+', metavar='RUN_ID', help='Move the files of the given runs back where '
+                                                                    'they were, from their journal')
+    parser.add_argument('--regenerate', action='store_true', help='Write the NFO and artwork missing in the dest '
+                                                                  'folders from the metadata cache, offline')
     """ Step 1: Fetch arguments and initialise """
     print("Initialising...")
     args = parser.parse_args()
 
-    if sum([args.sub, args.no_sub, args.hack, args.hack_sub]) != 1:
+    maintenance = args.resume is not None or args.undo or args.regenerate
+    if (not maintenance and not args.watch and not args.all and not args.inbox
+            and sum([args.sub, args.no_sub, args.hack, args.hack_sub]) != 1):
         print("Error: You must provide exactly one of the following options: -c, -no, -u, -uc")
         input_from_command = input("Specify your command in here: (d, c, no, u, uc)\n")
         if input_from_command == 'd':
@@ -57,39 +505,50 @@ if __name__ == "__main__":
     config = configparser.ConfigParser()
     config.read('MAS_config.ini', encoding='utf-8')
 
-    '''
-    mdc_path = config['general']['mdc']
-    if not mdc_path.endswith('/'):
-        mdc_path += '/'
-    mdc_config_path = mdc_path
-    '''
+    if args.regenerate:
+        regenerate_metadata(config)
+        sys.exit()
+    if args.resume is not None or args.undo:
+        replay_journals(config, args.resume, args.undo)
+        sys.exit()
+    unfinished = journal.unfinished_runs()
+    if unfinished:
+        print(f"Unfinished runs: {', '.join(unfinished)}, resume them with --resume or undo them with --undo RUN_ID.")
+
+    # Unattended mode, no report and no countdown
+    if args.watch:
+        watch(config)
+        sys.exit()
 
-    if args.sub:
-        folder_path = config['sub']['source']
-        success_output_path = config['sub']['dest']
+    if args.inbox:
+        sections = []
+        if 'inbox' not in config or not os.path.exists(config['inbox']['source']):
+            print("The [inbox] source folder is not exist, exit.")
+            sys.exit()
+    elif args.all:
+        sections = []
+        for section in SECTION_FLAGS:
+            if section in config and os.path.exists(config[section]['source']):
+                sections.append(section)
+            else:
+                print(f"The source folder of [{section}] is not exist, skipped.")
+    elif args.sub:
+        sections = ['sub']
     elif args.no_sub:
-        folder_path = config['no_sub']['source']
-        success_output_path = config['no_sub']['dest']
+        sections = ['no_sub']
     elif args.hack:
-        folder_path = config['hack']['source']
-        success_output_path = config['hack']['dest']
+        sections = ['hack']
     elif args.hack_sub:
-        folder_path = config['hack_sub']['source']
-        success_output_path = config['hack_sub']['dest']
+        sections = ['hack_sub']
     else:
         print("No specify path, exit...")
         sys.exit()
 
     # Check the path existing
-    if not os.path.exists(folder_path):
+    missing = not sections or not all(os.path.exists(config[section]['source']) for section in sections)
+    if not args.inbox and missing:
         print("The path is not exist, exit.")
         sys.exit()
-        
-    if not folder_path.endswith('/'):
-        folder_path += '/'
-
-    if not folder_path.endswith('/'):
-        folder_path += '/'
 
     # Check dry run
     dry_run = args.dryrun
@@ -114,9 +573,17 @@ if __name__ == "__main__":
     print("\n\nFinished\n\n")
 
     """ Step 2: Dry run and log """
-    # Whatever the dry run option, run dry run first
+    # Whatever the dry run option, plan and report first, the plan is reused to apply
     print("Generate file report...\n\n")
-    file_clean(True, folder_path, args.sub, args.no_sub, args.hack, args.hack_sub)
+    report = file_clean.ReportWriter()
+    library = open_library(config)
+    if args.inbox:
+        plans = plan_inbox(config, report, library)
+    else:
+        plans = plan_sections(config, sections, report, library)
+    if library is not None:
+        library.close()
+    report.close()
 
     if dry_run:
         sys.exit()
@@ -126,19 +593,16 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("\nOperation interrupted by user, abort.")
             sys.exit()
-        file_clean(False, folder_path, args.sub, args.no_sub, args.hack, args.hack_sub)
+        if organise_mode(config) == 'move':
+            apply_file_plan(config, pipeline.ChainedPlans(plans.values()))
+        else:
+            # Nothing is renamed or deleted in the source folders, MDC gets a link of each video file
+            print(f"Organise mode '{organise_mode(config)}', the source folders are left as they are.")
 
     print("Finished\n\n")
 
-    """ Run MDC """
-    """
+    """ Step 3: Run MDC """
     print("Run MDC\n\n")
-    try:
-        os.system(
-            f"{mdc_path}mdc -C 'common:source_folder={folder_path}' -C 'common:failed_output_folder={folder_path}failed' -C 'common:success_output_folder={success_output_path}' ")
-    except subprocess.CalledProcessError as e:
-        print(f"Error while running mdc: {e}")
+    scrape(config, plans, config['inbox']['source'] if args.inbox else None)
 
     print("Finished")
-    """
-
@@ -0,0 +1,389 @@
+import os
+import re
+import time
+import gc
+import random
+import struct
+import argparse
+import tempfile
+import tracemalloc
+
+import probe
+import records
+import normalizer
+import scraper
+import metadata_cache
+import file_clean
+
+
+def legacy_clean_filename(filename, c, no, u, uc):
+    """The file_clean.clean_filename before the normalizer, kept as the baseline of the benchmark"""
+
+    # Delete number prefix, e.g., 232GANA-334-C.mp4 -> GANA-334-C.mp4
+    filename = re.sub(r"^\d+", "", filename)
+
+    # Delete [], e.g., [233.com]SSNI-334-C.mp4 -> SSNI-334-C.mp4
+    filename = re.sub(r"^\[.*?\]", "", filename)
+
+    # Capture the CD number if present, e.g., SSNI-888-CD2.mp4 -> CD2
+    cd_number_match = re.search(r"(cd\d+)", filename, re.IGNORECASE)
+    cd_number = cd_number_match.group(1) if cd_number_match else ''
+
+    # Capture the CD number if present, e.g., SSNI-888-CD2.mp4 -> CD2
+    cd_number_match = re.search(r"(cd\d+)", filename, re.IGNORECASE)
+    cd_number = cd_number_match.group(1) if cd_number_match else ''
+
+    # Add "-", e.g., SSNI334C.mp4 -> SSNI-334-C.mp4
+    if re.match(r"[A-Za-z]+\d+C\.", filename):
+        filename = re.sub(r"([A-Za-z]+)(\d+)(C\.)", r"\1-\2-\3", filename)
+    elif re.match(r"[A-Za-z]+\d+-C\.", filename):
+        filename = re.sub(r"([A-Za-z]+)(\d+)-C\.", r"\1-\2-C.", filename)
+    elif re.match(r"[A-Za-z]+\d\.", filename):
+        filename = re.sub(r"([A-Za-z]+)(\d+)", r"\1-\2", filename)
+
+    # Delete all characters after the number part
+    filename = re.sub(r'(\d+).*?(?=\.[^.]+$)', r'\1', filename)
+
+    # Append the CD number if present
+    if cd_number:
+        filename_base, filename_extension = os.path.splitext(filename)
+        filename = f"{filename_base}-{cd_number}{filename_extension}"
+
+    # Append the CD number if present
+    if cd_number:
+        filename_base, filename_extension = os.path.splitext(filename)
+        filename = f"{filename_base}-{cd_number}{filename_extension}"
+
+    if c:
+        # Add "-C" if it is not exist, e.g., SSNI-334.mp4 -> SSNI-334-C.mp4
+        if not re.search(r"-c\.(?=[^.]+$)", filename, re.I):  # re.I 是大小写不敏感标志
+            filename = re.sub(r"\.(?=[^.]+$)", "-C.", filename)
+    elif no:
+        return filename
+    elif u:
+        # Delete all characters after -u but before .extension
+        # filename = re.sub(r"(-u).*\.", r"\1.", filename, re.I)
+        # Change all -u tag to -hack tag
+        # filename = re.sub(r"-u", "-hack", filename, re.I)
+
+        # Add -hack tag
+        filename = re.sub(r"\.(?=[^.]+$)", "-hack.", filename)
+    elif uc:
+        # Change the possible pattern (-u-c, -c-u, -uc, -cu) to -hack-c
+        # filename = re.sub(r"-(u-c|c-u|uc|cu|hack-c|hackc)(?=\.[^.]+$)", "-hack-c", filename)
+
+        # Add -hack-c tag
+        filename = re.sub(r"\.(?=[^.]+$)", "-hack-c.", filename)
+
+    return filename
+
+def make_release_names(count, seed=0):
+    """Generate synthetic release names with ad prefixes, [site] tags, CD parts and -C/-U/-UC suffixes"""
+    rng = random.Random(seed)
+    prefixes = ['SSNI', 'IPX', 'ABP', 'GANA', 'MIDE', 'STARS', 'JUL', 'PRED', 'ssis', 'fsdss']
+    ads = ['', '', '', '232', '300', '[233.com]', '[98t.tv]', 'hhd800.com@', 'www.site.top-', '[thz.la]123']
+    separators = ['-', '-', '_', '']
+    suffixes = ['', '', '-C', 'C', '-U', '-UC', '-hack', '-hack-c', '_c', '.1080p', '-FHD']
+    cds = ['', '', '', '-CD1', '-cd2', '_CD3']
+    extensions = ['.mp4', '.mp4', '.mkv', '.avi', '.wmv']
+    for _ in range(count):
+        yield (rng.choice(ads) + rng.choice(prefixes) + rng.choice(separators) + str(rng.randint(1, 999)).zfill(3)
+               + rng.choice(suffixes) + rng.choice(cds) + rng.choice(extensions))
+
+
+def bench_filename(args):
+    """Names per second of the normalizer against the legacy clean_filename"""
+    names = list(make_release_names(args.count))
+    print(f"Corpus: {len(names)} names, e.g. {names[:3]}")
+
+    for mode in ['c', 'no', 'u', 'uc']:
+        flags = (mode == 'c', mode == 'no', mode == 'u', mode == 'uc')
+
+        start = time.perf_counter()
+        legacy = [legacy_clean_filename(name, *flags) for name in names]
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cleaned = normalizer.clean_many(names, mode)
+        clean_time = time.perf_counter() - start
+
+        changed = sum(1 for old, new in zip(legacy, cleaned) if old != new)
+        print(f"[{mode:>2}] legacy {len(names) / legacy_time:>12,.0f} names/s | "
+              f"normalizer {len(names) / clean_time:>12,.0f} names/s | "
+              f"x{legacy_time / clean_time:.1f} | {changed} names cleaned differently")
+
+
+def bench_scrape(args):
+    """Files per second of the scraping stage against mdc_stub.py, and again from the metadata cache"""
+    os.environ['MDC_STUB_SLEEP'] = str(args.sleep)
+    os.environ['MDC_STUB_FAIL_RATE'] = str(args.fail_rate)
+    mdc_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mdc_stub.py')
+    names = list(make_release_names(args.count))
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        cache = metadata_cache.MetadataCache(os.path.join(temp_folder, 'metadata_cache.db')) if args.cached else None
+        runs = ['MDC', 'cache'] if args.cached else ['MDC']
+        for run, label in enumerate(runs):
+            source_folder = os.path.join(temp_folder, f'source{run}')
+            os.makedirs(source_folder)
+            jobs = []
+            for name in names:
+                # A folder per file keeps the names apart and parsable by the cache
+                file_path = os.path.join(source_folder, str(len(jobs)), name)
+                os.makedirs(os.path.dirname(file_path))
+                open(file_path, 'w').close()
+                jobs.append(scraper.ScrapeJob(file_path, os.path.join(temp_folder, f'dest{run}'),
+                                              os.path.join(source_folder, 'failed')))
+
+            start = time.perf_counter()
+            results = scraper.scrape_files(jobs, mdc_path, args.concurrency, args.timeout,
+                                           os.path.join(temp_folder, f'log{run}'), cache)
+            elapsed = time.perf_counter() - start
+
+            statuses = {}
+            for result in results:
+                statuses[result.status] = statuses.get(result.status, 0) + 1
+            print(f"[{label}] {args.count} files, concurrency {args.concurrency}, stub sleep {args.sleep} sec: "
+                  f"{args.count / elapsed:.2f} files/s, {statuses}")
+        if cache is not None:
+            cache.close()
+
+
+def mp4_box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def write_mp4(file, size, width, height, duration):
+    """An MP4 with its moov box at the end of the file, an audio track before the video track"""
+    mvhd = mp4_box(b'mvhd', struct.pack('>4xIIII', 0, 0, 1000, int(duration * 1000)) + bytes(80))
+    tracks = b''
+    for handler, track_width, track_height, codec in [(b'soun', 0, 0, b'mp4a'), (b'vide', width, height, b'avc1')]:
+        tkhd = mp4_box(b'tkhd', bytes(76) + struct.pack('>II', track_width << 16, track_height << 16))
+        hdlr = mp4_box(b'hdlr', bytes(8) + handler + bytes(13))
+        stsd = mp4_box(b'stsd', struct.pack('>4xI', 1) + mp4_box(codec, bytes(78)))
+        stbl = mp4_box(b'stbl', stsd + mp4_box(b'stsz', bytes(20000)))
+        tracks += mp4_box(b'trak', tkhd + mp4_box(b'mdia', hdlr + mp4_box(b'minf', stbl)))
+    moov = mp4_box(b'moov', mvhd + tracks)
+    file.write(mp4_box(b'ftyp', b'isom\0\0\0\1isomavc1'))
+    mdat_size = size - file.tell() - len(moov)
+    file.write(struct.pack('>I4s', mdat_size, b'mdat'))
+    file.seek(size - len(moov))
+    file.write(moov)
+
+
+def ebml_element(element_id, payload):
+    element_id = element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+    return element_id + (len(payload) | 1 << 56).to_bytes(8, 'big') + payload
+
+
+def ebml_uint(element_id, value):
+    return ebml_element(element_id, value.to_bytes(4, 'big'))
+
+
+def write_mkv(file, size, width, height, duration):
+    info = ebml_element(probe.MKV_INFO, ebml_uint(probe.MKV_TIMECODE_SCALE, 1000000)
+                        + ebml_element(probe.MKV_DURATION, struct.pack('>d', duration * 1000)))
+    audio = ebml_element(probe.MKV_TRACK_ENTRY, ebml_uint(probe.MKV_TRACK_TYPE, 2)
+                         + ebml_element(probe.MKV_CODEC_ID, b'A_AAC'))
+    video = ebml_element(probe.MKV_TRACK_ENTRY, ebml_uint(probe.MKV_TRACK_TYPE, 1)
+                         + ebml_element(probe.MKV_CODEC_ID, b'V_MPEGH/ISO/HEVC')
+                         + ebml_element(probe.MKV_VIDEO, ebml_uint(probe.MKV_PIXEL_WIDTH, width)
+                                        + ebml_uint(probe.MKV_PIXEL_HEIGHT, height)))
+    file.write(ebml_element(0x1A45DFA3, ebml_element(0x4282, b'matroska')))
+    # A Segment of unknown size, with a large Void element before Tracks
+    file.write(bytes.fromhex('18538067') + bytes.fromhex('01ffffffffffffff') + info
+               + ebml_element(0xEC, bytes(200000)) + ebml_element(probe.MKV_TRACKS, audio + video)
+               + ebml_element(probe.MKV_CLUSTER, bytes(16)))
+
+
+def riff_chunk(chunk_id, payload):
+    return chunk_id + struct.pack('<I', len(payload)) + payload
+
+
+def write_avi(file, size, width, height, duration):
+    avih = riff_chunk(b'avih', struct.pack('<14I', 40000, 0, 0, 0, int(duration * 25), 0, 2, 0, width, height,
+                                           0, 0, 0, 0))
+    auds = riff_chunk(b'LIST', b'strl' + riff_chunk(b'strh', b'auds' + bytes(52)))
+    vids = riff_chunk(b'LIST', b'strl' + riff_chunk(b'strh', b'vidsXVID' + bytes(48)))
+    file.write(b'RIFF' + struct.pack('<I', size - 8) + b'AVI ' + riff_chunk(b'LIST', b'hdrl' + avih + auds + vids))
+
+
+def amf_string(value):
+    return struct.pack('>H', len(value)) + value.encode()
+
+
+def write_flv(file, size, width, height, duration):
+    meta = {'duration': duration, 'width': width, 'height': height, 'videocodecid': 7, 'audiocodecid': 10}
+    script = b'\2' + amf_string('onMetaData') + b'\x08' + struct.pack('>I', len(meta))
+    for key, value in meta.items():
+        script += amf_string(key) + b'\0' + struct.pack('>d', value)
+    script += b'\0\0\x09'
+    file.write(b'FLV\1\5' + struct.pack('>I', 9) + bytes(4)
+               + b'\x12' + len(script).to_bytes(3, 'big') + bytes(7) + script + struct.pack('>I', len(script) + 11))
+
+
+def asf_object(guid, payload):
+    return guid + struct.pack('<Q', 24 + len(payload)) + payload
+
+
+def write_asf(file, size, width, height, duration):
+    file_properties = asf_object(probe.ASF_FILE_PROPERTIES,
+                                 bytes(40) + struct.pack('<QQQ', int(duration * 1e7), 0, 3000) + bytes(16))
+    bitmap = struct.pack('<IiiHH4s', 40, width, height, 1, 24, b'WMV3') + bytes(20)
+    stream_properties = asf_object(probe.ASF_STREAM_PROPERTIES, probe.ASF_VIDEO_MEDIA + bytes(16 + 8 + 4 + 4 + 2 + 4)
+                                   + struct.pack('<IIBH', width, height, 2, len(bitmap)) + bitmap)
+    objects = file_properties + stream_properties
+    file.write(probe.ASF_HEADER + struct.pack('<QI2x', 30 + len(objects), 2) + objects)
+
+
+def write_rm(file, size, width, height, duration):
+    prop = b'PROP' + struct.pack('>IH9I2H', 50, 0, 0, 0, 0, 0, 0, int(duration * 1000), 0, 0, 0, 2, 0)
+    vido = struct.pack('>I4s4sHH', 34, b'VIDO', b'RV40', width, height) + bytes(18)
+    mime = b'video/x-pn-realvideo'
+    mdpr_body = struct.pack('>HH7I', 0, 0, 0, 0, 0, 0, 0, 0, int(duration * 1000)) + b'\0' \
+        + bytes([len(mime)]) + mime + struct.pack('>I', len(vido)) + vido
+    file.write(b'.RMF' + struct.pack('>IHII', 18, 0, 0, 4) + prop + b'MDPR' + struct.pack('>I', 8 + len(mdpr_body))
+               + mdpr_body)
+
+
+SAMPLE_WRITERS = {'.mp4': write_mp4, '.mkv': write_mkv, '.avi': write_avi, '.flv': write_flv, '.wmv': write_asf,
+                  '.rmvb': write_rm}
+
+
+def make_sample_videos(folder_path, count, size=2 * 1024 ** 3):
+    """Write count sparse sample videos of each container under folder_path, return their paths"""
+    paths = []
+    for index in range(count):
+        for extension, writer in SAMPLE_WRITERS.items():
+            file_path = os.path.join(folder_path, f"SAMPLE-{index:03d}{extension}")
+            with open(file_path, 'wb') as file:
+                writer(file, size, 1920, 1080, 7200.0)
+                file.truncate(size)
+            paths.append(file_path)
+    return paths
+
+
+class LatencyReader(probe.BlockReader):
+    """A BlockReader paying a fixed latency per read, as on a network mount"""
+    latency = 0.0
+
+    def read_block(self, index):
+        time.sleep(self.latency)
+        return super().read_block(index)
+
+
+def bench_probe(args):
+    """Files per second and reads per file of the container probes, local and with a simulated read latency"""
+    LatencyReader.latency = args.latency / 1000
+    with tempfile.TemporaryDirectory() as temp_folder:
+        paths = make_sample_videos(temp_folder, args.count)
+        readers = [('block', probe.BlockReader), ('mmap', probe.MmapReader),
+                   (f'block +{args.latency:g} ms/read', LatencyReader)]
+        for label, reader_class in readers:
+            reads = 0
+            failed = []
+            start = time.perf_counter()
+            for file_path in paths:
+                file_size = os.path.getsize(file_path)
+                with open(file_path, 'rb') as file:
+                    reader = reader_class(file, file_size)
+                    info = probe.probe_reader(file_path, reader)
+                    reads += reader.reads
+                    if reader_class is probe.MmapReader:
+                        reader.close()
+                if info is None or info.width != 1920 or info.codec is None:
+                    failed.append(os.path.basename(file_path))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>20}: {len(paths) / elapsed:>10,.0f} files/s | {reads / len(paths):.1f} reads/file | "
+                  f"{len(failed)} not probed {failed[:3]}")
+
+
+def make_scan(count, files_per_dir=100):
+    """Generate (dirpath, name, size, mtime, target) of a synthetic scan, a third of the files renamed"""
+    dirpaths = [f"/mnt/archive/{2010 + index % 15}/folder-{index:07d}"
+                for index in range(max(1, count // files_per_dir))]
+    for index, name in enumerate(make_release_names(count)):
+        target = name.upper() if index % 3 == 0 else None
+        yield dirpaths[index % len(dirpaths)], name, 600 * 1024 * 1024 + index, 1700000000.0 + index, target
+
+
+def build_parallel_lists(scan):
+    """The old scan state: bare names in parallel lists, plus the full paths to find the files again"""
+    paths, rename_files, renamed_files, sizes = [], [], [], []
+    for dirpath, name, size, mtime, target in scan:
+        paths.append(os.path.join(dirpath, name))
+        sizes.append(size)
+        if target is not None:
+            rename_files.append(name)
+            renamed_files.append(target)
+    return paths, rename_files, renamed_files, sizes
+
+
+def build_planned_changes(scan):
+    return [file_clean.PlannedChange('rename' if target else 'unchanged', dirpath, name, target, size, mtime)
+            for dirpath, name, size, mtime, target in scan]
+
+
+def build_file_records(scan):
+    dirs = records.DirTable()
+    return dirs, [records.FileRecord(dirs.index(dirpath), name, size, mtime, 'rename' if target else 'unchanged',
+                                     target)
+                  for dirpath, name, size, mtime, target in scan]
+
+
+def build_record_table(scan):
+    table = records.RecordTable()
+    for dirpath, name, size, mtime, target in scan:
+        table.add(dirpath, name, size, mtime, 'rename' if target else 'unchanged', target)
+    return table
+
+
+def bench_memory(args):
+    """Memory per entry of the scan state layouts"""
+    layouts = [('parallel lists + paths', build_parallel_lists), ('PlannedChange', build_planned_changes),
+               ('FileRecord', build_file_records), ('RecordTable', build_record_table)]
+    for label, build in layouts:
+        gc.collect()
+        tracemalloc.start()
+        state = build(make_scan(args.count))
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del state
+
+        start = time.perf_counter()
+        state = build(make_scan(args.count))
+        elapsed = time.perf_counter() - start
+        del state
+        print(f"{label:>24}: {current / 1024 / 1024:>8.1f} MB | {current / args.count:>6.0f} bytes/entry | "
+              f"built in {elapsed:.2f} sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks of Movie_AutoScraping.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    filename_parser = subparsers.add_parser('filename', help='Filename normalization throughput')
+    filename_parser.add_argument('-n', '--count', type=int, default=1000000, help='Number of synthetic names')
+    filename_parser.set_defaults(func=bench_filename)
+
+    scrape_parser = subparsers.add_parser('scrape', help='Scraping throughput against mdc_stub.py')
+    scrape_parser.add_argument('-n', '--count', type=int, default=200, help='Number of files')
+    scrape_parser.add_argument('-j', '--concurrency', type=int, default=8, help='MDC processes at the same time')
+    scrape_parser.add_argument('--sleep', type=float, default=0.5, help='Seconds the stub sleeps per file')
+    scrape_parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of the files the stub fails')
+    scrape_parser.add_argument('--timeout', type=float, default=60, help='Seconds before a stub is killed')
+    scrape_parser.add_argument('--cached', action='store_true', help='Scrape the same movies again from the '
+                                                                     'metadata cache filled by the first run')
+    scrape_parser.set_defaults(func=bench_scrape)
+
+    probe_parser = subparsers.add_parser('probe', help='Container probe throughput on sparse sample videos')
+    probe_parser.add_argument('-n', '--count', type=int, default=100, help='Number of samples of each container')
+    probe_parser.add_argument('--latency', type=float, default=5.0, help='Simulated milliseconds per read')
+    probe_parser.set_defaults(func=bench_probe)
+
+    memory_parser = subparsers.add_parser('memory', help='Memory of the scan state layouts')
+    memory_parser.add_argument('-n', '--count', type=int, default=1000000, help='Number of synthetic entries')
+    memory_parser.set_defaults(func=bench_memory)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,21 +1,41 @@
 import os
-import re
 import sys
 import time
 import datetime
 import argparse
-import subprocess
 import configparser
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
+import file_ops
+import journal
+import rename_planner
+from records import RecordTable
 
-def is_valid_file_size(file_path, size_limit):
-    """Check file size limit"""
-    return os.path.getsize(file_path) < size_limit
+SEPARATOR = "==================================================================================================="
+
+# Files under this size are deleted, 500Mb
+SIZE_LIMIT = 500 * 1024 * 1024
+
+# The tree scanned by plan_clean. records is the RecordTable of the files to delete or move to the root,
+# for each folder of records.dirs, parents is the index of its parent (-1 for the root) and children its
+# number of entries. collisions are the rename_planner.Collisions of the moves.
+CleanPlan = namedtuple('CleanPlan', ['folder_path', 'records', 'parents', 'children', 'collisions'])
+
+# What apply_clean did to a root: the operations done, skipped and failed, the folders removed and the
+# id of the journal of the operations
+CleanSummary = namedtuple('CleanSummary', ['folder_path', 'done', 'skipped', 'failed', 'removed_dirs', 'run_id'])
+
+# The folder of each category under an archive root, the [archive] section of MAS_config.ini can
+# give others with the same keys
+CATEGORY_FOLDERS = {
+    'sub': '有字幕',
+    'no_sub': 'no_cc',
+    'hack': '无码破解/no_cc',
+    'hack_sub': '无码破解/有字幕',
+}
 
-def is_video_file(file_name):
-    """Detect the file is video file or not"""
-    video_extensions = ['.mp4', '.avi', '.mkv', '.flv', '.mov', '.wmv', '.rmvb']
-    return any(file_name.lower().endswith(ext) for ext in video_extensions)
 
 def countdown(seconds):
     """Show countdown"""
@@ -29,82 +49,191 @@ def countdown(seconds):
         time.sleep(1)
     print()
 
-def filename_clean(dry_run, folder_path):
-    # 500Mb by default
-    size_limit = 500 * 1024 * 1024
+def plan_clean(folder_path, size_limit=SIZE_LIMIT):
+    """List each folder of the tree once and return its CleanPlan
 
-    unchanged_files = []
-    rename_files = []
-    renamed_files = []
-    deleted_files = []
-
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for file_name in filenames:
-            file_path = os.path.join(dirpath, file_name)
+    The files under size_limit are to delete, the others to move to the root, with a suffix when their
+    name is taken there (see rename_planner.plan_renames). Every entry of a folder counts in its
+    children, so apply_clean knows which folders it empties without listing them again.
+    """
+    folder_path = os.path.normpath(folder_path)
+    records = RecordTable()
+    parents = array('i')
+    children = array('I')
+    # The names left in the root once its small files are deleted
+    root_names = set()
+    move_ops = []
+    pending = [(folder_path, -1)]
+    while pending:
+        dirpath, parent = pending.pop()
+        index = records.dirs.index(dirpath)
+        parents.append(parent)
+        children.append(0)
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            # A folder that can not be listed is never removed
+            children[index] = 1
+            continue
 
-            # Detect size
-            if os.path.isfile(file_path) and is_valid_file_size(file_path, size_limit):
-                if dry_run:
-                    deleted_files.append(f"{file_name}")
+        with entries:
+            for entry in entries:
+                children[index] += 1
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, index))
+                        if index == 0:
+                            root_names.add(entry.name)
+                        continue
+                    if not entry.is_file():
+                        if index == 0:
+                            root_names.add(entry.name)
+                        continue
+                    # The size is cached from the directory listing
+                    entry_stat = entry.stat()
+                except OSError:
+                    # The file has gone between the listing and the stat
+                    continue
+                if entry_stat.st_size < size_limit:
+                    records.add(dirpath, entry.name, entry_stat.st_size, entry_stat.st_mtime, 'delete')
+                elif index == 0:
+                    root_names.add(entry.name)
                 else:
-                    os.remove(file_path)
-                    print("File '" + f"{file_name}" + "' deleted.")
-                continue
+                    move_ops.append(file_ops.FileOp('move', entry.path, os.path.join(folder_path, entry.name),
+                                                    (entry_stat.st_size, entry_stat.st_mtime)))
 
-            if not is_video_file(file_name):
-                continue
+    # Two subfolders may both hold movie.mp4, keep both
+    move_ops, collisions = rename_planner.plan_renames(move_ops, listings={folder_path: root_names})
+    for op in move_ops:
+        records.add(os.path.dirname(op.src), os.path.basename(op.src), *op.check, 'move', op.dst)
+    return CleanPlan(folder_path, records, parents, children, collisions)
 
-    if dry_run:
-        # Determine the log folder and file name
-        log_folder = os.path.join('./', 'log')
-        current_time = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        log_file_path = os.path.join(log_folder, f'{current_time}.log')
 
-        # Create the log folder if it doesn't exist
-        if not os.path.exists(log_folder):
-            os.makedirs(log_folder)
+def write_clean_report(plans):
+    """Print the files the plans delete and move, and write them to the log folder, one part per root"""
+    # Determine the log folder and file name
+    log_folder = os.path.join('./', 'log')
+    current_time = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    log_file_path = os.path.join(log_folder, f'{current_time}.log')
 
-        if rename_files:
-            max_length = max([len(file) for file in rename_files])
-        else:
-            max_length = 0
+    # Create the log folder if it doesn't exist
+    if not os.path.exists(log_folder):
+        os.makedirs(log_folder)
 
-        print("Finished\n\n")
+    print("Finished\n\n")
 
-        # Print results in the desired order:
-        with open(log_file_path, 'a') as log_file:
+    # Print results in the desired order:
+    with open(log_file_path, 'a') as log_file:
+        for plan in plans:
+            records = plan.records
+            print(SEPARATOR)
+            print(f"[{plan.folder_path}]")
+            log_file.write(SEPARATOR + '\n')
+            log_file.write(f"[{plan.folder_path}]\n")
             print("The following file will DELETE:")
             log_file.write("The following file will DELETE:\n")
-            for file_log in deleted_files:
-                print("(DELETE) " + file_log)
-                log_file.write(file_log + '\n')
-        print("===================================================================================================")
+            for record in records.with_action('delete'):
+                print("(DELETE) " + record.name)
+                log_file.write(record.name + '\n')
+            print("The following file will MOVE to the root:")
+            log_file.write("The following file will MOVE to the root:\n")
+            for record in records.with_action('move'):
+                line = f"'{records.path(record)}'\t->\t'{os.path.basename(record.target)}'"
+                print("(MOVE) " + line)
+                log_file.write(line + '\n')
+            for collision in plan.collisions:
+                print(rename_planner.describe(collision))
+                log_file.write(rename_planner.describe(collision) + '\n')
+    print(SEPARATOR)
+    print(f"Report written to '{log_file_path}'.")
+
+
+def apply_clean(plan, workers=8, adaptive=False, run_id=None):
+    """Delete and move the files of the plan, then remove the folders left empty, deepest first
+
+    The folders are not listed again: each file deleted or moved away takes one off the children of
+    its folder, each folder removed one off its parent, a folder whose count reaches zero is empty.
+    The operations are journaled as run_id (see journal.Journal). Return the CleanSummary of the root.
+    """
+    records = plan.records
+    children = array('I', plan.children)
+    ops = []
+    for record in records:
+        if record.action == 'delete':
+            ops.append(file_ops.FileOp('delete', records.path(record), None, (record.size, record.mtime)))
+        else:
+            ops.append(file_ops.FileOp('move', records.path(record), record.target, (record.size, record.mtime)))
+    run_journal = journal.Journal(run_id)
+    try:
+        results = file_ops.run_ops(ops, workers, adaptive=adaptive, journal=run_journal)
+        run_journal.end()
+    finally:
+        run_journal.close()
+    for index, result in enumerate(results):
+        if result.status == 'done':
+            children[records.dir_indexes[index]] -= 1
+
+    # A folder is visited after all its subfolders, the root is kept
+    removed_dirs = 0
+    for index in range(len(children) - 1, 0, -1):
+        if children[index]:
+            continue
+        dir_to_remove = records.dirs.path(index)
+        try:
+            os.rmdir(dir_to_remove)
+        except OSError as e:
+            print(f"Failed to delete directory '{dir_to_remove}': {e}")
+            continue
+        print(f"Deleted empty directory '{dir_to_remove}'.")
+        removed_dirs += 1
+        children[plan.parents[index]] -= 1
+
+    statuses = [result.status for result in results]
+    return CleanSummary(plan.folder_path, statuses.count('done'), statuses.count('skipped'),
+                        statuses.count('failed'), removed_dirs, run_journal.run_id)
+
+
+def archive_folders(config, categories):
+    """Return the folders of the categories under each root of the [archive] section of the config
 
+    The roots are given one per line, e.g. the folder of each archive year.
+    """
+    roots = [root.strip() for root in config.get('archive', 'roots', fallback='').splitlines() if root.strip()]
+    return [os.path.join(root, config.get('archive', category, fallback=CATEGORY_FOLDERS[category]))
+            for root in roots for category in categories]
 
-def move_files_to_root(folder_path):
-    """Move all files in the directory to its root."""
-    for dirpath, _, filenames in os.walk(folder_path):
-        for file_name in filenames:
-            current_file_path = os.path.join(dirpath, file_name)
-            dest_file_path = os.path.join(folder_path, file_name)
 
-            # Check if the file is already in root, continue if so
-            if current_file_path == dest_file_path:
-                continue
+def plan_roots(folders, processes):
+    """Plan the roots at the same time, one process each, and return their CleanPlans in the same order"""
+    with ProcessPoolExecutor(max_workers=max(1, min(processes, len(folders)))) as executor:
+        return list(executor.map(plan_clean, folders))
 
-            # Move the file
-            os.rename(current_file_path, dest_file_path)
-            print(f"Moved '{current_file_path}' to '{dest_file_path}'.")
 
+def apply_roots(plans, workers=8, adaptive=False, processes=4):
+    """Apply the plans at the same time, one process each, and print the summary of all the roots
+
+    The roots share a single pool of processes, the largest plans are started first so a small root
+    never holds a process while the largest one waits. Each process runs up to workers operations.
+    Each root has its own journal, named after the run and the root.
+    """
+    plans = sorted(plans, key=lambda plan: len(plan.records), reverse=True)
+    run_id = journal.new_run_id()
+    with ProcessPoolExecutor(max_workers=max(1, min(processes, len(plans)))) as executor:
+        futures = [executor.submit(apply_clean, plan, workers, adaptive, f"{run_id}_root{index}")
+                   for index, plan in enumerate(plans)]
+        summaries = [future.result() for future in futures]
+
+    print(SEPARATOR)
+    for summary in summaries:
+        print(f"[{summary.folder_path}] {summary.done} done, {summary.skipped} skipped, {summary.failed} failed, "
+              f"{summary.removed_dirs} empty directories deleted, undo with --undo {summary.run_id}")
+    print(f"All roots: {sum(summary.done for summary in summaries)} done, "
+          f"{sum(summary.skipped for summary in summaries)} skipped, "
+          f"{sum(summary.failed for summary in summaries)} failed, "
+          f"{sum(summary.removed_dirs for summary in summaries)} empty directories deleted.")
+    print(SEPARATOR)
+    return summaries
 
-def remove_empty_dirs(folder_path):
-    """Remove all empty directories."""
-    for dirpath, dirnames, _ in os.walk(folder_path, topdown=False):  # topdown=False, so we check from deepest level
-        for dirname in dirnames:
-            dir_to_check = os.path.join(dirpath, dirname)
-            if not os.listdir(dir_to_check):  # Check if directory is empty
-                os.rmdir(dir_to_check)
-                print(f"Deleted empty directory '{dir_to_check}'.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Process video files.')
@@ -114,27 +243,66 @@ if __name__ == "__main__":
     parser.add_argument('-u', '--hack', action='store_true', help='Scrape all movies default with hacked')
     parser.add_argument('-uc', '--hack_sub', action='store_true', help='Scrape all movies default with hacked AND '
                                                                        'subtitle')
+    parser.add_argument('-w', '--workers', type=int, help='Number of file operations run at the same time in each '
+                                                          'root, [general] workers by default')
+    parser.add_argument('-a', '--adaptive', action='store_true', help='Adapt the number of file operations run at '
+                                                                      'the same time to the mount latency')
+    parser.add_argument('--resume', nargs='*', metavar='RUN_ID', help='Run the operations left by the given runs, '
+                                                                      'all the unfinished runs by default, no walk')
+    parser.add_argument('--undo', nargs='+', metavar='RUN_ID', help='Move the files of the given runs back where '
+                                                                    'they were, from their journal')
 
     """ Step 1: Fetch arguments and initialise """
     print("Initialising...")
     args = parser.parse_args()
-    if sum([args.sub, args.no_sub, args.hack, args.hack_sub]) != 1:
-        print("Error: You must provide exactly one of the following options: -c, -no, -u, -uc")
+    if sum([args.sub, args.no_sub, args.hack, args.hack_sub]) > 1:
+        print("Error: You can provide at most one of the following options: -c, -no, -u, -uc")
         sys.exit()
 
     if args.sub:
-        folder_path = "/home/tedwu/2024/有字幕"
+        categories = ['sub']
     elif args.no_sub:
-        folder_path = "/home/tedwu/2024/no_cc"
+        categories = ['no_sub']
     elif args.hack:
-        folder_path = "/home/tedwu/2024/无码破解/no_cc"
+        categories = ['hack']
     elif args.hack_sub:
-        folder_path = "/home/tedwu/2024/无码破解/有字幕"
+        categories = ['hack_sub']
+    else:
+        categories = list(CATEGORY_FOLDERS)
+
+    # Load the configuration from MAS_config.ini
+    config = configparser.ConfigParser()
+    config.read('MAS_config.ini', encoding='utf-8')
+    workers = args.workers or config.getint('general', 'workers', fallback=8)
+    adaptive = args.adaptive or config.getboolean('general', 'adaptive', fallback=True)
+
+    # Replay the journals, the roots are not walked
+    if args.undo:
+        for run_id in args.undo:
+            journal.undo(run_id, workers, adaptive)
+        sys.exit()
+    if args.resume is not None:
+        resume_ids = args.resume or journal.unfinished_runs()
+        if not resume_ids:
+            print("No unfinished run to resume.")
+        for run_id in resume_ids:
+            journal.resume(run_id, workers, adaptive)
+        sys.exit()
+    unfinished = journal.unfinished_runs()
+    if unfinished:
+        print(f"Unfinished runs: {', '.join(unfinished)}, resume them with --resume or undo them with --undo RUN_ID.")
 
     # Check the path existing
-    if not os.path.exists(folder_path):
-        print("The path is not exist, exit.")
+    folder_paths = []
+    for folder_path in archive_folders(config, categories):
+        if os.path.exists(folder_path):
+            folder_paths.append(folder_path)
+        else:
+            print(f"The path '{folder_path}' is not exist, skipped.")
+    if not folder_paths:
+        print("No path to clean, check the roots of [archive] in MAS_config.ini, exit.")
         sys.exit()
+    processes = config.getint('archive', 'processes', fallback=len(folder_paths))
 
     # Check dry run
     dry_run = args.dryrun
@@ -161,7 +329,8 @@ if __name__ == "__main__":
     """ Step 2: Dry run and log """
     # Whatever the dry run option, run dry run first
     print("Generate file report...\n\n")
-    filename_clean(True, folder_path)
+    plans = plan_roots(folder_paths, processes)
+    write_clean_report(plans)
 
     if dry_run:
         sys.exit()
@@ -171,10 +340,6 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("\nOperation interrupted by user, abort.")
             sys.exit()
-        filename_clean(False, folder_path)
-
-        print("\nMoving files to root directory...\n")
-        move_files_to_root(folder_path)
-        print("\nRemoving empty directories...\n")
-        remove_empty_dirs(folder_path)
+        print("\nDeleting small files, moving files to root directory and removing empty directories...\n")
+        apply_roots(plans, workers, adaptive, processes)
     print("Finished")
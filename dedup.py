@@ -0,0 +1,107 @@
+import os
+
+import probe
+import walker
+import normalizer
+import file_clean
+
+
+def canonical_id(file_name):
+    """Return the ID a release is grouped by, prefix + number + CD part, e.g. SSNI-334-CD1"""
+    parts = normalizer.parse(file_name)
+    if parts is None:
+        return None
+    canonical = f"{parts.prefix.upper()}-{int(parts.number)}"
+    if parts.cd:
+        canonical += f"-{parts.cd.upper()}"
+    return canonical
+
+
+def quality(info, file_size):
+    """Return the quality key of a copy, the higher the better: resolution, then bitrate, then size"""
+    if info is None:
+        return 0, 0, file_size
+    return (info.width or 0) * (info.height or 0), info.bitrate or 0, file_size
+
+
+def describe(info):
+    """Return the resolution and bitrate of a copy for the report"""
+    if info is None:
+        return "unknown quality"
+    resolution = f"{info.width}x{info.height}" if info.width else "unknown resolution"
+    bitrate = f"{info.bitrate / 1e6:.1f} Mb/s" if info.bitrate else "unknown bitrate"
+    return f"{resolution}, {bitrate}"
+
+
+def resolve_duplicates(plan, other_folders, probe_cache=None, library=None):
+    """Return the plan with the lower quality copies of each release marked as 'duplicate'
+
+    The video files kept by the plan and the video files under other_folders (e.g. the dest folder)
+    are grouped by canonical_id and variant (see normalizer.infer_mode) in a single pass, a subtitled
+    copy and a hacked copy of the same ID are two releases, not duplicates. Only the files of a group
+    with more than one copy are probed, from their container headers (see probe.probe_file), and all
+    the copies but the best one become 'duplicate' changes, with the path of the kept copy as new_name.
+    With a probe_cache (see probe.ProbeCache), the copies probed by an earlier run are not read again.
+    With a library (a library_index.LibraryIndex), the other folders it has indexed are not walked, the
+    copies under them are looked up by ID and variant.
+    """
+    # (canonical id, variant) -> [(path, size, mtime, planned change or ScanEntry, path once applied)]
+    groups = {}
+    for change in plan:
+        if change.action in ('unchanged', 'rename'):
+            final_name = change.new_name or change.file_name
+            canonical = canonical_id(final_name)
+            if canonical is not None:
+                groups.setdefault((canonical, normalizer.infer_mode(final_name)), []).append(
+                    (os.path.join(change.dirpath, change.file_name), change.size, change.mtime, change,
+                     os.path.join(change.dirpath, final_name)))
+    if library is not None:
+        indexed = tuple(os.path.join(os.path.normpath(folder_path), '') for folder_path in other_folders
+                        if library.indexed(folder_path))
+        for (canonical, variant), copies in groups.items():
+            for owned in library.lookup(canonical):
+                if owned.variant != variant or not owned.path.startswith(indexed):
+                    continue
+                entry = walker.ScanEntry(os.path.dirname(owned.path), os.path.basename(owned.path), owned.path,
+                                         owned.size, owned.mtime, None)
+                copies.append((entry.path, entry.size, entry.mtime, entry, entry.path))
+    for folder_path in other_folders:
+        if library is not None and library.indexed(folder_path):
+            continue
+        for entry in walker.scan_tree(folder_path):
+            if not file_clean.is_video_file(entry.name):
+                continue
+            canonical = canonical_id(entry.name)
+            if canonical is not None:
+                groups.setdefault((canonical, normalizer.infer_mode(entry.name)), []).append(
+                    (entry.path, entry.size, entry.mtime, entry, entry.path))
+
+    duplicates = {}
+    extra = []
+    for copies in groups.values():
+        if len(copies) < 2:
+            continue
+        if probe_cache is not None:
+            infos = {path: probe_cache.probe(path, size, mtime) for path, size, mtime, _, _ in copies}
+        else:
+            infos = {path: probe.probe_file(path, size) for path, size, _, _, _ in copies}
+        # On a tie, the copy already organised in the other folders is kept
+        copies.sort(key=lambda copy: quality(infos[copy[0]], copy[1]) + (isinstance(copy[3], walker.ScanEntry),),
+                    reverse=True)
+        kept_path, _, _, _, kept_final_path = copies[0]
+        for path, _, _, source, _ in copies[1:]:
+            reason = f"{describe(infos[path])}, kept {describe(infos[kept_path])}"
+            if isinstance(source, walker.ScanEntry):
+                extra.append(file_clean.PlannedChange('duplicate', source.dirpath, source.name, kept_final_path,
+                                                      source.size, source.mtime, reason))
+            else:
+                duplicates[path] = (kept_final_path, reason)
+
+    new_plan = []
+    for change in plan:
+        path = os.path.join(change.dirpath, change.file_name)
+        if path in duplicates:
+            kept_path, reason = duplicates[path]
+            change = change._replace(action='duplicate', new_name=kept_path, reason=reason)
+        new_plan.append(change)
+    return tuple(new_plan + extra)
@@ -1,6 +1,36 @@
 import os
-import re
+import stat
 import datetime
+import tempfile
+import itertools
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import file_ops
+import journal
+import pipeline
+import normalizer
+import junk_filter
+import walker
+import rename_planner
+
+# A single planned change, with the stat data it was based on.
+# action is one of 'unchanged', 'rename', 'delete', 'duplicate' (new_name is then the path of the kept copy)
+# or 'owned' (left in place, new_name is then the path of the copy in the library), reason tells why, for the report.
+PlannedChange = namedtuple('PlannedChange', ['action', 'dirpath', 'file_name', 'new_name', 'size', 'mtime', 'reason'],
+                           defaults=(None,))
+
+# Entries classified at a time by plan_entries
+CLASSIFY_BATCH = 256
+
+# Operations run at a time by apply_plan
+OPS_BATCH = 10000
+
+SEPARATOR = "==================================================================================================="
+
+# Subtitle files shipped next to a release, the release is then planned as subtitled
+SUBTITLE_EXTENSIONS = ('.srt', '.ass', '.ssa', '.sub', '.idx', '.vtt', '.sup')
 
 
 def is_valid_file_size(file_path, size_limit):
@@ -12,151 +42,477 @@ def is_video_file(file_name):
     video_extensions = ['.mp4', '.avi', '.mkv', '.flv', '.mov', '.wmv', '.rmvb']
     return any(file_name.lower().endswith(ext) for ext in video_extensions)
 
-def file_clean(dry_run, folder_path, c, no, u, uc):
-    # 500Mb by default
-    size_limit = 500 * 1024 * 1024
-
-    unchanged_files = []
-    rename_files = []
-    renamed_files = []
-    deleted_files = []
-
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for file_name in filenames:
-            file_path = os.path.join(dirpath, file_name)
-
-            # Detect size
-            if os.path.isfile(file_path) and is_valid_file_size(file_path, size_limit):
-                if dry_run:
-                    deleted_files.append(f"{file_name}")
-                else:
-                    os.remove(file_path)
-                    print("File '" + f"{file_name}" + "' deleted.")
-                continue
-
-            if not is_video_file(file_name):
-                continue
-
+def postfix_mode(c, no, u, uc):
+    """Return the postfix mode name of the flags"""
+    if c:
+        return 'c'
+    elif no:
+        return 'no'
+    elif u:
+        return 'u'
+    elif uc:
+        return 'uc'
+    return ''
+
+
+def mode_flags(mode):
+    """Return the (c, no, u, uc) flags of a postfix mode name"""
+    return mode == 'c', mode == 'no', mode == 'u', mode == 'uc'
+
+
+def release_key(file_name):
+    """Return the key matching a release and its subtitle files, its ID or else its name up to the first dot"""
+    parts = normalizer.parse(file_name)
+    if parts is None:
+        return file_name.split('.', 1)[0].lower()
+    return parts.prefix.upper(), int(parts.number)
+
+
+def plan_entries(entries, c, no, u, uc, cache=None, seen_paths=None, junk=None, workers=8, executor=None):
+    """Yield the PlannedChange of each ScanEntry, non-video files that are kept have no change
+
+    Whether a file is junk is decided by junk_filter.classify, from the duration of the video and its
+    name, with the size rule only as a fallback. The entries are classified in batches on a pool of
+    workers threads, as probing a video reads its header, or on the given executor to share one pool
+    between several plans. When a StatCache is given, the cleaned name
+    and the verdict of the entries that are unchanged since the last run are taken from it, only the
+    new or changed entries are worked out again. The path of every entry is added to seen_paths.
+    """
+    if junk is None:
+        junk = junk_filter.JunkFilter()
+    profile = f"{postfix_mode(c, no, u, uc)}|{junk_filter.profile(junk)}"
+
+    def lookup(entry):
+        """Return the entry and its cached decisions, None if it has to be classified"""
+        cached = cache.lookup(entry, profile) if cache is not None else None
+        if cached is not None:
+            # A file can grow or be rewritten without touching its folder mtime (e.g. still downloading),
+            # check its size and mtime again before planning a change of it: all but the kept non-video files
+            if (cached[1] == 'delete' or cached[0] is not None) and entry.dirpath in cache.pruned_dirs:
+                try:
+                    file_stat = os.stat(entry.path)
+                except OSError:
+                    return entry, 'gone'
+                if file_stat.st_size != entry.size or file_stat.st_mtime != entry.mtime:
+                    return entry._replace(size=file_stat.st_size, mtime=file_stat.st_mtime), None
+        return entry, cached
+
+    def decide(entry):
+        verdict, reason = junk_filter.classify(entry, junk, is_video_file(entry.name))
+        if verdict == 'keep' and is_video_file(entry.name):
             # Clean the filename
-            # TODO: Output a txt file with the log
-            cleaned_filename = clean_filename(file_name, c, no, u, uc)
-            if cleaned_filename != file_name:
-                if dry_run:
-                    rename_files.append(file_name)
-                    renamed_files.append(cleaned_filename)
+            cleaned_filename = clean_filename(entry.name, c, no, u, uc)
+        else:
+            cleaned_filename = None
+        return cleaned_filename, verdict, reason
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for batch in batched(entries, CLASSIFY_BATCH):
+            batch = [lookup(entry) for entry in batch]
+            decided = executor.map(decide, [entry for entry, cached in batch if cached is None])
+            for entry, cached in batch:
+                if cached == 'gone':
+                    continue
+                if cached is None:
+                    cached = next(decided)
+                    if cache is not None:
+                        cache.store(entry, profile, *cached)
+                if seen_paths is not None:
+                    seen_paths.add(entry.path)
+
+                cleaned_filename, verdict, reason = cached
+                if verdict == 'delete':
+                    yield PlannedChange('delete', entry.dirpath, entry.name, None, entry.size, entry.mtime, reason)
+                elif cleaned_filename is None:
+                    # Not a video file
+                    continue
+                elif cleaned_filename != entry.name and rename_planner.unsuffixed(entry.name) != cleaned_filename:
+                    # A copy suffixed by rename_planner keeps its name
+                    yield PlannedChange('rename', entry.dirpath, entry.name, cleaned_filename, entry.size,
+                                        entry.mtime, reason)
                 else:
-                    new_file_path = os.path.join(dirpath, cleaned_filename)
-                    os.rename(file_path, new_file_path)
-                    print("Renamed " + file_name + " to " + cleaned_filename)
+                    yield PlannedChange('unchanged', entry.dirpath, entry.name, None, entry.size, entry.mtime,
+                                        reason)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items of the iterable"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_folder(changes, policy='suffix'):
+    """Return the changes of one folder with the collisions of their renames resolved, and the Collisions
+
+    rename_planner.plan_renames checks the targets against the folder and each other: a rename whose
+    target is taken gets the suffixed target, a byte-identical copy of the file at its target (with the
+    'dedup' policy) becomes a 'duplicate' change, deleted. A cycle is left as it is, apply_plan breaks it.
+    """
+    collisions = rename_planner.plan_renames(plan_ops(changes), policy)[1]
+    by_src = dict((collision.src, collision) for collision in collisions if collision.resolution != 'cycle')
+    resolved = []
+    for change in changes:
+        collision = by_src.get(os.path.join(change.dirpath, change.file_name))
+        if collision is not None and change.action == 'rename':
+            if collision.resolution == 'duplicate':
+                change = change._replace(action='duplicate', new_name=collision.dst,
+                                         reason="same content as the file at its target")
             else:
-                if dry_run:
-                    unchanged_files.append(f"{file_name}")
-
-    if dry_run:
-        # Determine the log folder and file name
-        log_folder = os.path.join('./', 'log')
-        current_time = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        log_file_path = os.path.join(log_folder, f'{current_time}.log')
-
+                change = change._replace(new_name=os.path.basename(collision.final))
+        resolved.append(change)
+    return resolved, collisions
+
+
+def resolve_renames(changes, policy='suffix', found=None):
+    """Yield the changes with the collisions of their renames resolved, one folder at a time
+
+    A rename stays in its folder, so only the changes of the same folder can collide. They come one
+    after the other, as the walk lists them, and are held until the folder ends, then resolved by
+    resolve_folder. The Collisions are added to found.
+    """
+    for dirpath, folder_changes in itertools.groupby(changes, lambda change: change.dirpath):
+        folder_changes = list(folder_changes)
+        if any(change.action == 'rename' for change in folder_changes):
+            folder_changes, collisions = resolve_folder(folder_changes, policy)
+            if found is not None:
+                found.extend(collisions)
+        yield from folder_changes
+
+
+def plan_file_clean(folder_path, c, no, u, uc, cache=None, junk=None, workers=8, executor=None, report=None,
+                    skip=(), collisions='suffix', found=None):
+    """Walk the folder once and return the change plan, spooled to disk (see pipeline.PlanSpool)
+
+    The changes stream from the walk to the spool through a bounded queue, and to the ReportWriter
+    report if given, so memory does not grow with the size of the tree. With a StatCache, the decisions
+    of the files and the listing of the folders that are unchanged since the last run are reused (see
+    plan_entries and walker.scan_tree). The folders in skip are not walked. The rename collisions are
+    resolved with the collisions policy before the changes are spooled or reported (see
+    resolve_renames), they are added to found and written to the report.
+    """
+    seen_paths = set()
+    if found is None:
+        found = []
+    if cache is not None:
+        cache.load(folder_path)
+
+    # Walk, classify and resolve in a background thread, spool (and report) the changes as they come
+    plan = pipeline.PlanSpool()
+    entries = walker.scan_tree(folder_path, snapshot=cache, skip=skip)
+    changes = resolve_renames(plan_entries(entries, c, no, u, uc, cache, seen_paths, junk, workers, executor),
+                              collisions, found)
+    for change in pipeline.bounded(changes):
+        plan.append(change)
+        if report is not None:
+            report.write(change)
+    if report is not None:
+        report.write_collisions(found)
+
+    if cache is not None:
+        cache.flush()
+        cache.evict(folder_path, seen_paths)
+
+    return plan
+
+
+def plan_inbox(folder_path, cache=None, junk=None, workers=8, skip=(), collisions='suffix', found=None):
+    """Walk an inbox folder once and return the change plan of each postfix mode ('c', 'no', 'u', 'uc')
+
+    The mode of each video file is inferred from its name (see normalizer.infer_mode), a video with a
+    subtitle file of the same release in its folder is subtitled. That subtitle file is kept, whatever
+    its size. The other files are planned with the 'no' mode, which does not matter for them. The cache,
+    skip, collisions and found are used as in plan_file_clean.
+    """
+    seen_paths = set()
+    if cache is not None:
+        cache.load(folder_path)
+
+    entries = list(walker.scan_tree(folder_path, snapshot=cache, skip=skip))
+    subtitled = set((entry.dirpath, release_key(entry.name)) for entry in entries
+                    if entry.name.lower().endswith(SUBTITLE_EXTENSIONS))
+    releases = set((entry.dirpath, release_key(entry.name)) for entry in entries if is_video_file(entry.name))
+    groups = {'c': [], 'no': [], 'u': [], 'uc': []}
+    for entry in entries:
+        key = (entry.dirpath, release_key(entry.name))
+        if is_video_file(entry.name):
+            mode = normalizer.infer_mode(entry.name, key in subtitled)
+        elif entry.name.lower().endswith(SUBTITLE_EXTENSIONS) and key in releases:
+            # The subtitle file of a release is not junk, it has no change
+            seen_paths.add(entry.path)
+            continue
+        else:
+            mode = 'no'
+        groups[mode].append(entry)
+
+    plans = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for mode, group in groups.items():
+            plans[mode] = pipeline.PlanSpool()
+            plans[mode].extend(resolve_renames(plan_entries(group, *mode_flags(mode), cache, seen_paths, junk,
+                                                            workers, executor), collisions, found))
+
+    if cache is not None:
+        cache.flush()
+        cache.evict(folder_path, seen_paths)
+
+    return plans
+
+
+def plan_files(file_paths, c, no, u, uc, junk=None, collisions='suffix', found=None):
+    """Return the change plan of the given files only, without walking any folder
+
+    The rename collisions are resolved as in plan_file_clean.
+    """
+    entries = []
+    for file_path in file_paths:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            continue
+        if stat.S_ISREG(file_stat.st_mode):
+            entries.append(walker.ScanEntry(os.path.dirname(file_path), os.path.basename(file_path), file_path,
+                                            file_stat.st_size, file_stat.st_mtime, file_stat.st_ino))
+    entries.sort(key=lambda entry: entry.dirpath)
+    return tuple(resolve_renames(plan_entries(entries, c, no, u, uc, junk=junk), collisions, found))
+
+
+class ReportWriter:
+    """The report of a plan, written change by change
+
+    Each change is printed as soon as it is written, and its line spooled to a temporary file of its
+    section (NO CHANGE, RENAME, DELETE, DUPLICATE, OWNED). close() puts the sections together in the log file,
+    with the renames aligned on the longest name, so memory does not grow with the size of the plan.
+    The rename collisions of the plan (see resolve_renames) follow the renames. Safe to write from
+    several threads.
+    """
+
+    def __init__(self, log_folder=os.path.join('./', 'log')):
         # Create the log folder if it doesn't exist
         if not os.path.exists(log_folder):
             os.makedirs(log_folder)
-
-        if rename_files:
-            max_length = max([len(file) for file in rename_files])
-        else:
-            max_length = 0
-
-        print("Finished\n\n")
-
-        # Print results in the desired order:
-        with open(log_file_path, 'a') as log_file:
-            print("The following file has NO CHANGE:")
-            log_file.write("The following file has NO CHANGE:\n")
-
-            for file_log in unchanged_files:
-                print("(UNCHANGE) " + file_log)
-                log_file.write(file_log + '\n')
-            print("===================================================================================================")
-            log_file.write(
-                "===================================================================================================\n")
-
-            print("The following file will RENAME:")
-            log_file.write("The following file will RENAME:\n")
-
-            for i in range(len(rename_files)):
-                line = f"'{rename_files[i].ljust(max_length)}'\t->\t'{renamed_files[i]}'"
-                print("(RENAME) " + line)
-                log_file.write(line + '\n')
-            print("===================================================================================================")
-            log_file.write(
-                "===================================================================================================\n")
-
-            print("The following file will DELETE:")
-            log_file.write("The following file will DELETE:\n")
-            for file_log in deleted_files:
-                print("(DELETE) " + file_log)
-                log_file.write(file_log + '\n')
-        print("===================================================================================================")
+        current_time = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        self.log_file_path = os.path.join(log_folder, f'{current_time}.log')
+        self.sections = {action: tempfile.TemporaryFile('w+', encoding='utf-8', dir=log_folder)
+                         for action in ('unchanged', 'rename', 'delete', 'duplicate', 'owned')}
+        self.counts = dict.fromkeys(self.sections, 0)
+        self.collisions = []
+        self.max_length = 0
+        self.lock = threading.Lock()
+
+    def write(self, change):
+        reason = f" ({change.reason})" if change.reason else ""
+        with self.lock:
+            self.counts[change.action] += 1
+            spool = self.sections[change.action]
+            if change.action == 'unchanged':
+                print(f"(UNCHANGE) {change.file_name}{reason}")
+                spool.write(f"{change.file_name}{reason}\n")
+            elif change.action == 'rename':
+                print(f"(RENAME) '{change.file_name}'\t->\t'{change.new_name}'{reason}")
+                self.max_length = max(self.max_length, len(change.file_name))
+                spool.write(f"{change.file_name}\0{change.new_name}\0{reason}\n")
+            elif change.action == 'delete':
+                print(f"(DELETE) {change.file_name}{reason}")
+                spool.write(f"{change.file_name}{reason}\n")
+            elif change.action == 'duplicate':
+                line = f"'{os.path.join(change.dirpath, change.file_name)}'\t->\tkept '{change.new_name}'{reason}"
+                print(f"(DUPLICATE) {line}")
+                spool.write(line + '\n')
+            else:
+                line = f"'{os.path.join(change.dirpath, change.file_name)}'{reason}"
+                print(f"(OWNED) {line}")
+                spool.write(line + '\n')
+
+    def write_all(self, plan):
+        for change in plan:
+            self.write(change)
+
+    def write_collisions(self, collisions):
+        with self.lock:
+            for collision in collisions:
+                line = rename_planner.describe(collision)
+                print(line)
+                self.collisions.append(line)
+
+    def close(self):
+        """Write the log file from the section spools"""
+        headers = [('unchanged', "The following file has NO CHANGE:"),
+                   ('rename', "The following file will RENAME:"),
+                   ('delete', "The following file will DELETE:"),
+                   ('duplicate', "The following file is a DUPLICATE of a better copy and will DELETE:"),
+                   ('owned', "The following file is already OWNED in the library and is left in place:")]
+        with open(self.log_file_path, 'a') as log_file:
+            for index, (action, header) in enumerate(headers):
+                spool = self.sections[action]
+                if action in ('duplicate', 'owned') and not self.counts[action]:
+                    continue
+                if index:
+                    log_file.write(SEPARATOR + '\n')
+                log_file.write(header + '\n')
+                spool.seek(0)
+                for line in spool:
+                    if action == 'rename':
+                        file_name, new_name, reason = line.rstrip('\n').split('\0')
+                        line = f"'{file_name.ljust(self.max_length)}'\t->\t'{new_name}'{reason}\n"
+                    log_file.write(line)
+                if action == 'rename' and self.collisions:
+                    log_file.write(SEPARATOR + '\n')
+                    log_file.write("The following RENAME target is TAKEN:\n")
+                    log_file.writelines(line + '\n' for line in self.collisions)
+        for spool in self.sections.values():
+            spool.close()
+
+        print(SEPARATOR)
+        print(f"{self.counts['unchanged']} NO CHANGE, {self.counts['rename']} RENAME, {self.counts['delete']} DELETE, "
+              f"{self.counts['duplicate']} DUPLICATE, {self.counts['owned']} OWNED, "
+              f"{len(self.collisions)} COLLISION. Report written to '{self.log_file_path}'.")
+        print(SEPARATOR)
+
+
+def write_report(plan, collisions=()):
+    """Print the plan and its rename collisions and write them to the log folder"""
+    report = ReportWriter()
+    report.write_all(plan)
+    report.write_collisions(collisions)
+    report.close()
+
+
+def plan_ops(plan):
+    """Yield the file_ops.FileOps of the changes of the plan that touch a file, in the plan order"""
+    for change in plan:
+        file_path = os.path.join(change.dirpath, change.file_name)
+        if change.action in ('delete', 'duplicate'):
+            yield file_ops.FileOp('delete', file_path, None, (change.size, change.mtime))
+        elif change.action == 'rename':
+            new_file_path = os.path.join(change.dirpath, change.new_name)
+            yield file_ops.FileOp('rename', file_path, new_file_path, (change.size, change.mtime))
+
+
+def apply_plan(plan, workers=8, adaptive=False, retries=3, journal=None):
+    """Run exactly the changes in the plan, only re-stat the entries it touches, return the counts of
+    'done', 'skipped' and 'failed' operations
+
+    The plan is read three times and never held in memory, the operations run OPS_BATCH at a time by
+    file_ops.run_ops. The first pass runs the deletions, their names are free for the renames, and counts
+    the renames to each target. The second finds the renames whose source is the target of another, the
+    chains and cycles. The third runs the renames, the chains and cycles and any target still taken twice
+    held back to a last batch ordered by rename_planner.plan_renames. The collisions are resolved when the
+    plan is made (see resolve_renames). An entry that has gone or changed since the plan was made is
+    skipped. With a journal (a journal.Journal), each batch is written to it before it runs, so a run
+    that dies partway through can be resumed without a new walk.
+    """
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    batches = [0]
+
+    def run(ops):
+        batches[0] += 1
+        for result in file_ops.run_ops(ops, workers, adaptive=adaptive, retries=retries, journal=journal):
+            counts[result.status] += 1
+
+    # Rename target -> number of renames to it
+    targets = {}
+
+    def deletions():
+        for change in plan:
+            if change.action == 'rename':
+                target = os.path.join(change.dirpath, change.new_name)
+                targets[target] = targets.get(target, 0) + 1
+            elif change.action in ('delete', 'duplicate'):
+                yield change
+
+    for batch in batched(plan_ops(deletions()), OPS_BATCH):
+        run(batch)
+
+    # The renames that free the target of another one, the links of a chain or a cycle
+    freed = set()
+    for op in plan_ops(change for change in plan if change.action == 'rename'):
+        if op.src in targets:
+            freed.add(op.src)
+
+    held = []
+    renames = plan_ops(change for change in plan if change.action == 'rename')
+    for batch in batched(renames, OPS_BATCH):
+        ready = []
+        for op in batch:
+            if op.src in freed or op.dst in freed or targets[op.dst] > 1:
+                held.append(op)
+            else:
+                ready.append(op)
+        if ready:
+            run(ready)
+    if held:
+        ops, found = rename_planner.plan_renames(held)
+        for collision in found:
+            print(rename_planner.describe(collision))
+        run(ops)
+
+    if batches[0] > 1:
+        print(f"Applied the plan: {counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed.")
+    return counts
+
+
+def video_files_after(plan):
+    """Return the paths of the video files of the plan once it has been applied
+
+    A renamed file is at its target if the file there has the size and mtime it was planned with, at its
+    old path if it is still there (skipped or failed), and left out if it is at neither.
+    """
+    paths = []
+    for change in plan:
+        file_path = os.path.join(change.dirpath, change.file_name)
+        if change.action == 'unchanged':
+            paths.append(file_path)
+        elif change.action == 'rename':
+            new_file_path = os.path.join(change.dirpath, change.new_name)
+            try:
+                file_stat = os.stat(new_file_path)
+                moved = (file_stat.st_size, file_stat.st_mtime) == (change.size, change.mtime)
+            except OSError:
+                moved = False
+            if moved:
+                paths.append(new_file_path)
+            elif os.path.lexists(file_path):
+                paths.append(file_path)
+    return paths
+
+
+def video_names(plan):
+    """Yield the (path, cleaned name) of the video files of the plan, whether it is applied or not"""
+    for change in plan:
+        if change.action == 'unchanged':
+            yield os.path.join(change.dirpath, change.file_name), change.file_name
+        elif change.action == 'rename':
+            yield os.path.join(change.dirpath, change.file_name), change.new_name
+
+
+def file_clean(dry_run, folder_path, c, no, u, uc, workers=8):
+    """Plan the changes, then report them (dry run) or apply them"""
+    collisions = []
+    plan = plan_file_clean(folder_path, c, no, u, uc, found=collisions)
+    if dry_run:
+        write_report(plan, collisions)
+    else:
+        run_journal = journal.Journal()
+        try:
+            apply_plan(plan, workers, journal=run_journal)
+            run_journal.end()
+        finally:
+            run_journal.close()
+    return plan
 
 
 def clean_filename(filename, c, no, u, uc):
-    """Clean the file name"""
-
-    # Delete number prefix, e.g., 232GANA-334-C.mp4 -> GANA-334-C.mp4
-    filename = re.sub(r"^\d+", "", filename)
-
-    # Delete [], e.g., [233.com]SSNI-334-C.mp4 -> SSNI-334-C.mp4
-    filename = re.sub(r"^\[.*?\]", "", filename)
-
-    # Capture the CD number if present, e.g., SSNI-888-CD2.mp4 -> CD2
-    cd_number_match = re.search(r"(cd\d+)", filename, re.IGNORECASE)
-    cd_number = cd_number_match.group(1) if cd_number_match else ''
-
-    # Capture the CD number if present, e.g., SSNI-888-CD2.mp4 -> CD2
-    cd_number_match = re.search(r"(cd\d+)", filename, re.IGNORECASE)
-    cd_number = cd_number_match.group(1) if cd_number_match else ''
-
-    # Add "-", e.g., SSNI334C.mp4 -> SSNI-334-C.mp4
-    if re.match(r"[A-Za-z]+\d+C\.", filename):
-        filename = re.sub(r"([A-Za-z]+)(\d+)(C\.)", r"\1-\2-\3", filename)
-    elif re.match(r"[A-Za-z]+\d+-C\.", filename):
-        filename = re.sub(r"([A-Za-z]+)(\d+)-C\.", r"\1-\2-C.", filename)
-    elif re.match(r"[A-Za-z]+\d\.", filename):
-        filename = re.sub(r"([A-Za-z]+)(\d+)", r"\1-\2", filename)
-
-    # Delete all characters after the number part
-    filename = re.sub(r'(\d+).*?(?=\.[^.]+$)', r'\1', filename)
-
-    # Append the CD number if present
-    if cd_number:
-        filename_base, filename_extension = os.path.splitext(filename)
-        filename = f"{filename_base}-{cd_number}{filename_extension}"
-
-    # Append the CD number if present
-    if cd_number:
-        filename_base, filename_extension = os.path.splitext(filename)
-        filename = f"{filename_base}-{cd_number}{filename_extension}"
-
-    if c:
-        # Add "-C" if it is not exist, e.g., SSNI-334.mp4 -> SSNI-334-C.mp4
-        if not re.search(r"-c\.(?=[^.]+$)", filename, re.I):  # re.I 是大小写不敏感标志
-            filename = re.sub(r"\.(?=[^.]+$)", "-C.", filename)
-    elif no:
-        return filename
-    elif u:
-        # Delete all characters after -u but before .extension
-        # filename = re.sub(r"(-u).*\.", r"\1.", filename, re.I)
-        # Change all -u tag to -hack tag
-        # filename = re.sub(r"-u", "-hack", filename, re.I)
-
-        # Add -hack tag
-        filename = re.sub(r"\.(?=[^.]+$)", "-hack.", filename)
-    elif uc:
-        # Change the possible pattern (-u-c, -c-u, -uc, -cu) to -hack-c
-        # filename = re.sub(r"-(u-c|c-u|uc|cu|hack-c|hackc)(?=\.[^.]+$)", "-hack-c", filename)
-
-        # Add -hack-c tag
-        filename = re.sub(r"\.(?=[^.]+$)", "-hack-c.", filename)
-
-    return filename
\ No newline at end of file
+    """Clean the file name, see normalizer.clean_many for the rules"""
+    return normalizer.normalize(filename, postfix_mode(c, no, u, uc))
@@ -0,0 +1,252 @@
+import os
+import time
+import errno
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import transfer
+
+# A file operation to apply. action is 'delete', 'rename' or 'move', dst is None for 'delete'.
+# check is the (size, mtime) the operation was planned on, or None to apply it without checking.
+FileOp = namedtuple('FileOp', ['action', 'src', 'dst', 'check'])
+
+# The outcome of a FileOp, status is 'done', 'skipped' or 'failed'
+OpResult = namedtuple('OpResult', ['op', 'status', 'error', 'elapsed', 'attempts'])
+
+# The errors of a remote mount that are worth another attempt, e.g. an rclone rate limit
+TRANSIENT_ERRNOS = {errno.EIO, errno.ETIMEDOUT, errno.EAGAIN, errno.EBUSY}
+
+
+class AdaptiveLimit:
+    """AIMD limit of the operations in flight
+
+    The limit grows by one after every window of operations whose median latency stays within
+    latency_factor times the best median seen so far, and is cut by decrease_factor when an operation
+    fails or the median latency spikes, at most once per window.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, window=10, latency_factor=2.0, decrease_factor=0.7):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window_size = window
+        self.latency_factor = latency_factor
+        self.decrease_factor = decrease_factor
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.window = []
+        self.baseline = None
+        self.decreased_in_window = False
+        self.lowest = self.limit
+        self.highest = self.limit
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, failed=False):
+        with self.condition:
+            self.in_flight -= 1
+            if failed:
+                self._decrease()
+            else:
+                self.window.append(latency)
+                if len(self.window) >= self.window_size:
+                    median = sorted(self.window)[len(self.window) // 2]
+                    if self.baseline is None or median < self.baseline:
+                        self.baseline = median
+                    if median > self.baseline * self.latency_factor:
+                        self._decrease()
+                    elif not self.decreased_in_window:
+                        self.limit = min(self.maximum, self.limit + 1)
+                        self.highest = max(self.highest, self.limit)
+                    self.window = []
+                    self.decreased_in_window = False
+            self.condition.notify_all()
+
+    def _decrease(self):
+        if not self.decreased_in_window:
+            self.limit = max(self.minimum, int(self.limit * self.decrease_factor))
+            self.lowest = min(self.lowest, self.limit)
+            self.decreased_in_window = True
+
+
+def group_ops(ops):
+    """Split the operations into chains that must run in order
+
+    Two operations that touch the same path (a rename chain A -> B -> C, or two files moved to the
+    same name) end up in the same chain, in their original order. Different chains share no path and
+    can run in parallel.
+    """
+    parent = list(range(len(ops)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for i, op in enumerate(ops):
+        for path in (op.src, op.dst):
+            if path is None:
+                continue
+            j = owner.setdefault(path, i)
+            if j != i:
+                parent[find(i)] = find(j)
+
+    chains = {}
+    for i in range(len(ops)):
+        chains.setdefault(find(i), []).append(i)
+    return list(chains.values())
+
+
+def apply_op(op):
+    """Apply one operation, return its (status, error)"""
+    if op.check is not None:
+        # Skip the entry if it has gone or changed since the plan was made
+        try:
+            file_stat = os.stat(op.src)
+        except FileNotFoundError:
+            return 'skipped', 'no longer exists'
+        if (file_stat.st_size, file_stat.st_mtime) != op.check:
+            return 'skipped', 'changed since the report'
+
+    if op.action == 'delete':
+        os.remove(op.src)
+    else:
+        # os.rename replaces the target silently, never overwrite a file that appeared after the plan
+        if os.path.lexists(op.dst):
+            return 'skipped', 'target already exists'
+        try:
+            os.rename(op.src, op.dst)
+        except OSError as e:
+            # A move to another mount is a verified copy then a delete
+            if op.action != 'move' or e.errno != errno.EXDEV:
+                raise
+            result = transfer.move_file(op.src, op.dst)
+            if result.status != 'done':
+                return result.status, result.error
+    return 'done', None
+
+
+def describe_op(op):
+    """Return the log line of a finished operation"""
+    if op.action == 'delete':
+        return f"File '{os.path.basename(op.src)}' deleted."
+    elif op.action == 'rename':
+        return f"Renamed {os.path.basename(op.src)} to {os.path.basename(op.dst)}"
+    return f"Moved '{op.src}' to '{op.dst}'."
+
+
+def run_ops(ops, workers=8, progress_interval=2.0, adaptive=False, retries=3, retry_delay=0.5, journal=None,
+            seqs=None):
+    """Apply the operations with a bounded thread pool and return one OpResult per operation
+
+    The operations of a chain (see group_ops) run one after another in a single worker, the chains
+    run in parallel. A failed operation is recorded and the batch goes on.
+
+    With adaptive=True, the number of operations in flight is driven by an AdaptiveLimit between 1
+    and workers instead of being fixed to workers. An operation failing with a transient error
+    (TRANSIENT_ERRNOS) is tried again up to retries times, after an exponential delay with jitter.
+
+    With a journal (a journal.Journal), the operations are written to it before any of them runs and
+    each outcome once it has run. seqs gives their sequence numbers when they are in the journal already.
+    """
+    ops = list(ops)
+    results = [None] * len(ops)
+    if not ops:
+        return results
+    if journal is not None and seqs is None:
+        first = journal.plan(ops)
+        seqs = range(first, first + len(ops))
+
+    workers = max(1, workers)
+    limit = AdaptiveLimit(initial=min(4, workers), maximum=workers) if adaptive else None
+    lock = threading.Lock()
+    start = time.perf_counter()
+    state = {'finished': 0, 'last_progress': start}
+
+    def attempt(op, attempts):
+        """Apply the operation once under the limit, return (status, error, elapsed)"""
+        if limit is not None:
+            limit.acquire()
+        op_start = time.perf_counter()
+        try:
+            status, error = apply_op(op)
+        except OSError as e:
+            status, error = 'failed', e
+        # The previous attempt may have timed out but still happened on the remote
+        if (attempts > 1 and status != 'done' and not os.path.lexists(op.src)
+                and (op.dst is None or os.path.lexists(op.dst))):
+            status, error = 'done', None
+        elapsed = time.perf_counter() - op_start
+        if limit is not None:
+            limit.release(elapsed, failed=status == 'failed')
+        return status, error, elapsed
+
+    def run_chain(chain):
+        for i in chain:
+            op = ops[i]
+            attempts = 1
+            status, error, elapsed = attempt(op, attempts)
+            while (status == 'failed' and attempts <= retries
+                   and getattr(error, 'errno', None) in TRANSIENT_ERRNOS):
+                time.sleep(retry_delay * 2 ** (attempts - 1) * random.uniform(0.5, 1.5))
+                attempts += 1
+                status, error, elapsed = attempt(op, attempts)
+            results[i] = OpResult(op, status, error, elapsed, attempts)
+            if journal is not None:
+                journal.record(seqs[i], status)
+
+            with lock:
+                state['finished'] += 1
+                if status == 'done':
+                    print(describe_op(op))
+                elif status == 'skipped':
+                    print(f"Skipped '{op.src}': {error}.")
+                else:
+                    print(f"Failed '{op.src}': {error}")
+                now = time.perf_counter()
+                if now - state['last_progress'] >= progress_interval:
+                    state['last_progress'] = now
+                    concurrency = f", concurrency {limit.limit}" if limit is not None else ''
+                    print(f"Progress: {state['finished']}/{len(ops)} operations, "
+                          f"{state['finished'] / (now - start):.1f} ops/s{concurrency}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Longest chains first, so they do not end up last on a single worker
+        for future in [executor.submit(run_chain, chain)
+                       for chain in sorted(group_ops(ops), key=len, reverse=True)]:
+            future.result()
+
+    print_summary(results, time.perf_counter() - start, limit)
+    return results
+
+
+def percentile(values, fraction):
+    """Return the value at the fraction (0 to 1) of the sorted values"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def print_summary(results, elapsed, limit=None):
+    """Print the count of done, skipped and failed operations, the latency and the failures"""
+    done = sum(1 for result in results if result.status == 'done')
+    skipped = sum(1 for result in results if result.status == 'skipped')
+    failed = [result for result in results if result.status == 'failed']
+    retried = sum(result.attempts - 1 for result in results)
+    latencies = [result.elapsed for result in results]
+    print("===================================================================================================")
+    print(f"Applied {done} operations in {elapsed:.1f} sec ({len(results) / max(elapsed, 1e-9):.1f} ops/s), "
+          f"{skipped} skipped, {len(failed)} failed.")
+    print(f"Latency p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p99 {percentile(latencies, 0.99) * 1000:.0f} ms, "
+          f"{retried} retries.")
+    if limit is not None:
+        print(f"Concurrency: {limit.limit} at the end, between {limit.lowest} and {limit.highest} during the run.")
+    for result in failed:
+        print(f"(FAILED) '{result.op.src}': {result.error}")
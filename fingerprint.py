@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import hashlib
+
+import walker
+import file_clean
+
+# Size of the head, middle and tail chunks hashed by partial_hash
+CHUNK_SIZE = 64 * 1024
+
+# Read size of full_hash
+READ_SIZE = 1024 * 1024
+
+
+def partial_hash(file_path, file_size):
+    """Return the hash of the size and of the head, middle and tail chunks of a file
+
+    Three small reads whatever the file size, two files with a different partial hash are different.
+    """
+    digest = hashlib.blake2b(str(file_size).encode(), digest_size=16)
+    with open(file_path, 'rb') as file:
+        for offset in sorted({0, max(0, file_size // 2 - CHUNK_SIZE // 2), max(0, file_size - CHUNK_SIZE)}):
+            file.seek(offset)
+            digest.update(file.read(CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def full_hash(file_path):
+    """Return the hash of the whole content of a file"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FingerprintIndex:
+    """On-disk index of the partial and full hashes of the files, keyed by path
+
+    A row is only trusted while the (size, mtime) of the file is the same as when it was hashed, so a
+    file is only read again once it has changed. The full hash is only computed on demand, for the
+    files whose partial hash collides with another file.
+    """
+
+    def __init__(self, db_path=os.path.join('./', 'log', 'fingerprints.db')):
+        db_folder = os.path.dirname(db_path)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints ("
+                                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, partial TEXT, full TEXT)")
+        # path -> [size, mtime, partial, full]
+        self.entries = {path: list(row) for path, *row in self.connection.execute("SELECT * FROM fingerprints")}
+        self.changed = set()
+        self.hashed = 0
+        self.full_hashed = 0
+
+    def row(self, file_path, file_size, mtime):
+        row = self.entries.get(file_path)
+        if row is None or row[:2] != [file_size, mtime]:
+            row = self.entries[file_path] = [file_size, mtime, None, None]
+        return row
+
+    def partial(self, file_path, file_size, mtime):
+        """Return the partial hash of a file, from the index if it has not changed"""
+        row = self.row(file_path, file_size, mtime)
+        if row[2] is None:
+            row[2] = partial_hash(file_path, file_size)
+            self.changed.add(file_path)
+            self.hashed += 1
+        return row[2]
+
+    def full(self, file_path, file_size, mtime):
+        """Return the full hash of a file, from the index if it has not changed"""
+        row = self.row(file_path, file_size, mtime)
+        if row[3] is None:
+            row[3] = full_hash(file_path)
+            self.changed.add(file_path)
+            self.full_hashed += 1
+        return row[3]
+
+    def flush(self):
+        self.connection.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)",
+                                    [(path, *self.entries[path]) for path in self.changed])
+        self.changed = set()
+        self.connection.commit()
+
+    def evict(self, folder_paths, seen_paths):
+        """Delete the rows under the folders whose path was not seen by the last scan"""
+        prefixes = tuple(folder_path.rstrip(os.sep) + os.sep for folder_path in folder_paths)
+        gone = [(path,) for path in self.entries if path.startswith(prefixes) and path not in seen_paths]
+        for (path,) in gone:
+            del self.entries[path]
+            self.changed.discard(path)
+        self.connection.executemany("DELETE FROM fingerprints WHERE path = ?", gone)
+        self.connection.commit()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def identical_groups(files, index):
+    """Return the groups of byte-identical files among the (path, size, mtime) files
+
+    Files are grouped by size first, only the files sharing their size are partially hashed, and only
+    the files sharing their partial hash are fully hashed.
+    """
+    by_size = {}
+    for file in files:
+        by_size.setdefault(file[1], []).append(file)
+
+    groups = []
+    for same_size in by_size.values():
+        if len(same_size) < 2:
+            continue
+        by_partial = {}
+        for file in same_size:
+            try:
+                by_partial.setdefault(index.partial(*file), []).append(file)
+            except OSError:
+                continue
+        for same_partial in by_partial.values():
+            if len(same_partial) < 2:
+                continue
+            by_full = {}
+            for file in same_partial:
+                try:
+                    by_full.setdefault(index.full(*file), []).append(file)
+                except OSError:
+                    continue
+            groups.extend(group for group in by_full.values() if len(group) > 1)
+    return groups
+
+
+def resolve_identical(plan, plan_rank, folders, index):
+    """Return the plan with the files that have a byte-identical copy to keep marked as 'duplicate'
+
+    folders are the other (folder path, rank) to look for copies in, e.g. the source and dest folders of
+    all the sections, and the files of the plan have plan_rank. In each group of identical files, the copy
+    of the lowest rank is kept, a file of the plan on a tie, and the other copies of the plan become
+    'duplicate' changes with the path of the kept copy as new_name. Only the video files of the folders
+    whose size is the size of a video file of the plan are hashed.
+    """
+    # path -> (rank, planned change or None)
+    copies = {}
+    files = []
+    for change in plan:
+        if change.action in ('unchanged', 'rename') and file_clean.is_video_file(change.file_name):
+            path = os.path.join(change.dirpath, change.file_name)
+            copies[path] = (plan_rank, change)
+            files.append((path, change.size, change.mtime))
+    sizes = set(file[1] for file in files)
+
+    seen_paths = set()
+    for folder_path, rank in folders:
+        for entry in walker.scan_tree(folder_path):
+            seen_paths.add(entry.path)
+            if entry.path in copies or entry.size not in sizes or not file_clean.is_video_file(entry.name):
+                continue
+            copies[entry.path] = (rank, None)
+            files.append((entry.path, entry.size, entry.mtime))
+
+    duplicates = {}
+    for group in identical_groups(files, index):
+        group.sort(key=lambda file: copies[file[0]][0])
+        kept_path = group[0][0]
+        kept_change = copies[kept_path][1]
+        if kept_change is not None and kept_change.new_name:
+            kept_path = os.path.join(kept_change.dirpath, kept_change.new_name)
+        for path, _, _ in group[1:]:
+            if copies[path][1] is not None:
+                duplicates[path] = kept_path
+
+    index.evict([folder_path for folder_path, _ in folders], seen_paths | set(copies))
+    index.flush()
+
+    new_plan = []
+    for change in plan:
+        kept_path = duplicates.get(os.path.join(change.dirpath, change.file_name))
+        if kept_path is not None:
+            change = change._replace(action='duplicate', new_name=kept_path, reason="identical content")
+        new_plan.append(change)
+    return tuple(new_plan)
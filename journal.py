@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import datetime
+import threading
+from collections import namedtuple
+
+import file_ops
+
+JOURNAL_FOLDER = os.path.join('./', 'log', 'journal')
+JOURNAL_SUFFIX = '.journal'
+
+# The outcomes are synced to disk every SYNC_BATCH records or SYNC_INTERVAL seconds, whichever comes first
+SYNC_BATCH = 256
+SYNC_INTERVAL = 1.0
+
+# A journal read back by load: the FileOps planned (sequence number -> FileOp), the status of those
+# that have run (sequence number -> 'done', 'skipped' or 'failed') and whether the run got to its end
+JournalState = namedtuple('JournalState', ['run_id', 'ops', 'statuses', 'finished'])
+
+
+def new_run_id(folder=JOURNAL_FOLDER):
+    """Return a run id not used yet in the folder, the time of the run like the report names
+
+    An id that starts the id of a journal already there (e.g. the roots of a clean run, <run id>_root0)
+    is taken too.
+    """
+    taken = run_ids(folder)
+    run_id = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    number = 1
+    candidate = run_id
+    while any(name == candidate or name.startswith(candidate + '_') for name in taken):
+        candidate = f"{run_id}_{number}"
+        number += 1
+    return candidate
+
+
+class Journal:
+    """Append-only journal of the file operations of a run, one JSON line per record
+
+    The operations are written as planned and synced before any of them runs, one batch at a time
+    (see file_clean.apply_plan), so a run that dies partway through leaves the list of what it was
+    doing. Each outcome is written once its operation has run, and synced in batches (SYNC_BATCH,
+    SYNC_INTERVAL) rather than one fsync per operation. An outcome lost in a crash is harmless: resume
+    finds the operation already applied. end() marks the run as finished. Safe to write from several
+    threads.
+    """
+
+    def __init__(self, run_id=None, folder=JOURNAL_FOLDER, resume=False):
+        """Start the journal of a new run, as run_id or a new_run_id, or go on with the journal of run_id
+
+        A new run never writes to the journal of another one, a run_id already journaled raises
+        FileExistsError unless resume is set.
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        if resume:
+            self.run_id = run_id
+            self.path = os.path.join(folder, run_id + JOURNAL_SUFFIX)
+            # A resumed run goes on with the sequence numbers of its journal
+            self.count = len(load(run_id, folder).ops)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self.file = None
+            while self.file is None:
+                self.run_id = run_id or new_run_id(folder)
+                self.path = os.path.join(folder, self.run_id + JOURNAL_SUFFIX)
+                try:
+                    self.file = open(self.path, 'x', encoding='utf-8')
+                except FileExistsError:
+                    # Another run took the new id first, pick another one
+                    if run_id is not None:
+                        raise FileExistsError(f"Run {run_id} is journaled already, resume it with --resume {run_id}")
+            self.count = 0
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def plan(self, ops):
+        """Write the operations about to run and sync them, return the sequence number of the first one"""
+        with self.lock:
+            first = self.count
+            for op in ops:
+                self._write({'seq': self.count, 'action': op.action, 'src': op.src, 'dst': op.dst,
+                             'check': op.check})
+                self.count += 1
+            self._sync()
+        return first
+
+    def record(self, seq, status):
+        """Write the status of an operation that has run"""
+        with self.lock:
+            self._write({'seq': seq, 'status': status})
+            self.unsynced += 1
+            if self.unsynced >= SYNC_BATCH or time.monotonic() - self.synced_at >= SYNC_INTERVAL:
+                self._sync()
+
+    def end(self):
+        """Mark the run as finished, resume leaves it alone"""
+        with self.lock:
+            self._write({'end': True})
+            self._sync()
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.file.close()
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+
+def load(run_id, folder=JOURNAL_FOLDER):
+    """Read the journal of a run back into a JournalState"""
+    ops = {}
+    statuses = {}
+    ended = False
+    with open(os.path.join(folder, run_id + JOURNAL_SUFFIX), encoding='utf-8') as journal_file:
+        for line in journal_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of a run that died while writing it
+                continue
+            if record.get('end'):
+                ended = True
+                continue
+            # The run went on after an earlier end, only the end of its last segment counts
+            ended = False
+            if 'status' in record:
+                statuses[record['seq']] = record['status']
+            else:
+                check = tuple(record['check']) if record['check'] is not None else None
+                ops[record['seq']] = file_ops.FileOp(record['action'], record['src'], record['dst'], check)
+    return JournalState(run_id, ops, statuses, ended)
+
+
+def run_ids(folder=JOURNAL_FOLDER):
+    """Return the ids of the runs journaled in the folder, oldest first"""
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-len(JOURNAL_SUFFIX)] for name in os.listdir(folder) if name.endswith(JOURNAL_SUFFIX))
+
+
+def finished(run_id, folder=JOURNAL_FOLDER):
+    """Whether the run got to its end, from the last line of its journal only"""
+    with open(os.path.join(folder, run_id + JOURNAL_SUFFIX), 'rb') as journal_file:
+        journal_file.seek(max(0, os.fstat(journal_file.fileno()).st_size - 64))
+        return journal_file.read().rstrip(b'\n').endswith(b'{"end": true}')
+
+
+def unfinished_runs(folder=JOURNAL_FOLDER):
+    """Return the ids of the runs that died before their end, oldest first"""
+    return [run_id for run_id in run_ids(folder) if not finished(run_id, folder)]
+
+
+def applied(op):
+    """Whether the operation has already happened, its source gone and its target there"""
+    return not os.path.lexists(op.src) and (op.dst is None or os.path.lexists(op.dst))
+
+
+def resume(run_id, workers=8, adaptive=False, retries=3, folder=JOURNAL_FOLDER):
+    """Run the operations of an unfinished run that are not done yet, in their planned order
+
+    The tree is not walked again: the operations come from the journal, from the first one without
+    an outcome (or a failed one) on. One whose outcome was lost in the crash but is found applied is
+    recorded as done without running it, unless its source is the target of an earlier operation still
+    to run (e.g. the temporary name of a rename cycle): that source is missing because it has not been
+    made yet, not because the operation has run. Return the OpResults of the operations run.
+    """
+    state = load(run_id, folder)
+    if state.finished:
+        print(f"Run {run_id} has finished, nothing to resume.")
+        return []
+    journal = Journal(run_id, folder, resume=True)
+    seqs = []
+    # The targets of the operations still to run, their files do not exist yet
+    pending_targets = set()
+    try:
+        for seq in sorted(state.ops):
+            if state.statuses.get(seq) in ('done', 'skipped'):
+                continue
+            op = state.ops[seq]
+            if op.src not in pending_targets and applied(op):
+                journal.record(seq, 'done')
+            else:
+                seqs.append(seq)
+                pending_targets.add(op.dst)
+        print(f"Resuming run {run_id}: {len(seqs)} of {len(state.ops)} operations left.")
+        results = file_ops.run_ops([state.ops[seq] for seq in seqs], workers, adaptive=adaptive, retries=retries,
+                                   journal=journal, seqs=seqs)
+        journal.end()
+    finally:
+        journal.close()
+    return results
+
+
+def undo(run_id, workers=8, adaptive=False, retries=3, folder=JOURNAL_FOLDER):
+    """Replay the operations done by a run in reverse, each file moved back to where it was
+
+    The reverse operations run in the reverse order, so rename chains and cycles unwind correctly, and
+    are journaled as a run of their own. A deleted file can not be brought back, it is only reported.
+    A renamed file that has been moved or changed since is skipped, nothing is overwritten.
+    Return the OpResults of the operations run.
+    """
+    state = load(run_id, folder)
+    ops = []
+    for seq in sorted(state.ops, reverse=True):
+        op = state.ops[seq]
+        if state.statuses.get(seq) != 'done':
+            continue
+        if op.action == 'delete':
+            print(f"(CANNOT UNDO) '{op.src}' was deleted.")
+            continue
+        # A rename keeps the size and mtime the operation was planned on, a copy to another mount may not
+        check = op.check if op.action == 'rename' else None
+        ops.append(file_ops.FileOp(op.action, op.dst, op.src, check))
+    # The folders emptied and removed after the moves, e.g. by clean
+    for dirpath in set(os.path.dirname(op.dst) for op in ops):
+        os.makedirs(dirpath, exist_ok=True)
+
+    journal = Journal(folder=folder)
+    print(f"Undoing run {run_id} as run {journal.run_id}: {len(ops)} operations.")
+    try:
+        results = file_ops.run_ops(ops, workers, adaptive=adaptive, retries=retries, journal=journal)
+        journal.end()
+    finally:
+        journal.close()
+    return results
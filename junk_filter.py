@@ -0,0 +1,58 @@
+import re
+from collections import namedtuple
+
+import probe
+
+# The settings of the junk filter, durations in seconds:
+# - a video shorter than min_duration is junk (ads, previews)
+# - a video with a junk token in its name is junk up to sample_duration
+# - size_limit is the old size rule, only used when the duration can not be probed
+JunkFilter = namedtuple('JunkFilter', ['min_duration', 'sample_duration', 'size_limit'],
+                        defaults=(10 * 60, 30 * 60, 500 * 1024 * 1024))
+
+# Name tokens of the ads, samples and trailers shipped with the releases
+JUNK_TOKENS = re.compile(r'(?<![a-z])(sample|trailer|preview|teaser|promo)(?![a-z])|广告|宣传|预告', re.IGNORECASE)
+
+
+def profile(junk):
+    """Return the settings as a string, the cached verdicts are only reused with the same settings"""
+    return f"{junk.min_duration}|{junk.sample_duration}|{junk.size_limit}"
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_size(size):
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KB"
+    return f"{size / 1024 / 1024:.0f} MB"
+
+
+def classify(entry, junk, is_video):
+    """Return the ('delete' or 'keep', reason) verdict of a ScanEntry
+
+    Video files are judged on their duration, probed from the container header, and on the junk tokens
+    of their name. A low bitrate movie is kept whatever its size and a large ad clip is deleted. The size
+    rule is only used for the other files and the videos whose duration can not be probed.
+    """
+    if not is_video:
+        if entry.size < junk.size_limit:
+            return 'delete', f"not a video, {format_size(entry.size)}"
+        return 'keep', None
+
+    token = JUNK_TOKENS.search(entry.name)
+    info = probe.probe_file(entry.path, entry.size)
+    duration = info.duration if info is not None else None
+
+    if duration is None:
+        if entry.size < junk.size_limit:
+            return 'delete', f"no duration, {format_size(entry.size)} < {format_size(junk.size_limit)}"
+        return 'keep', f"no duration, {format_size(entry.size)}"
+    if token is not None and duration < junk.sample_duration:
+        return 'delete', f"'{token.group()}' in name, {format_duration(duration)}"
+    if duration < junk.min_duration:
+        return 'delete', f"{format_duration(duration)} < {format_duration(junk.min_duration)}"
+    return 'keep', format_duration(duration)
@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import dedup
+import probe
+import walker
+import normalizer
+import file_clean
+
+# A video file of the library. canonical is its dedup.canonical_id (with the CD part), variant the
+# postfix mode of its name ('c', 'no', 'u' or 'uc', see normalizer.infer_mode), width and height its
+# resolution from the container header, None when it can not be read.
+LibraryEntry = namedtuple('LibraryEntry', ['path', 'canonical', 'variant', 'width', 'height', 'size', 'mtime'])
+
+# What to do with the files of a plan already owned by the library
+OWNED_POLICIES = ('off', 'report', 'skip', 'dedup')
+
+# The name of each variant in the report
+VARIANT_NAMES = {'c': 'subtitle', 'no': 'no subtitle', 'u': 'hack', 'uc': 'hack with subtitle'}
+
+
+def describe(entry):
+    """Return the path, resolution and variant of a library entry for the report"""
+    resolution = f"{entry.width}x{entry.height}" if entry.width else "unknown resolution"
+    return f"'{entry.path}' ({resolution}, {VARIANT_NAMES[entry.variant]})"
+
+
+def join_reasons(reason, note):
+    return f"{reason}, {note}" if reason else note
+
+
+def index_file(path, size, mtime):
+    """Return the LibraryEntry of a video file, None if its name has no ID"""
+    name = os.path.basename(path)
+    canonical = dedup.canonical_id(name)
+    if canonical is None:
+        return None
+    info = probe.probe_file(path, size)
+    return LibraryEntry(path, canonical, normalizer.infer_mode(name), info.width if info else None,
+                        info.height if info else None, size, mtime)
+
+
+class LibraryIndex:
+    """On-disk index of the video files of the dest folders, by canonical ID
+
+    Loaded in full when opened, so lookup costs a dict access whatever the size of the library.
+    refresh builds the index of a dest folder the first time, by scanning its top-level folders in
+    parallel, and afterwards only scans again the top-level folders whose mtime has changed (e.g.
+    the folder of an actor MDC has just organised a file into). A file already indexed with the same
+    size and mtime is not probed again.
+    """
+
+    def __init__(self, db_path=os.path.join('./', 'log', 'library.db')):
+        db_folder = os.path.dirname(db_path)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS library ("
+                                "path TEXT PRIMARY KEY, canonical TEXT, variant TEXT, width INTEGER, height INTEGER, "
+                                "size INTEGER, mtime REAL, folder TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, root TEXT, mtime REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY)")
+        # canonical id -> {path: LibraryEntry}
+        self.by_id = {}
+        # top-level folder (or the root itself for its own files) -> set of the paths indexed under it
+        self.folder_paths = {}
+        self.entries = {}
+        for path, canonical, _, width, height, size, mtime, folder in self.connection.execute(
+                "SELECT * FROM library"):
+            # The variant is read from the name again, cheaply, so entries indexed by an older parser are right
+            variant = normalizer.infer_mode(os.path.basename(path))
+            self._add(LibraryEntry(path, canonical, variant, width, height, size, mtime), folder)
+        self.folders = dict(self.connection.execute("SELECT path, mtime FROM folders"))
+        self.roots = set(path for (path,) in self.connection.execute("SELECT path FROM roots"))
+        self.lock = threading.Lock()
+        self.probed = 0
+
+    def _add(self, entry, folder):
+        self.entries[entry.path] = entry
+        self.by_id.setdefault(entry.canonical, {})[entry.path] = entry
+        self.folder_paths.setdefault(folder, set()).add(entry.path)
+
+    def _remove_folder(self, folder):
+        for path in self.folder_paths.pop(folder, ()):
+            entry = self.entries.pop(path)
+            copies = self.by_id[entry.canonical]
+            del copies[path]
+            if not copies:
+                del self.by_id[entry.canonical]
+        self.connection.execute("DELETE FROM library WHERE folder = ?", (folder,))
+
+    def indexed(self, root):
+        """Whether the dest folder has been indexed once"""
+        return os.path.normpath(root) in self.roots
+
+    def lookup(self, canonical):
+        """Return the LibraryEntries of an ID still in place, the gone ones are dropped"""
+        copies = self.by_id.get(canonical)
+        if not copies:
+            return []
+        return [entry for entry in list(copies.values()) if os.path.exists(entry.path)]
+
+    def scan_folder(self, folder, top_level_only=False):
+        """Return the LibraryEntries of the video files under a top-level folder, probing the new ones"""
+        if top_level_only:
+            scanned = []
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and file_clean.is_video_file(entry.name):
+                        entry_stat = entry.stat()
+                        scanned.append((entry.path, entry_stat.st_size, entry_stat.st_mtime))
+        else:
+            scanned = [(entry.path, entry.size, entry.mtime) for entry in walker.scan_tree(folder)
+                       if file_clean.is_video_file(entry.name)]
+        found = []
+        for path, size, mtime in scanned:
+            entry = self.entries.get(path)
+            if entry is None or (entry.size, entry.mtime) != (size, mtime):
+                entry = index_file(path, size, mtime)
+                with self.lock:
+                    self.probed += 1
+            if entry is not None:
+                found.append(entry)
+        return found
+
+    def refresh(self, root, workers=8):
+        """Index the video files of a dest folder, only the top-level folders changed since the last refresh
+
+        Return the number of top-level folders scanned.
+        """
+        root = os.path.normpath(root)
+        try:
+            entries = list(os.scandir(root))
+        except OSError as e:
+            print(f"Failed to index '{root}': {e}")
+            return 0
+        current = {}
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    current[entry.path] = entry.stat(follow_symlinks=False).st_mtime
+            except OSError:
+                continue
+        changed = [folder for folder, mtime in current.items() if self.folders.get(folder) != mtime]
+        gone = [folder for folder in self.folders if os.path.dirname(folder) == root and folder not in current]
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            scanned = dict(zip(changed, executor.map(self.scan_folder, changed)))
+        # The files of the root itself are always checked, a listing away
+        scanned[root] = self.scan_folder(root, top_level_only=True)
+
+        for folder in gone:
+            self._remove_folder(folder)
+            del self.folders[folder]
+            self.connection.execute("DELETE FROM folders WHERE path = ?", (folder,))
+        for folder, found in scanned.items():
+            self._remove_folder(folder)
+            for entry in found:
+                self._add(entry, folder)
+            self.connection.executemany("INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                        [tuple(entry) + (folder,) for entry in found])
+            if folder in current:
+                self.folders[folder] = current[folder]
+                self.connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+                                        (folder, root, current[folder]))
+        self.roots.add(root)
+        self.connection.execute("INSERT OR IGNORE INTO roots VALUES (?)", (root,))
+        self.connection.commit()
+        return len(changed)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def find_owned(plan, library, policy='report'):
+    """Return the plan with the files already owned by the library handled by the policy, and their count
+
+    A video file kept by the plan is owned when the library has a copy of the same ID (CD part
+    included) and variant. With 'report', its change is kept and its reason tells where the copy is.
+    With 'skip', it becomes an 'owned' change, left in the source folder and not scraped, with the
+    path of the copy as new_name. With 'dedup', it is left to dedup.resolve_duplicates, which compares
+    it to the copies of the library (see check_owned). A copy of another variant is only reported.
+    """
+    new_plan = []
+    owned = 0
+    for change in plan:
+        if change.action in ('unchanged', 'rename'):
+            final_name = change.new_name or change.file_name
+            canonical = dedup.canonical_id(final_name)
+            copies = library.lookup(canonical) if canonical is not None else []
+            if copies:
+                variant = normalizer.infer_mode(final_name)
+                same = [entry for entry in copies if entry.variant == variant]
+                if not same:
+                    note = f"owned as another variant at {describe(copies[0])}"
+                    change = change._replace(reason=join_reasons(change.reason, note))
+                else:
+                    owned += 1
+                    note = f"already owned at {describe(same[0])}"
+                    if policy == 'skip':
+                        change = change._replace(action='owned', new_name=same[0].path, reason=note)
+                    elif policy == 'report':
+                        change = change._replace(reason=join_reasons(change.reason, note))
+        new_plan.append(change)
+    return tuple(new_plan), owned
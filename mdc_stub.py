@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Stand-in for the Movie_Data_Capture program, to test and benchmark the scraping stage offline
+
+Takes the same single-file command line as scraper.mdc_command. It sleeps MDC_STUB_SLEEP seconds
+(0.1 by default), then moves the file to <success_output_folder>/<number>/ and writes <number>.nfo
+and a <number>-poster.jpg next to it, printing the NFO path as MDC does. With MDC_STUB_FAIL_RATE
+(0 to 1) the given fraction of the files fail with exit code 1.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+# Placeholder poster, JPEG start and end markers around a comment, enough to stand for the artwork
+POSTER = b'\xff\xd8\xff\xfe\x00\x11mdc_stub poster\xff\xd9'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Movie_Data_Capture stub.')
+    parser.add_argument('file', help='Single movie file path')
+    parser.add_argument('-C', '--config-override', action='append', default=[], help='section:key=value')
+    args = parser.parse_args()
+
+    config = {}
+    for override in args.config_override:
+        key, _, value = override.partition('=')
+        config[key] = value
+
+    time.sleep(float(os.environ.get('MDC_STUB_SLEEP', '0.1')))
+    if random.random() < float(os.environ.get('MDC_STUB_FAIL_RATE', '0')):
+        print(f"[-]Movie number not found: {args.file}", file=sys.stderr)
+        sys.exit(1)
+
+    number = os.path.splitext(os.path.basename(args.file))[0]
+    movie_folder = os.path.join(config.get('common:success_output_folder', 'JAV_output'), number)
+    os.makedirs(movie_folder, exist_ok=True)
+    os.rename(args.file, os.path.join(movie_folder, os.path.basename(args.file)))
+    nfo_path = os.path.join(movie_folder, number + '.nfo')
+    with open(nfo_path, 'w', encoding='utf-8') as nfo_file:
+        nfo_file.write('<?xml version="1.0" encoding="UTF-8" ?>\n<movie>\n'
+                       f'  <title>{number}</title>\n  <num>{number}</num>\n'
+                       f'  <poster>{number}-poster.jpg</poster>\n</movie>\n')
+    with open(os.path.join(movie_folder, number + '-poster.jpg'), 'wb') as poster_file:
+        poster_file.write(POSTER)
+    print(f"[+]Wrote!            {nfo_path}")
@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import sqlite3
+from collections import namedtuple
+
+import dedup
+import walker
+import normalizer
+import file_clean
+
+# The output of MDC for a movie. folder is the movie folder relative to the success folder, files the
+# (name, content) of the NFO and artwork MDC wrote next to the movie. In the folder, the names and the
+# NFO text, STEM stands for the name of the movie file without its extension. status is 'done', or
+# 'failed' when MDC could not scrape it.
+CachedMetadata = namedtuple('CachedMetadata', ['movie_id', 'status', 'folder', 'files', 'fetched'])
+
+STEM = '<stem>'
+
+# The files of a movie folder that come from the metadata, the movie itself and its subtitles come
+# from the source
+METADATA_EXTENSIONS = ('.nfo', '.jpg', '.jpeg', '.png', '.webp')
+
+# The metadata files whose text names the movie, e.g. the <num> and <filename> of the NFO
+TEXT_EXTENSIONS = ('.nfo',)
+
+# MDC prints the NFO it has written, e.g. "[+]Wrote!            /dest/SSNI-334/SSNI-334.nfo"
+_WROTE = re.compile(r'^\[\+\]Wrote!\s+(.+?)\s*$', re.M)
+
+# The entries are evicted down to this fraction of max_bytes, not one at a time
+EVICT_TO = 0.9
+
+
+def movie_id(file_name):
+    """Return the key the metadata of a movie is cached by, e.g. SSNI-334-CD1-C for ssni334-C-cd1.mp4
+
+    The CD part and the variant (see normalizer.infer_mode) are kept: MDC names the files and folder of
+    each part and variant after it, and writes them into the NFO.
+    """
+    canonical = dedup.canonical_id(file_name)
+    if canonical is None:
+        return None
+    return canonical + normalizer.POSTFIXES[normalizer.infer_mode(file_name)]
+
+
+def output_folder(stdout):
+    """Return the movie folder MDC reports in its output, None if it reports none"""
+    paths = _WROTE.findall(stdout)
+    if not paths:
+        return None
+    path = paths[-1]
+    return path if os.path.isdir(path) else os.path.dirname(path)
+
+
+def write_files(metadata, folder, stem, overwrite=False):
+    """Write the cached files of a movie into its folder, named after stem, return the number written"""
+    written = 0
+    for name, data in metadata.files:
+        path = os.path.join(folder, name.replace(STEM, stem))
+        if not overwrite and os.path.exists(path):
+            continue
+        if name.lower().endswith(TEXT_EXTENSIONS):
+            data = data.replace(STEM.encode('utf-8'), stem.encode('utf-8'))
+        with open(path, 'wb') as file:
+            file.write(data)
+        written += 1
+    return written
+
+
+class MetadataCache:
+    """On-disk cache of the NFO and artwork MDC writes for each movie, keyed by movie_id
+
+    An entry is fresh for ttl seconds after it was fetched, a failure (MDC could not find the movie)
+    for failed_ttl seconds only, so a movie missing upstream is not looked up again on every run but
+    is tried again later. Once the files take more than max_bytes, the least recently used entries are
+    evicted. Everything is kept in a single SQLite file.
+    """
+
+    def __init__(self, db_path=os.path.join('./', 'log', 'metadata_cache.db'), ttl=30 * 86400, failed_ttl=86400,
+                 max_bytes=1024 ** 3):
+        db_folder = os.path.dirname(db_path)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                                "movie_id TEXT PRIMARY KEY, status TEXT, folder TEXT, fetched REAL, used REAL, "
+                                "size INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                "movie_id TEXT, name TEXT, data BLOB, PRIMARY KEY (movie_id, name))")
+        self.ttl = ttl
+        self.failed_ttl = failed_ttl
+        self.max_bytes = max_bytes
+        self.total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, key, fresh=True):
+        """Return the CachedMetadata of a movie, None if it is not cached, or stale with fresh=True"""
+        row = self.connection.execute("SELECT status, folder, fetched FROM entries WHERE movie_id = ?",
+                                      (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        status, folder, fetched = row
+        if fresh and time.time() - fetched > (self.ttl if status == 'done' else self.failed_ttl):
+            self.misses += 1
+            return None
+        files = self.connection.execute("SELECT name, data FROM files WHERE movie_id = ?", (key,)).fetchall()
+        self.connection.execute("UPDATE entries SET used = ? WHERE movie_id = ?", (time.time(), key))
+        self.connection.commit()
+        self.hits += 1
+        return CachedMetadata(key, status, folder, files, fetched)
+
+    def capture(self, key, folder, file_name, success_folder):
+        """Store the NFO and artwork MDC has written in the folder of a movie it has just organised
+
+        file_name is the name of the scraped file, the stem of the files is that of the movie found in
+        the folder (MDC may have renamed it), the first one when the folder holds several parts. It is
+        replaced by STEM in the names and in the NFO text, and put back by write_files.
+        """
+        videos = sorted(name for name in os.listdir(folder) if file_clean.is_video_file(name))
+        if not videos:
+            return False
+        movie_name = file_name if file_name in videos else videos[0]
+        stem = os.path.splitext(movie_name)[0]
+        files = []
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.lower().endswith(METADATA_EXTENSIONS) and os.path.isfile(path):
+                with open(path, 'rb') as file:
+                    data = file.read()
+                if name.lower().endswith(TEXT_EXTENSIONS):
+                    data = data.replace(stem.encode('utf-8'), STEM.encode('utf-8'))
+                files.append((name.replace(stem, STEM), data))
+        relative = os.path.relpath(folder, success_folder).replace(stem, STEM)
+        self._put(key, 'done', relative, files)
+        return True
+
+    def store_failure(self, key):
+        """Remember that MDC could not scrape the movie"""
+        self._put(key, 'failed', None, [])
+
+    def restore(self, metadata, file_path, success_folder):
+        """Organise a file into the success folder as MDC did, from the cached metadata
+
+        Return the path the file is moved to. Raise OSError, e.g. FileExistsError when a file is already
+        there, the file is then left in place.
+        """
+        file_name = os.path.basename(file_path)
+        stem = os.path.splitext(file_name)[0]
+        folder = os.path.join(success_folder, metadata.folder.replace(STEM, stem))
+        target = os.path.join(folder, file_name)
+        if os.path.lexists(target):
+            raise FileExistsError(f"'{target}' already exists")
+        os.makedirs(folder, exist_ok=True)
+        os.rename(file_path, target)
+        write_files(metadata, folder, stem)
+        return target
+
+    def regenerate(self, folder_path):
+        """Write the NFO and artwork missing next to the movies under a folder, from the cache only
+
+        The entries are used whatever their age, nothing is fetched. Return the number of files written.
+        """
+        written = 0
+        for entry in walker.scan_tree(folder_path, stat=False):
+            if not file_clean.is_video_file(entry.name):
+                continue
+            key = movie_id(entry.name)
+            metadata = self.get(key, fresh=False) if key is not None else None
+            if metadata is not None and metadata.status == 'done':
+                written += write_files(metadata, entry.dirpath, os.path.splitext(entry.name)[0])
+        return written
+
+    def _put(self, key, status, folder, files):
+        now = time.time()
+        size = sum(len(data) for _, data in files)
+        row = self.connection.execute("SELECT size FROM entries WHERE movie_id = ?", (key,)).fetchone()
+        if row is not None:
+            self.total -= row[0]
+        self.connection.execute("DELETE FROM files WHERE movie_id = ?", (key,))
+        self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                (key, status, folder, now, now, size))
+        self.connection.executemany("INSERT INTO files VALUES (?, ?, ?)",
+                                    [(key, name, data) for name, data in files])
+        self.total += size
+        if self.total > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICT_TO))
+        self.connection.commit()
+
+    def evict(self, target_bytes):
+        """Delete the least recently used entries until the files take at most target_bytes"""
+        rows = self.connection.execute("SELECT movie_id, size FROM entries ORDER BY used").fetchall()
+        for key, size in rows:
+            if self.total <= target_bytes:
+                break
+            self.connection.execute("DELETE FROM entries WHERE movie_id = ?", (key,))
+            self.connection.execute("DELETE FROM files WHERE movie_id = ?", (key,))
+            self.total -= size
+            self.evicted += 1
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
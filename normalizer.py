@@ -0,0 +1,109 @@
+import re
+from collections import namedtuple
+
+# The parts of a release name, e.g. 232[233.com]SSNI-234-hack-c-cd1.mp4 ->
+# ParsedName(prefix_number='232', prefix='SSNI', number='234', postfix1='hack', postfix2='c',
+#            cd='cd1', extension='.mp4')
+ParsedName = namedtuple('ParsedName', ['prefix_number', 'prefix', 'number', 'postfix1', 'postfix2', 'cd', 'extension'])
+
+# Whole release name grammar, matched once per name:
+#   ad prefix   leading [site] tags, "site.com@" / "site.com-" domains and the number prefix (232GANA)
+#   prefix      letters of the ID, e.g. SSNI
+#   number      digits of the ID, e.g. 334, with an optional "-", "_" or " " in front
+#   cd          the first "cdN" token after the number, if any
+#   extension   the last ".xxx" of the name
+# Everything else after the number is junk and dropped.
+_NAME = re.compile(r'''
+    (?:\[[^\]]*\]|(?:[\w\-]+\.)+(?:com|net|org|top|xyz|cc|tv|me|la|info|vip|club|cn|jp|io|co)[@\-_])*
+    (?P<prefix_number>\d*)
+    (?:\[[^\]]*\])*
+    (?P<prefix>[A-Za-z]+)[-_\ ]?
+    (?P<number>\d+)
+    (?P<tail>(?:.*?(?<![A-Za-z])(?P<cd>[Cc][Dd]\d+))?.*?)
+    (?P<extension>\.[^.]+)$
+''', re.X | re.S)
+
+# The ad prefix alone, used for the names without an ID
+_AD_PREFIX = re.compile(r'^(?:\d+|\[[^\]]*\])+')
+
+# The first two tags after the number, e.g. "-hack-c" in SSNI-234-hack-c-cd1, past a CD part written first
+# as in SSNI-234-cd1-hack-c (the names clean_many writes) or SSNI-234-1-C
+_TAGS = re.compile(r'(?:[-_\ ]?[Cc][Dd]\d+|[-_\ ]\d+)?'
+                   r'[-_\ ]?(?:(?P<postfix1>[A-Za-z]+)(?![A-Za-z0-9]))?'
+                   r'[-_\ ]?(?:(?P<postfix2>[A-Za-z]+)(?![A-Za-z0-9]))?')
+
+# An existing "-C" tag just before the extension
+_C_TAG = re.compile(r'-c$', re.I)
+
+# The tag appended for each postfix mode
+POSTFIXES = {'c': '-C', 'no': '', 'u': '-hack', 'uc': '-hack-c', '': ''}
+
+# The tags after the number telling a release is hacked or has subtitles, "-CD1" is a CD part, not a tag
+_HACK_TAGS = {'u', 'uc', 'hack'}
+_SUB_TAGS = {'c', 'uc', 'ch'}
+
+
+def parse(filename):
+    """Split a release name into its ParsedName parts, None if the name has no ID"""
+    match = _NAME.match(filename)
+    if match is None:
+        return None
+    tags = _TAGS.match(match.group('tail'))
+    return ParsedName(match.group('prefix_number') or None, match.group('prefix'), match.group('number'),
+                      tags.group('postfix1'), tags.group('postfix2'), match.group('cd'),
+                      match.group('extension'))
+
+
+def infer_mode(filename, has_subtitle=False):
+    """Return the postfix mode of a release from the tags after its number, e.g. 'uc' for SSNI-234-hack-c.mp4
+
+    has_subtitle tells a subtitle file came with the release, it is then 'c' (or 'uc') even without tag.
+    """
+    parts = parse(filename)
+    tags = set()
+    if parts is not None:
+        tags = set(tag.lower() for tag in (parts.postfix1, parts.postfix2) if tag)
+    hack = bool(tags & _HACK_TAGS)
+    sub = has_subtitle or bool(tags & _SUB_TAGS)
+    if hack:
+        return 'uc' if sub else 'u'
+    return 'c' if sub else 'no'
+
+
+def _clean_without_id(filename, postfix):
+    """Clean a name the grammar does not match, only the ad prefix is deleted"""
+    dot = filename.rfind('.')
+    if dot <= 0:
+        return filename
+    body = _AD_PREFIX.sub('', filename[:dot]) or filename[:dot]
+    # Do not add "-C" twice
+    if postfix == '-C' and _C_TAG.search(body):
+        return body + filename[dot:]
+    return body + postfix + filename[dot:]
+
+
+def normalize(filename, mode=''):
+    """Clean one release name, mode is one of the POSTFIXES keys ('c', 'no', 'u', 'uc' or '')"""
+    return clean_many((filename,), mode)[0]
+
+
+def clean_many(filenames, mode=''):
+    """Clean a batch of release names, in the same order, with the tag of the postfix mode
+
+    e.g. 232[233.com]SSNI334C-cd2.mp4 -> SSNI-334-cd2-C.mp4 with mode 'c'
+    """
+    postfix = POSTFIXES[mode]
+    match_name = _NAME.match
+    results = []
+    append = results.append
+    for filename in filenames:
+        match = match_name(filename)
+        if match is None:
+            append(_clean_without_id(filename, postfix))
+            continue
+        prefix, number, cd, extension = match.group('prefix', 'number', 'cd', 'extension')
+        if cd:
+            append(f"{prefix}-{number}-{cd}{postfix}{extension}")
+        else:
+            append(f"{prefix}-{number}{postfix}{extension}")
+    return results
@@ -0,0 +1,129 @@
+import os
+import time
+import queue
+import pickle
+import tempfile
+import threading
+import weakref
+
+# Items produced ahead of the consumer by bounded, handed over in chunks of CHUNK_SIZE items or
+# of the items produced within CHUNK_DELAY seconds, whichever comes first
+QUEUE_SIZE = 1024
+CHUNK_SIZE = 64
+CHUNK_DELAY = 0.1
+
+_DONE = object()
+
+
+class _Failure:
+    """An exception raised by the producer of bounded, raised again in the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def bounded(iterable, maxsize=QUEUE_SIZE):
+    """Yield the items of the iterable, produced ahead by a background thread
+
+    At most about maxsize items wait in the queue between the two stages, so a fast producer never holds
+    more than that in memory and a slow consumer slows the producer down. An exception of the producer is
+    raised again in the consumer, and closing the generator stops the producer.
+    """
+    items = queue.Queue(max(1, maxsize // CHUNK_SIZE))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        chunk = []
+        started = time.monotonic()
+        try:
+            for item in iterable:
+                if not chunk:
+                    started = time.monotonic()
+                chunk.append(item)
+                if len(chunk) >= CHUNK_SIZE or time.monotonic() - started >= CHUNK_DELAY:
+                    if not put(chunk):
+                        return
+                    chunk = []
+        except BaseException as error:
+            put(chunk)
+            put(_Failure(error))
+            return
+        put(chunk)
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = items.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, _Failure):
+                raise chunk.error
+            yield from chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+class PlanSpool:
+    """A plan kept in a temporary file of the log folder instead of memory
+
+    The changes are appended one by one and can be iterated over as many times as needed, each
+    iteration reads the file again. The file is deleted with the spool.
+    """
+
+    def __init__(self, folder_path=os.path.join('./', 'log')):
+        os.makedirs(folder_path, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(prefix='plan_', suffix='.spool', dir=folder_path, delete=False)
+        self.path = self.file.name
+        self.count = 0
+        weakref.finalize(self, _remove, self.file, self.path)
+
+    def append(self, change):
+        pickle.dump(change, self.file, pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+    def extend(self, changes):
+        for change in changes:
+            self.append(change)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.file.flush()
+        with open(self.path, 'rb') as file:
+            for _ in range(self.count):
+                yield pickle.load(file)
+
+
+class ChainedPlans:
+    """The changes of several plans one after another, iterated over as many times as the plans can be"""
+
+    def __init__(self, plans):
+        self.plans = list(plans)
+
+    def __len__(self):
+        return sum(len(plan) for plan in self.plans)
+
+    def __iter__(self):
+        for plan in self.plans:
+            yield from plan
+
+
+def _remove(file, path):
+    file.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
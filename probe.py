@@ -0,0 +1,477 @@
+import os
+import mmap
+import uuid
+import struct
+import sqlite3
+from collections import namedtuple
+
+# The container metadata of a video file, duration in seconds and bitrate in bits per second.
+# Any field but container is None when the header does not tell it.
+VideoInfo = namedtuple('VideoInfo', ['container', 'width', 'height', 'duration', 'bitrate', 'codec'])
+
+# Size of the blocks read by BlockReader, a header region of a few KB costs a single read
+BLOCK_SIZE = 64 * 1024
+
+# Most boxes/elements looked at in a file, against broken or hostile headers
+MAX_ELEMENTS = 4096
+
+# Short codec names of the fourcc and codec ids found in the headers
+CODECS = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264', 'x264': 'h264', 'v_mpeg4/iso/avc': 'h264',
+    'hvc1': 'hevc', 'hev1': 'hevc', 'hevc': 'hevc', 'h265': 'hevc', 'v_mpegh/iso/hevc': 'hevc',
+    'mp4v': 'mpeg4', 'xvid': 'mpeg4', 'divx': 'mpeg4', 'dx50': 'mpeg4', 'fmp4': 'mpeg4', 'v_mpeg4/iso/asp': 'mpeg4',
+    'av01': 'av1', 'v_av1': 'av1', 'vp09': 'vp9', 'v_vp9': 'vp9', 'v_vp8': 'vp8',
+    'wmv1': 'wmv1', 'wmv2': 'wmv2', 'wmv3': 'wmv3', 'wvc1': 'vc1',
+    'rv30': 'rv30', 'rv40': 'rv40', 'flv1': 'flv1',
+}
+
+# FLV videocodecid values
+FLV_CODECS = {2: 'flv1', 4: 'vp6', 5: 'vp6', 7: 'h264', 12: 'hevc'}
+
+
+def codec_name(raw):
+    """Return the short codec name of a fourcc or codec id"""
+    if not raw:
+        return None
+    raw = raw.strip('\0 ').lower()
+    return CODECS.get(raw, raw or None)
+
+
+class BlockReader:
+    """Range reads of a file through a cache of BLOCK_SIZE blocks
+
+    The probes do many small reads in the same few header regions, each region is only read once.
+    """
+
+    def __init__(self, file, file_size):
+        self.file = file
+        self.size = file_size
+        self.blocks = {}
+        self.reads = 0
+
+    def read_block(self, index):
+        self.file.seek(index * BLOCK_SIZE)
+        self.reads += 1
+        return self.file.read(BLOCK_SIZE)
+
+    def read(self, offset, size):
+        if offset < 0 or offset >= self.size or size <= 0:
+            return b''
+        size = min(size, self.size - offset)
+        chunks = []
+        end = offset + size
+        while offset < end:
+            index = offset // BLOCK_SIZE
+            block = self.blocks.get(index)
+            if block is None:
+                block = self.blocks[index] = self.read_block(index)
+            start = offset - index * BLOCK_SIZE
+            chunk = block[start:start + end - offset]
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+        return b''.join(chunks)
+
+
+class MmapReader:
+    """Range reads of a memory-mapped file, only the touched pages are read from the disk"""
+
+    def __init__(self, file, file_size):
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = file_size
+        self.reads = 0
+
+    def read(self, offset, size):
+        if offset < 0 or size <= 0:
+            return b''
+        return self.map[offset:offset + size]
+
+    def close(self):
+        self.map.close()
+
+
+def iter_mp4_boxes(reader, start, end):
+    """Yield the (type, body offset, box end) of the boxes between start and end"""
+    offset = start
+    count = 0
+    while offset + 8 <= end and count < MAX_ELEMENTS:
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            return
+        box_size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if box_size == 1 and len(header) == 16:
+            box_size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header_size:
+            return
+        yield box_type, offset + header_size, min(offset + box_size, end)
+        offset += box_size
+        count += 1
+
+
+def probe_mp4(reader):
+    """Return the (width, height, duration, codec) of an MP4/MOV file
+
+    Only the box headers on the path moov/trak/mdia/minf/stbl/stsd and the small mvhd, tkhd, hdlr and
+    stsd boxes are read, wherever moov is (start or end of the file).
+    """
+    width = height = duration = codec = None
+    for box_type, body, end in iter_mp4_boxes(reader, 0, reader.size):
+        if box_type != b'moov':
+            continue
+        for child_type, child_body, child_end in iter_mp4_boxes(reader, body, end):
+            if child_type == b'mvhd':
+                data = reader.read(child_body, 32)
+                if data[:1] == b'\1':
+                    timescale, length = struct.unpack('>IQ', data[20:32])
+                else:
+                    timescale, length = struct.unpack('>II', data[12:20])
+                if timescale:
+                    duration = length / timescale
+            elif child_type == b'trak':
+                track = probe_mp4_track(reader, child_body, child_end)
+                if track is not None and (width is None or track[0] > width):
+                    width, height, codec = track
+        break
+    return width, height, duration, codec
+
+
+def probe_mp4_track(reader, start, end):
+    """Return the (width, height, codec) of a video trak box, None for other tracks"""
+    width = height = codec = None
+    is_video = False
+    pending = [(start, end)]
+    while pending:
+        box_start, box_end = pending.pop()
+        for box_type, body, end_of_box in iter_mp4_boxes(reader, box_start, box_end):
+            if box_type == b'tkhd':
+                data = reader.read(body, 96)
+                # Track width and height are the last two 16.16 fixed point fields
+                size_offset = 88 if data[:1] == b'\1' else 76
+                if len(data) >= size_offset + 8:
+                    track_width, track_height = struct.unpack('>II', data[size_offset:size_offset + 8])
+                    width, height = track_width >> 16, track_height >> 16
+            elif box_type == b'hdlr':
+                is_video = reader.read(body + 8, 4) == b'vide'
+            elif box_type == b'stsd':
+                # The type of the first sample entry is the codec
+                codec = codec_name(reader.read(body + 12, 4).decode('latin-1'))
+            elif box_type in (b'mdia', b'minf', b'stbl'):
+                pending.append((body, end_of_box))
+    if not is_video and not width:
+        return None
+    return width, height, codec
+
+
+def read_ebml_vint(data, offset, keep_marker):
+    """Return the (value, next offset) of the EBML variable size integer at offset"""
+    first = data[offset]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or offset + length > len(data):
+        raise ValueError("Invalid EBML integer")
+    value = int.from_bytes(data[offset:offset + length], 'big')
+    if not keep_marker:
+        value &= (1 << (7 * length)) - 1
+        # All ones is an unknown size
+        if value == (1 << (7 * length)) - 1:
+            value = None
+    return value, offset + length
+
+
+# The Matroska elements read by probe_mkv, the master elements are walked into
+MKV_SEGMENT, MKV_INFO, MKV_TRACKS, MKV_TRACK_ENTRY, MKV_VIDEO = 0x18538067, 0x1549A966, 0x1654AE6B, 0xAE, 0xE0
+MKV_TIMECODE_SCALE, MKV_DURATION, MKV_TRACK_TYPE, MKV_CODEC_ID = 0x2AD7B1, 0x4489, 0x83, 0x86
+MKV_PIXEL_WIDTH, MKV_PIXEL_HEIGHT, MKV_CLUSTER = 0xB0, 0xBA, 0x1F43B675
+MKV_MASTERS = {MKV_SEGMENT, MKV_INFO, MKV_TRACKS, MKV_TRACK_ENTRY, MKV_VIDEO}
+
+
+def probe_mkv(reader):
+    """Return the (width, height, duration, codec) of a Matroska file
+
+    Walks the element headers from the start of the file up to the first Cluster, skipping over the
+    elements that are not needed, so only the header regions are read.
+    """
+    timecode_scale = 1000000
+    duration = None
+    tracks = []
+    offset = 0
+    for _ in range(MAX_ELEMENTS):
+        header = reader.read(offset, 12)
+        if len(header) < 2:
+            break
+        try:
+            element_id, header_end = read_ebml_vint(header, 0, True)
+            size, header_end = read_ebml_vint(header, header_end, False)
+        except (ValueError, IndexError):
+            break
+        body = offset + header_end
+        if element_id == MKV_CLUSTER:
+            break
+        if element_id == MKV_TRACK_ENTRY:
+            tracks.append({})
+        if element_id in MKV_MASTERS:
+            # Walk into the master element
+            offset = body
+            continue
+        if size is None:
+            break
+        if element_id in (MKV_TIMECODE_SCALE, MKV_DURATION, MKV_TRACK_TYPE, MKV_CODEC_ID,
+                          MKV_PIXEL_WIDTH, MKV_PIXEL_HEIGHT) and size <= 64:
+            data = reader.read(body, size)
+            if element_id == MKV_TIMECODE_SCALE:
+                timecode_scale = int.from_bytes(data, 'big')
+            elif element_id == MKV_DURATION and size in (4, 8):
+                duration = struct.unpack('>f' if size == 4 else '>d', data)[0]
+            elif tracks and element_id == MKV_CODEC_ID:
+                tracks[-1][element_id] = data.decode('latin-1')
+            elif tracks:
+                tracks[-1][element_id] = int.from_bytes(data, 'big')
+        offset = body + size
+
+    if duration is not None:
+        duration = duration * timecode_scale / 1e9
+    for track in tracks:
+        if track.get(MKV_TRACK_TYPE) == 1 or MKV_PIXEL_WIDTH in track:
+            return track.get(MKV_PIXEL_WIDTH), track.get(MKV_PIXEL_HEIGHT), duration, codec_name(
+                track.get(MKV_CODEC_ID))
+    return None, None, duration, None
+
+
+def probe_avi(reader):
+    """Return the (width, height, duration, codec) of an AVI file from its hdrl list"""
+    data = reader.read(0, BLOCK_SIZE)
+    if data[:4] != b'RIFF' or data[8:12] != b'AVI ':
+        return None
+    offset = data.find(b'avih')
+    if offset < 0 or offset + 48 > len(data):
+        return None
+    (micro_sec_per_frame, _, _, _, total_frames, _, _, _,
+     width, height) = struct.unpack('<10I', data[offset + 8:offset + 48])
+    duration = total_frames * micro_sec_per_frame / 1e6 if micro_sec_per_frame else None
+
+    # The handler of the first video stream header
+    codec = None
+    offset = data.find(b'strh')
+    while offset >= 0:
+        if data[offset + 8:offset + 12] == b'vids':
+            codec = codec_name(data[offset + 12:offset + 16].decode('latin-1'))
+            break
+        offset = data.find(b'strh', offset + 4)
+    return width, height, duration, codec
+
+
+def read_amf_value(data, offset):
+    """Return the (value, next offset) of the AMF0 value at offset"""
+    marker = data[offset]
+    offset += 1
+    if marker == 0:
+        return struct.unpack('>d', data[offset:offset + 8])[0], offset + 8
+    if marker == 1:
+        return bool(data[offset]), offset + 1
+    if marker == 2:
+        length = struct.unpack('>H', data[offset:offset + 2])[0]
+        return data[offset + 2:offset + 2 + length].decode('utf-8', errors='replace'), offset + 2 + length
+    if marker in (3, 8):
+        if marker == 8:
+            offset += 4
+        values = {}
+        while data[offset:offset + 3] != b'\0\0\x09':
+            length = struct.unpack('>H', data[offset:offset + 2])[0]
+            key = data[offset + 2:offset + 2 + length].decode('utf-8', errors='replace')
+            values[key], offset = read_amf_value(data, offset + 2 + length)
+        return values, offset + 3
+    if marker == 10:
+        count = struct.unpack('>I', data[offset:offset + 4])[0]
+        values = []
+        offset += 4
+        for _ in range(count):
+            value, offset = read_amf_value(data, offset)
+            values.append(value)
+        return values, offset
+    if marker == 11:
+        return struct.unpack('>d', data[offset:offset + 8])[0], offset + 10
+    if marker in (5, 6):
+        return None, offset
+    raise ValueError(f"Unsupported AMF0 marker {marker}")
+
+
+def probe_flv(reader):
+    """Return the (width, height, duration, codec) of an FLV file from its onMetaData script tag"""
+    data = reader.read(0, BLOCK_SIZE)
+    if data[:3] != b'FLV':
+        return None
+    offset = struct.unpack('>I', data[5:9])[0] + 4
+    for _ in range(8):
+        if offset + 11 > len(data):
+            return None
+        tag_type = data[offset]
+        tag_size = int.from_bytes(data[offset + 1:offset + 4], 'big')
+        if tag_type == 18:
+            name, value_offset = read_amf_value(data, offset + 11)
+            if name == 'onMetaData':
+                meta, _ = read_amf_value(data, value_offset)
+                if not isinstance(meta, dict):
+                    return None
+                width, height = meta.get('width'), meta.get('height')
+                return (int(width) if width else None, int(height) if height else None, meta.get('duration'),
+                        FLV_CODECS.get(int(meta.get('videocodecid') or 0)))
+        offset += 11 + tag_size + 4
+    return None
+
+
+ASF_HEADER = uuid.UUID('75B22630-668E-11CF-A6D9-00AA0062CE6C').bytes_le
+ASF_FILE_PROPERTIES = uuid.UUID('8CABDCA1-A947-11CF-8EE4-00C00C205365').bytes_le
+ASF_STREAM_PROPERTIES = uuid.UUID('B7DC0791-A9B7-11CF-8EE6-00C00C205365').bytes_le
+ASF_VIDEO_MEDIA = uuid.UUID('BC19EFC0-5B4D-11CF-A8FD-00805F5C442B').bytes_le
+
+
+def probe_asf(reader):
+    """Return the (width, height, duration, codec) of a WMV (ASF) file from its header object"""
+    data = reader.read(0, 30)
+    if data[:16] != ASF_HEADER:
+        return None
+    header_size, object_count = struct.unpack('<QI', data[16:28])
+    data = reader.read(0, min(header_size, 4 * BLOCK_SIZE))
+    width = height = duration = codec = None
+    offset = 30
+    for _ in range(min(object_count, MAX_ELEMENTS)):
+        if offset + 24 > len(data):
+            break
+        object_id = data[offset:offset + 16]
+        object_size = struct.unpack('<Q', data[offset + 16:offset + 24])[0]
+        if object_size < 24:
+            break
+        if object_id == ASF_FILE_PROPERTIES and offset + 88 <= len(data):
+            play_duration, _, preroll = struct.unpack('<QQQ', data[offset + 64:offset + 88])
+            duration = max(0.0, play_duration / 1e7 - preroll / 1000)
+        elif (object_id == ASF_STREAM_PROPERTIES and data[offset + 24:offset + 40] == ASF_VIDEO_MEDIA
+              and offset + 109 <= len(data)):
+            # Type specific data: encoded width and height, then a BITMAPINFOHEADER
+            width, height = struct.unpack('<II', data[offset + 78:offset + 86])
+            codec = codec_name(data[offset + 105:offset + 109].decode('latin-1'))
+        offset += object_size
+    return width, height, duration, codec
+
+
+def probe_rm(reader):
+    """Return the (width, height, duration, codec) of a RealMedia (RMVB) file from its PROP and MDPR chunks"""
+    data = reader.read(0, BLOCK_SIZE)
+    if data[:4] != b'.RMF':
+        return None
+    duration = width = height = codec = None
+    offset = data.find(b'PROP')
+    if offset >= 0 and offset + 34 <= len(data):
+        duration = struct.unpack('>I', data[offset + 30:offset + 34])[0] / 1000
+    offset = data.find(b'VIDO')
+    if offset >= 0 and offset + 12 <= len(data):
+        codec = codec_name(data[offset + 4:offset + 8].decode('latin-1'))
+        width, height = struct.unpack('>HH', data[offset + 8:offset + 12])
+    return width, height, duration, codec
+
+
+# The probe and container name of each extension of file_clean.is_video_file
+PROBES = {
+    '.mp4': (probe_mp4, 'mp4'),
+    '.mov': (probe_mp4, 'mov'),
+    '.mkv': (probe_mkv, 'mkv'),
+    '.avi': (probe_avi, 'avi'),
+    '.flv': (probe_flv, 'flv'),
+    '.wmv': (probe_asf, 'asf'),
+    '.rmvb': (probe_rm, 'rm'),
+}
+
+
+def probe_reader(file_path, reader):
+    """Return the VideoInfo of a video file read through the reader, None if it can not be read"""
+    probe, container = PROBES.get(os.path.splitext(file_path)[1].lower(), (None, None))
+    if probe is None:
+        return None
+    try:
+        result = probe(reader)
+    except (OSError, struct.error, IndexError, ValueError, UnicodeDecodeError):
+        return None
+    if result is None:
+        return None
+
+    width, height, duration, codec = result
+    bitrate = int(reader.size * 8 / duration) if duration else None
+    return VideoInfo(container, width or None, height or None, duration or None, bitrate, codec)
+
+
+def probe_file(file_path, file_size=None, use_mmap=False):
+    """Return the VideoInfo of a video file from its container header, None if it can not be read
+
+    The file is read through a BlockReader, or memory-mapped with use_mmap=True (best on local disks),
+    either way only the header regions of the file are read.
+    """
+    if os.path.splitext(file_path)[1].lower() not in PROBES:
+        return None
+    try:
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        if not file_size:
+            return None
+        with open(file_path, 'rb') as file:
+            if use_mmap:
+                reader = MmapReader(file, file_size)
+                try:
+                    return probe_reader(file_path, reader)
+                finally:
+                    reader.close()
+            return probe_reader(file_path, BlockReader(file, file_size))
+    except OSError:
+        return None
+
+
+class ProbeCache:
+    """On-disk cache of the VideoInfo of the probed files, keyed by (path, size, mtime)
+
+    Loaded in full when opened, new results are written back in batches.
+    """
+
+    def __init__(self, db_path=os.path.join('./', 'log', 'probe_cache.db'), batch_size=1000):
+        db_folder = os.path.dirname(db_path)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS probes ("
+                                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, container TEXT, width INTEGER, "
+                                "height INTEGER, duration REAL, bitrate INTEGER, codec TEXT)")
+        self.batch_size = batch_size
+        self.entries = {}
+        for path, size, mtime, *info in self.connection.execute("SELECT * FROM probes"):
+            self.entries[path] = (size, mtime, VideoInfo(*info) if info[0] is not None else None)
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, file_path, file_size, mtime, use_mmap=False):
+        """Return the cached VideoInfo of the file, probe it if it is new or changed"""
+        cached = self.entries.get(file_path)
+        if cached is not None and cached[:2] == (file_size, mtime):
+            self.hits += 1
+            return cached[2]
+        self.misses += 1
+        info = probe_file(file_path, file_size, use_mmap)
+        self.entries[file_path] = (file_size, mtime, info)
+        self.pending.append((file_path, file_size, mtime) + (tuple(info) if info else (None,) * 6))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return info
+
+    def flush(self):
+        if self.pending:
+            self.connection.executemany("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        self.pending)
+            self.pending = []
+        self.connection.commit()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,169 @@
+import os
+import re
+from collections import namedtuple
+
+import file_ops
+import fingerprint
+
+# A rename or move whose target was taken, by a file already there or by the target of another
+# operation of the plan. resolution is 'suffix' (final is the suffixed target), 'duplicate' (the source
+# is a byte-identical copy of the file at the target and is deleted instead, final is None) or 'cycle'.
+Collision = namedtuple('Collision', ['src', 'dst', 'final', 'resolution'])
+
+# The temporary name a file of a rename cycle (A -> B, B -> A) is moved to first
+TEMP_SUFFIX = '.rename-tmp'
+
+# The policies of a taken target: always keep both files with a suffix, or delete the source when it
+# is a byte-identical copy of the file at the target
+POLICIES = ('suffix', 'dedup')
+
+# The suffix added by suffixed, e.g. " (1)" in SSNI-334-C (1).mp4
+_SUFFIX = re.compile(r' \(\d+\)(\.[^./]*)?$')
+
+
+def suffixed(path, number):
+    """Return the path with a number before its extension, e.g. SSNI-334-C.mp4 -> SSNI-334-C (1).mp4"""
+    body, extension = os.path.splitext(path)
+    return f"{body} ({number}){extension}"
+
+
+def unsuffixed(path):
+    """Return the path without the suffix added by suffixed"""
+    return _SUFFIX.sub(r'\1', path)
+
+
+def stays(op):
+    """Whether the operation leaves its file in place, already at its target or a suffix of it"""
+    return op.dst == op.src or unsuffixed(op.src) == op.dst
+
+
+def plan_renames(ops, policy='suffix', listings=None):
+    """Return the operations in a safe order with no target taken twice, and the Collisions found
+
+    The targets of the 'rename' and 'move' operations are indexed in a dict, with the names found in
+    their folders, each folder listed once, so the plan is checked in a single pass whatever its size:
+      - a target taken by a file already there, or by the target of an earlier operation, gets the
+        first free suffix (see suffixed). With the 'dedup' policy, a source of the same size and
+        content as the file at the target is deleted instead.
+      - a target that is the source of another operation (A -> B, B -> C) is free once that operation
+        has run, the chain is ordered backwards (B -> C, then A -> B).
+      - a cycle (A -> B, B -> A) is broken by moving its first file to a temporary name (TEMP_SUFFIX).
+    The 'delete' operations come first, they only free names. The order is kept within each chain by
+    file_ops.run_ops. A file already named with a suffix of its target (a copy suffixed by an earlier
+    run) stays where it is, so a second run on the same tree changes nothing. listings gives the names
+    of the folders already listed by the caller (folder path -> set of names), they are not listed again.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown collision policy '{policy}', expected one of {', '.join(POLICIES)}")
+    ops = list(ops)
+    deletes = [op for op in ops if op.action == 'delete']
+    moves = [op for op in ops if op.action != 'delete']
+    # The files deleted or moved away by the plan, their names are free once they have run
+    sources = set(op.src for op in deletes)
+    sources.update(op.src for op in moves if not stays(op))
+
+    listings = dict(listings or {})
+
+    def on_disk(path):
+        """Whether a file is at the path, from a single listing of its folder"""
+        dirpath, name = os.path.split(path)
+        names = listings.get(dirpath)
+        if names is None:
+            try:
+                with os.scandir(dirpath) as entries:
+                    names = listings[dirpath] = set(entry.name for entry in entries)
+            except OSError:
+                names = listings[dirpath] = set()
+        return name in names
+
+    # Target path -> source path of the file that ends up there
+    targets = {}
+    next_number = {}
+    collisions = []
+    planned = []
+    for op in moves:
+        if stays(op):
+            continue
+        final = op.dst
+        number = next_number.get(op.dst, 1)
+        while final in targets or (on_disk(final) and final not in sources and final != op.src):
+            if policy == 'dedup' and number == 1 and same_content(op.src, targets.get(final, final)):
+                final = None
+                break
+            final = suffixed(op.dst, number)
+            number += 1
+        next_number[op.dst] = number
+
+        if final is None:
+            collisions.append(Collision(op.src, op.dst, None, 'duplicate'))
+            planned.append(file_ops.FileOp('delete', op.src, None, op.check))
+            continue
+        if final != op.dst:
+            collisions.append(Collision(op.src, op.dst, final, 'suffix'))
+            op = op._replace(dst=final)
+        if final != op.src:
+            targets[final] = op.src
+            planned.append(op)
+
+    # freeing[i] is the operation moving away the file at the target of planned[i], which must run
+    # first, and waiting[i] the operation moving a file to the source of planned[i]
+    waiting = [None] * len(planned)
+    freeing = [None] * len(planned)
+    positions = {op.src: position for position, op in enumerate(planned)}
+    for position, op in enumerate(planned):
+        if op.dst is not None and op.dst in positions:
+            freeing[position] = positions[op.dst]
+            waiting[positions[op.dst]] = position
+
+    ordered = []
+    visited = [False] * len(planned)
+    for start in range(len(planned)):
+        if waiting[start] is not None or visited[start]:
+            continue
+        # Head of a chain, nothing moves onto its source: run the chain from its free end
+        chain = []
+        position = start
+        while position is not None:
+            visited[position] = True
+            chain.append(planned[position])
+            position = freeing[position]
+        ordered.extend(reversed(chain))
+
+    for start in range(len(planned)):
+        if visited[start]:
+            continue
+        # Only cycles are left, each one a rename chain back to its own start
+        cycle = []
+        position = start
+        while not visited[position]:
+            visited[position] = True
+            cycle.append(planned[position])
+            position = freeing[position]
+        first = cycle[0]
+        temp_path = first.src + TEMP_SUFFIX
+        collisions.append(Collision(first.src, first.dst, first.dst, 'cycle'))
+        ordered.append(first._replace(dst=temp_path))
+        ordered.extend(reversed(cycle[1:]))
+        ordered.append(first._replace(src=temp_path))
+
+    return deletes + ordered, collisions
+
+
+def same_content(path, other_path):
+    """Whether the two files have the same size and the same full hash"""
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+        return fingerprint.full_hash(path) == fingerprint.full_hash(other_path)
+    except OSError:
+        return False
+
+
+def describe(collision):
+    """Return the report line of a Collision"""
+    if collision.resolution == 'duplicate':
+        return f"(COLLISION) '{collision.src}' is a copy of '{collision.dst}', deleted"
+    elif collision.resolution == 'cycle':
+        return f"(CYCLE) '{collision.src}' -> '{collision.dst}' through '{collision.src}{TEMP_SUFFIX}'"
+    return f"(COLLISION) '{collision.src}' -> '{collision.dst}' is taken, renamed to '{collision.final}'"
+
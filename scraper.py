@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import asyncio
+import datetime
+from collections import namedtuple
+
+import metadata_cache
+
+# A file to scrape, MDC puts it in success_folder, or it is moved to failed_folder when scraping fails.
+# A linked job scrapes a reflink or hard link of a file left in place, deleted when scraping fails.
+ScrapeJob = namedtuple('ScrapeJob', ['path', 'success_folder', 'failed_folder', 'linked'], defaults=(False,))
+
+# The outcome of a ScrapeJob, status is 'done', 'failed' or 'timeout'. returncode and log_path are None
+# for a job done from the metadata cache, without MDC.
+ScrapeResult = namedtuple('ScrapeResult', ['job', 'status', 'returncode', 'elapsed', 'log_path'])
+
+
+def find_mdc(mdc_path):
+    """Return the MDC program path from the config, None if it does not exist"""
+    # The old config pointed to the folder holding mdc
+    if os.path.isdir(mdc_path):
+        mdc_path = os.path.join(mdc_path, 'mdc')
+    return mdc_path if os.path.isfile(mdc_path) else None
+
+
+def mdc_command(mdc_path, job):
+    """Return the command line scraping a single file with MDC"""
+    # A Python script (e.g. mdc_stub.py) is run with the current interpreter
+    command = [sys.executable, mdc_path] if mdc_path.endswith('.py') else [mdc_path]
+    return command + [job.path,
+                      '-C', f'common:success_output_folder={job.success_folder}',
+                      '-C', f'common:failed_output_folder={job.failed_folder}']
+
+
+def move_to_failed(job):
+    """Move the file of a failed job into its failed folder, if MDC has not already"""
+    if not os.path.exists(job.path):
+        return
+    if job.linked:
+        # The source is still in place, the next run tries again
+        os.remove(job.path)
+        return
+    os.makedirs(job.failed_folder, exist_ok=True)
+    os.rename(job.path, os.path.join(job.failed_folder, os.path.basename(job.path)))
+
+
+async def scrape_one(semaphore, mdc_path, job, timeout, log_folder, cache=None, index=0):
+    """Run MDC on one file, with its output written to a log file, and store what it wrote in the cache
+
+    index numbers the log file, two jobs can scrape files of the same name from different folders.
+    """
+    async with semaphore:
+        command = mdc_command(mdc_path, job)
+        start = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            # MDC could not be started, e.g. it is not executable
+            print(f"Failed to run MDC on '{job.path}': {e}")
+            process = None
+            stdout, stderr = b'', str(e).encode('utf-8')
+            status = 'failed'
+        else:
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+                status = 'done' if process.returncode == 0 else 'failed'
+            except asyncio.TimeoutError:
+                process.kill()
+                stdout, stderr = await process.communicate()
+                status = 'timeout'
+        elapsed = time.perf_counter() - start
+    returncode = process.returncode if process is not None else None
+
+    log_path = os.path.join(log_folder, f"{index:05d}_{os.path.basename(job.path)}.log")
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        log_file.write(f"Command: {command}\nStatus: {status}\nExit code: {returncode}\n"
+                       f"Elapsed: {elapsed:.1f} sec\n")
+        log_file.write("===================================== stdout =====================================\n")
+        log_file.write(stdout.decode('utf-8', errors='replace'))
+        log_file.write("\n===================================== stderr =====================================\n")
+        log_file.write(stderr.decode('utf-8', errors='replace'))
+
+    key = metadata_cache.movie_id(os.path.basename(job.path))
+    if cache is not None and key is not None and process is not None:
+        folder = metadata_cache.output_folder(stdout.decode('utf-8', errors='replace'))
+        if status == 'done' and folder is not None and os.path.isdir(folder):
+            cache.capture(key, folder, os.path.basename(job.path), job.success_folder)
+        elif status == 'failed':
+            # A timeout is not remembered, the next run tries again
+            cache.store_failure(key)
+
+    if status != 'done':
+        move_to_failed(job)
+    print(f"({status.upper()}) {os.path.basename(job.path)} in {elapsed:.1f} sec")
+    return ScrapeResult(job, status, returncode, elapsed, log_path)
+
+
+async def scrape_all(jobs, mdc_path, concurrency, timeout, log_folder, cache=None):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    return await asyncio.gather(*[scrape_one(semaphore, mdc_path, job, timeout, log_folder, cache, index)
+                                  for index, job in enumerate(jobs)])
+
+
+def scrape_cached(job, cache):
+    """Do a job from the metadata cache without MDC, return its ScrapeResult, None if it is not cached"""
+    key = metadata_cache.movie_id(os.path.basename(job.path))
+    metadata = cache.get(key) if key is not None else None
+    if metadata is None:
+        return None
+    start = time.perf_counter()
+    if metadata.status == 'failed':
+        move_to_failed(job)
+        status = 'failed'
+    else:
+        try:
+            cache.restore(metadata, job.path, job.success_folder)
+        except OSError as e:
+            print(f"Failed to organise '{job.path}' from the metadata cache, run MDC: {e}")
+            return None
+        status = 'done'
+    elapsed = time.perf_counter() - start
+    print(f"(CACHED {status.upper()}) {os.path.basename(job.path)} in {elapsed:.1f} sec")
+    return ScrapeResult(job, status, None, elapsed, None)
+
+
+def scrape_files(jobs, mdc_path, concurrency=4, timeout=600, log_folder=None, cache=None):
+    """Scrape the files with one MDC process each, at most concurrency processes at the same time
+
+    A process running longer than timeout seconds is killed. The stdout, stderr and exit code of every
+    process are written to log/mdc/<time>/<job number>_<file name>.log, and a file whose scraping failed
+    or timed out is moved to the failed folder of its job. Return one ScrapeResult per job.
+
+    With a cache (a metadata_cache.MetadataCache), a movie scraped or failed recently is organised
+    from the cache (or moved to the failed folder) without running MDC, and the output of each MDC
+    process is stored in the cache.
+    """
+    if log_folder is None:
+        current_time = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        log_folder = os.path.join('./', 'log', 'mdc', current_time)
+    os.makedirs(log_folder, exist_ok=True)
+
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    start = time.perf_counter()
+    results = [None] * len(jobs)
+    if cache is not None:
+        for index, job in enumerate(jobs):
+            results[index] = scrape_cached(job, cache)
+    pending = [index for index, result in enumerate(results) if result is None]
+    for index, result in zip(pending, asyncio.run(scrape_all([jobs[index] for index in pending], mdc_path,
+                                                             concurrency, timeout, log_folder, cache))):
+        results[index] = result
+    elapsed = time.perf_counter() - start
+
+    done = sum(1 for result in results if result.status == 'done')
+    print("===================================================================================================")
+    print(f"Scraped {done}/{len(results)} files in {elapsed:.1f} sec "
+          f"({len(results) / max(elapsed, 1e-9):.2f} files/s), {len(results) - done} moved to the failed folder. "
+          f"Logs in '{log_folder}'.")
+    if cache is not None:
+        print(f"Metadata cache: {len(jobs) - len(pending)} files organised without MDC, "
+              f"{cache.evicted} entries evicted.")
+    return results
@@ -0,0 +1,173 @@
+import os
+import random
+import sqlite3
+
+from walker import ScanEntry
+
+# Bump when the tables change, an older cache is dropped and rebuilt
+SCHEMA_VERSION = 3
+
+# In auto mode, one in this many unchanged folders, picked at random on every run, is listed
+# anyway to check the mount keeps the folder mtime up to date
+VERIFY_EVERY = 50
+
+
+class StatCache:
+    """On-disk cache of the per-file decisions of file_clean
+
+    Each row is keyed by path and only trusted while the (size, mtime, inode) of the file is the
+    same as when it was stored, and the decisions were made with the same profile (postfix flags and
+    junk filter settings). The rows under the scanned folder are bulk-loaded once, new results are
+    written back in batches, and the rows of the files that have disappeared are evicted after the scan.
+
+    The cache also keeps a snapshot of the mtime and entry count of every folder, so that walker.scan_tree
+    can skip listing the folders that have not changed since the last run. dir_mtime decides whether
+    the folder mtime is trusted: 'yes', 'no', or 'auto' to check it on a sample of the folders and stop
+    trusting the whole mount as soon as one unchanged mtime hides a changed listing.
+    """
+
+    def __init__(self, db_path=os.path.join('./', 'log', 'stat_cache.db'), batch_size=1000, dir_mtime='auto'):
+        db_folder = os.path.dirname(db_path)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+
+        # Used by one thread at a time, but not always the one that opened it (see pipeline.bounded)
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS files")
+            self.connection.execute("DROP TABLE IF EXISTS dirs")
+            self.connection.execute("DROP TABLE IF EXISTS untrusted_devices")
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                "path TEXT PRIMARY KEY, dirpath TEXT, name TEXT, size INTEGER, mtime REAL, "
+                                "inode INTEGER, profile TEXT, cleaned_name TEXT, verdict TEXT, reason TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS dirs ("
+                                "path TEXT PRIMARY KEY, mtime REAL, entry_count INTEGER, subdirs TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS untrusted_devices (device INTEGER PRIMARY KEY)")
+        self.batch_size = batch_size
+        self.dir_mtime = dir_mtime
+
+        # path -> (size, mtime, inode, profile, cleaned_name, verdict, dirpath, name, reason)
+        self.entries = {}
+        # dirpath -> set of the file paths in it
+        self.dir_index = {}
+        # dirpath -> (mtime, entry_count, subdirs)
+        self.dirs = {}
+        self.untrusted_devices = set(
+            device for (device,) in self.connection.execute("SELECT device FROM untrusted_devices"))
+        self.pending = []
+        self.pending_dirs = []
+        self.seen_dirs = set()
+        self.pruned_dirs = set()
+        self.verifying = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, folder_path):
+        """Bulk-load all cached rows and folder snapshots under the folder"""
+        cursor = self.connection.execute(
+            "SELECT path, size, mtime, inode, profile, cleaned_name, verdict, dirpath, name, reason FROM files "
+            "WHERE substr(path, 1, ?) = ?", (len(folder_path), folder_path))
+        for path, *row in cursor:
+            self.entries[path] = tuple(row)
+            self.dir_index.setdefault(row[6], set()).add(path)
+
+        cursor = self.connection.execute(
+            "SELECT path, mtime, entry_count, subdirs FROM dirs "
+            "WHERE substr(path, 1, ?) = ?", (len(folder_path), folder_path))
+        for path, mtime, entry_count, subdirs in cursor:
+            self.dirs[path] = (mtime, entry_count, subdirs.split('\0') if subdirs else [])
+
+    def lookup(self, entry, profile):
+        """Return the cached (cleaned_name, verdict, reason) of a ScanEntry, None if it is new or changed"""
+        cached = self.entries.get(entry.path)
+        if cached is None or cached[:4] != (entry.size, entry.mtime, entry.inode, profile):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached[4], cached[5], cached[8]
+
+    def store(self, entry, profile, cleaned_name, verdict, reason=None):
+        """Queue the decisions of a ScanEntry, written back once the batch is full"""
+        self.entries[entry.path] = (entry.size, entry.mtime, entry.inode, profile, cleaned_name, verdict,
+                                    entry.dirpath, entry.name, reason)
+        self.dir_index.setdefault(entry.dirpath, set()).add(entry.path)
+        self.pending.append((entry.path, entry.dirpath, entry.name, entry.size, entry.mtime, entry.inode,
+                             profile, cleaned_name, verdict, reason))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def cached_listing(self, dirpath, dir_stat):
+        """Return the (files, subdirs) of an unchanged folder from the snapshot, None to list it"""
+        self.seen_dirs.add(dirpath)
+        if self.dir_mtime == 'no' or dir_stat.st_dev in self.untrusted_devices:
+            return None
+        snapshot = self.dirs.get(dirpath)
+        # A zero mtime means the mount does not keep it at all
+        if snapshot is None or not dir_stat.st_mtime or snapshot[0] != dir_stat.st_mtime:
+            return None
+
+        mtime, entry_count, subdirs = snapshot
+        paths = self.dir_index.get(dirpath, set())
+        # The files of the folder must all still be cached, otherwise list it again
+        if len(paths) + len(subdirs) != entry_count:
+            return None
+
+        if self.dir_mtime == 'auto':
+            if random.randrange(VERIFY_EVERY) == 0:
+                self.verifying[dirpath] = (set(paths), subdirs)
+                return None
+
+        self.pruned_dirs.add(dirpath)
+        files = []
+        for path in paths:
+            size, mtime, inode, _, _, _, _, name, _ = self.entries[path]
+            files.append(ScanEntry(dirpath, name, path, size, mtime, inode))
+        return files, subdirs
+
+    def record_listing(self, dirpath, dir_stat, file_paths, subdirs):
+        """Snapshot the folder after it has been listed"""
+        expected = self.verifying.pop(dirpath, None)
+        if expected is not None and (expected[0] != set(file_paths) or expected[1] != subdirs):
+            # The folder changed but its mtime did not, do not trust the mtime on this mount any more
+            print(f"Folder mtime is not kept up to date on the mount of '{dirpath}', full listing is used.")
+            self.untrusted_devices.add(dir_stat.st_dev)
+            self.connection.execute("INSERT OR IGNORE INTO untrusted_devices VALUES (?)", (dir_stat.st_dev,))
+
+        entry_count = len(file_paths) + len(subdirs)
+        self.dirs[dirpath] = (dir_stat.st_mtime, entry_count, subdirs)
+        self.pending_dirs.append((dirpath, dir_stat.st_mtime, entry_count, '\0'.join(subdirs)))
+        if len(self.pending_dirs) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the queued rows back to the database"""
+        if self.pending:
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        self.pending)
+            self.pending = []
+        if self.pending_dirs:
+            self.connection.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", self.pending_dirs)
+            self.pending_dirs = []
+        self.connection.commit()
+
+    def evict(self, folder_path, seen_paths):
+        """Delete the rows under the folder whose path was not seen by the last scan"""
+        gone = [(path,) for path in self.entries
+                if path.startswith(folder_path) and path not in seen_paths]
+        for (path,) in gone:
+            self.dir_index.get(self.entries[path][6], set()).discard(path)
+            del self.entries[path]
+        self.connection.executemany("DELETE FROM files WHERE path = ?", gone)
+
+        gone_dirs = [(path,) for path in self.dirs
+                     if path.startswith(folder_path) and path not in self.seen_dirs]
+        for (path,) in gone_dirs:
+            del self.dirs[path]
+        self.connection.executemany("DELETE FROM dirs WHERE path = ?", gone_dirs)
+        self.connection.commit()
+        return len(gone)
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,37 @@
+import os
+import errno
+
+import clean
+import file_ops
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(b'\0' * size)
+
+
+def test_emptied_folders_removed_by_count(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / 'root'
+    write(str(root / 'a' / 'ad.txt'), 1)
+    write(str(root / 'a' / 'b' / 'sample.mp4'), 1)
+    write(str(root / 'c' / 'locked.txt'), 1)
+    write(str(root / 'd' / 'e' / 'movie.mp4'), 100)
+    (root / 'd' / 'empty').mkdir()
+
+    apply_op = file_ops.apply_op
+
+    def failing(op):
+        if op.src.endswith('locked.txt'):
+            raise OSError(errno.EACCES, 'Permission denied')
+        return apply_op(op)
+
+    monkeypatch.setattr(file_ops, 'apply_op', failing)
+    plan = clean.plan_clean(str(root), size_limit=10)
+    summary = clean.apply_clean(plan, workers=2)
+
+    # a/b empties a, d/e and d/empty empty d, c keeps the file that could not be deleted
+    assert (summary.done, summary.failed, summary.removed_dirs) == (3, 1, 5)
+    assert sorted(os.listdir(root)) == ['c', 'movie.mp4']
+    assert os.listdir(root / 'c') == ['locked.txt']
@@ -0,0 +1,24 @@
+import os
+
+import dedup
+import file_clean
+
+
+def unchanged(folder, file_name, size):
+    path = os.path.join(folder, file_name)
+    with open(path, 'wb') as file:
+        file.write(b'\0' * size)
+    return file_clean.PlannedChange('unchanged', folder, file_name, None, size, os.stat(path).st_mtime)
+
+
+def test_variants_are_not_duplicates(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    plan = (unchanged(str(tmp_path / 'a'), 'ABP-123-C.mp4', 2048),
+            unchanged(str(tmp_path / 'a'), 'ABP-123-U.mp4', 4096),
+            unchanged(str(tmp_path / 'b'), 'ABP-123-C.mp4', 1024))
+
+    resolved = dedup.resolve_duplicates(plan, [])
+    assert [change.action for change in resolved] == ['unchanged', 'unchanged', 'duplicate']
+    # The smaller C copy loses to the other C copy, not to the larger U copy
+    assert resolved[2].new_name == str(tmp_path / 'a' / 'ABP-123-C.mp4')
@@ -0,0 +1,127 @@
+import os
+
+import file_clean
+import journal
+import junk_filter
+import stat_cache
+import walker
+
+
+def change(folder, file_name, new_name):
+    file_stat = os.stat(os.path.join(folder, file_name))
+    return file_clean.PlannedChange('rename', folder, file_name, new_name, file_stat.st_size, file_stat.st_mtime)
+
+
+def test_collisions_resolved_in_the_plan(tmp_path):
+    (tmp_path / '[x]ABP-123.mp4').write_bytes(b'first')
+    (tmp_path / 'ABP123.mp4').write_bytes(b'second')
+    (tmp_path / 'abp-123.mp4').write_bytes(b'first')
+    plan = (change(str(tmp_path), '[x]ABP-123.mp4', 'ABP-123-C.mp4'),
+            change(str(tmp_path), 'ABP123.mp4', 'ABP-123-C.mp4'),
+            change(str(tmp_path), 'abp-123.mp4', 'ABP-123-C.mp4'))
+
+    resolved, collisions = file_clean.resolve_folder(plan)
+    assert [change.new_name for change in resolved] == ['ABP-123-C.mp4', 'ABP-123-C (1).mp4', 'ABP-123-C (2).mp4']
+    assert len(collisions) == 2
+    assert file_clean.resolve_folder(resolved)[1] == []
+
+
+def test_copy_of_the_target_becomes_a_duplicate(tmp_path):
+    (tmp_path / 'ABP-123-C.mp4').write_bytes(b'first')
+    (tmp_path / '[x]ABP-123.mp4').write_bytes(b'first')
+    (tmp_path / 'ABP123.mp4').write_bytes(b'second')
+    plan = (change(str(tmp_path), '[x]ABP-123.mp4', 'ABP-123-C.mp4'),
+            change(str(tmp_path), 'ABP123.mp4', 'ABP-123-C.mp4'))
+
+    resolved = list(file_clean.resolve_renames(plan, 'dedup'))
+    assert [change.action for change in resolved] == ['duplicate', 'rename']
+    assert resolved[0].new_name == str(tmp_path / 'ABP-123-C.mp4')
+    assert resolved[1].new_name == 'ABP-123-C (1).mp4'
+
+
+def test_resolved_one_folder_at_a_time(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    for folder in ('a', 'b'):
+        (tmp_path / folder / 'ABP123.mp4').write_bytes(b'first')
+        (tmp_path / folder / 'abp-123.mp4').write_bytes(b'second')
+    plan = [change(str(tmp_path / folder), file_name, 'ABP-123.mp4')
+            for folder in ('a', 'b') for file_name in ('ABP123.mp4', 'abp-123.mp4')]
+
+    found = []
+    resolved = list(file_clean.resolve_renames(plan, found=found))
+    assert [change.new_name for change in resolved] == ['ABP-123.mp4', 'ABP-123 (1).mp4'] * 2
+    assert len(found) == 2
+
+
+def test_apply_plan_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_clean, 'OPS_BATCH', 2)
+    for name in ('a.mp4', 'b.mp4', 'c.mp4', 'x.mp4', 'y.mp4', 'junk1.txt', 'junk2.txt', 'junk3.txt'):
+        (tmp_path / name).write_text(name)
+    folder = str(tmp_path)
+    # A chain (a -> b -> c -> d), a swap (x <-> y) and three deletions
+    plan = [change(folder, 'a.mp4', 'b.mp4'), change(folder, 'b.mp4', 'c.mp4'), change(folder, 'c.mp4', 'd.mp4'),
+            change(folder, 'x.mp4', 'y.mp4'), change(folder, 'y.mp4', 'x.mp4')]
+    plan += [change(folder, name, None)._replace(action='delete') for name in ('junk1.txt', 'junk2.txt', 'junk3.txt')]
+
+    run_journal = journal.Journal(folder=str(tmp_path / 'journal'))
+    counts = file_clean.apply_plan(plan, workers=2, journal=run_journal)
+    run_journal.close()
+
+    assert counts == {'done': 9, 'skipped': 0, 'failed': 0}
+    assert sorted(os.listdir(tmp_path)) == ['b.mp4', 'c.mp4', 'd.mp4', 'journal', 'x.mp4', 'y.mp4']
+    assert [(tmp_path / name).read_text() for name in ('b.mp4', 'c.mp4', 'd.mp4')] == ['a.mp4', 'b.mp4', 'c.mp4']
+    assert (tmp_path / 'x.mp4').read_text() == 'y.mp4'
+    assert sorted(file_clean.video_files_after(plan)) == [str(tmp_path / name) for name in
+                                                          ('b.mp4', 'c.mp4', 'd.mp4', 'x.mp4', 'y.mp4')]
+    # Every operation is journaled, the swap through its temporary name
+    state = journal.load(run_journal.run_id, str(tmp_path / 'journal'))
+    assert len(state.ops) == 9 and set(state.statuses.values()) == {'done'}
+
+
+def test_inbox_keeps_the_subtitles_of_a_release(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    (inbox / 'ABP123.mp4').write_bytes(b'\0' * 100)
+    (inbox / 'ABP-123.chs.srt').write_bytes(b'sub')
+    (inbox / 'ABP-123.txt').write_bytes(b'ad')
+    (inbox / 'XYZ-999.srt').write_bytes(b'sub')
+
+    plans = file_clean.plan_inbox(str(inbox), junk=junk_filter.JunkFilter(size_limit=10))
+    changes = dict((change.file_name, change) for plan in plans.values() for change in plan)
+    assert changes['ABP123.mp4'].new_name == 'ABP-123-C.mp4'
+    assert 'ABP-123.chs.srt' not in changes
+    # The other small files, a subtitle without its video included, are junk
+    assert changes['ABP-123.txt'].action == 'delete'
+    assert changes['XYZ-999.srt'].action == 'delete'
+
+
+def test_cached_rename_is_checked_again(tmp_path):
+    folder = tmp_path / 'movies'
+    folder.mkdir()
+    (folder / 'ABP123.mp4').write_bytes(b'\0' * 100)
+    junk = junk_filter.JunkFilter(size_limit=10)
+
+    def plan():
+        cache = stat_cache.StatCache(str(tmp_path / 'stat_cache.db'), dir_mtime='yes')
+        cache.load(str(folder))
+        changes = list(file_clean.plan_entries(walker.scan_tree(str(folder), snapshot=cache), False, True, False,
+                                               False, cache, junk=junk))
+        cache.flush()
+        cache.close()
+        return changes, cache
+
+    (change,), _ = plan()
+    assert (change.action, change.size) == ('rename', 100)
+
+    # Still downloading: the file grows, its folder mtime does not change
+    folder_stat = os.stat(folder)
+    with open(folder / 'ABP123.mp4', 'ab') as file:
+        file.write(b'\0' * 100)
+    os.utime(folder, ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns))
+
+    (change,), cache = plan()
+    assert str(folder) in cache.pruned_dirs
+    assert (change.action, change.size) == ('rename', 200)
+    assert change.mtime == os.stat(folder / 'ABP123.mp4').st_mtime
@@ -0,0 +1,82 @@
+import errno
+
+import pytest
+
+import file_ops
+
+
+def test_limit_shrinks_once_per_window():
+    limit = file_ops.AdaptiveLimit(initial=10, window=4)
+    for _ in range(2):
+        limit.acquire()
+    limit.release(0.01, failed=True)
+    assert limit.limit == 7
+    # A burst of failures in the same window only counts once
+    limit.release(0.01, failed=True)
+    assert limit.limit == 7
+    assert limit.lowest == 7
+
+
+def test_limit_grows_and_backs_off_on_latency():
+    limit = file_ops.AdaptiveLimit(initial=2, maximum=3, window=3)
+    for _ in range(3):
+        limit.acquire()
+        limit.release(0.01)
+    assert limit.limit == 3
+    # Capped at the maximum
+    for _ in range(3):
+        limit.acquire()
+        limit.release(0.01)
+    assert limit.limit == 3
+    # The median latency of the window is over twice the best one
+    for _ in range(3):
+        limit.acquire()
+        limit.release(0.05)
+    assert limit.limit == 2
+    assert limit.highest == 3
+
+
+def flaky(monkeypatch, failures, error=errno.EAGAIN):
+    """Make apply_op fail with the error the given number of times, then succeed"""
+    calls = []
+
+    def apply_op(op):
+        calls.append(op)
+        if len(calls) <= failures:
+            raise OSError(error, 'Resource temporarily unavailable')
+        return 'done', None
+
+    monkeypatch.setattr(file_ops, 'apply_op', apply_op)
+    return calls
+
+
+@pytest.mark.parametrize('error', [errno.EAGAIN, errno.EBUSY])
+def test_transient_error_is_tried_again(tmp_path, monkeypatch, error):
+    (tmp_path / 'a.mp4').write_bytes(b'a')
+    calls = flaky(monkeypatch, 2, error)
+    op = file_ops.FileOp('rename', str(tmp_path / 'a.mp4'), str(tmp_path / 'b.mp4'), None)
+
+    (result,) = file_ops.run_ops([op], workers=1, retries=3, retry_delay=0)
+    assert (result.status, result.attempts) == ('done', 3)
+    assert len(calls) == 3
+
+
+def test_retries_run_out(tmp_path, monkeypatch):
+    (tmp_path / 'a.mp4').write_bytes(b'a')
+    calls = flaky(monkeypatch, 10)
+    op = file_ops.FileOp('rename', str(tmp_path / 'a.mp4'), str(tmp_path / 'b.mp4'), None)
+
+    (result,) = file_ops.run_ops([op], workers=1, adaptive=True, retries=2, retry_delay=0)
+    assert (result.status, result.attempts) == ('failed', 3)
+    assert result.error.errno == errno.EAGAIN
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_tried_again(tmp_path, monkeypatch):
+    (tmp_path / 'a.mp4').write_bytes(b'a')
+    calls = flaky(monkeypatch, 1, errno.EACCES)
+    op = file_ops.FileOp('delete', str(tmp_path / 'a.mp4'), None, None)
+
+    (result,) = file_ops.run_ops([op], workers=1, retries=3, retry_delay=0)
+    assert (result.status, result.attempts) == ('failed', 1)
+    assert len(calls) == 1
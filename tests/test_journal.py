@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+import file_ops
+import journal
+import rename_planner
+
+
+def write(path, content):
+    with open(path, 'w') as file:
+        file.write(content)
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+def plan_swap(folder):
+    """Plan a chain and a rename cycle (X <-> Y) in the folder"""
+    write(os.path.join(folder, 'a1.mp4'), 'a1')
+    write(os.path.join(folder, 'a2.mp4'), 'a2')
+    write(os.path.join(folder, 'X.mp4'), 'X')
+    write(os.path.join(folder, 'Y.mp4'), 'Y')
+    ops = [file_ops.FileOp('rename', os.path.join(folder, 'a1.mp4'), os.path.join(folder, 'a2.mp4'), None),
+           file_ops.FileOp('rename', os.path.join(folder, 'a2.mp4'), os.path.join(folder, 'a3.mp4'), None),
+           file_ops.FileOp('rename', os.path.join(folder, 'X.mp4'), os.path.join(folder, 'Y.mp4'), None),
+           file_ops.FileOp('rename', os.path.join(folder, 'Y.mp4'), os.path.join(folder, 'X.mp4'), None)]
+    ordered, collisions = rename_planner.plan_renames(ops)
+    assert [collision.resolution for collision in collisions] == ['cycle']
+    return ordered
+
+
+def crash(folder, journal_folder, ordered, ran):
+    """Journal the operations, run the first ran of them and die before the outcome of the last one"""
+    run = journal.Journal(folder=journal_folder)
+    first = run.plan(ordered)
+    for seq, op in enumerate(ordered[:ran], first):
+        assert file_ops.apply_op(op) == ('done', None)
+        if seq < first + ran - 1:
+            run.record(seq, 'done')
+    run.close()
+    return run.run_id
+
+
+def check_applied(folder):
+    assert sorted(os.listdir(folder)) == ['X.mp4', 'Y.mp4', 'a2.mp4', 'a3.mp4']
+    assert read(os.path.join(folder, 'a2.mp4')) == 'a1'
+    assert read(os.path.join(folder, 'a3.mp4')) == 'a2'
+    assert read(os.path.join(folder, 'X.mp4')) == 'Y'
+    assert read(os.path.join(folder, 'Y.mp4')) == 'X'
+
+
+def test_resume_before_cycle(tmp_path):
+    folder = str(tmp_path / 'movies')
+    os.makedirs(folder)
+    ordered = plan_swap(folder)
+    run_id = crash(folder, str(tmp_path / 'journal'), ordered, 0)
+
+    journal.resume(run_id, workers=2, folder=str(tmp_path / 'journal'))
+    check_applied(folder)
+
+
+def test_resume_within_cycle(tmp_path):
+    folder = str(tmp_path / 'movies')
+    os.makedirs(folder)
+    ordered = plan_swap(folder)
+    # Up to the move of the first file of the cycle to its temporary name
+    ran = next(index for index, op in enumerate(ordered) if op.dst.endswith(rename_planner.TEMP_SUFFIX)) + 1
+    run_id = crash(folder, str(tmp_path / 'journal'), ordered, ran)
+
+    journal.resume(run_id, workers=2, folder=str(tmp_path / 'journal'))
+    check_applied(folder)
+    state = journal.load(run_id, str(tmp_path / 'journal'))
+    assert state.finished
+    assert all(state.statuses[seq] == 'done' for seq in state.ops)
+
+
+def test_new_runs_never_share_a_journal(tmp_path):
+    journal_folder = str(tmp_path / 'journal')
+    runs = [journal.Journal(folder=journal_folder) for _ in range(3)]
+    for run in runs:
+        run.close()
+    assert len(set(run.run_id for run in runs)) == 3
+
+    with pytest.raises(FileExistsError):
+        journal.Journal(runs[0].run_id, journal_folder)
+
+
+def test_only_the_last_end_counts(tmp_path):
+    journal_folder = str(tmp_path / 'journal')
+    op = file_ops.FileOp('delete', str(tmp_path / 'a.mp4'), None, None)
+    run = journal.Journal(folder=journal_folder)
+    run.plan([op])
+    run.record(0, 'done')
+    run.end()
+    run.close()
+    assert journal.load(run.run_id, journal_folder).finished
+
+    # More operations written after the end, by a run that died before its own end
+    run = journal.Journal(run.run_id, journal_folder, resume=True)
+    assert run.plan([op]) == 1
+    run.close()
+    assert not journal.load(run.run_id, journal_folder).finished
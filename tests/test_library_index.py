@@ -0,0 +1,47 @@
+import os
+
+import file_clean
+import library_index
+
+
+def index_library(tmp_path, name):
+    folder = tmp_path / 'dest' / 'actor' / 'SSNI-888'
+    os.makedirs(folder)
+    (folder / name).write_bytes(b'\0' * 1024)
+    library = library_index.LibraryIndex(str(tmp_path / 'library.db'))
+    library.refresh(str(tmp_path / 'dest'))
+    return library, str(folder / name)
+
+
+def change(file_name, new_name):
+    return file_clean.PlannedChange('rename', '/downloads', file_name, new_name, 1024, 0.0)
+
+
+def test_cd_part_keeps_its_variant(tmp_path):
+    library, path = index_library(tmp_path, 'SSNI-888-CD2-C.mp4')
+    (entry,) = library.lookup('SSNI-888-CD2')
+    assert entry.path == path
+    assert entry.variant == 'c'
+    library.close()
+
+
+def test_owned_cd_part(tmp_path):
+    library, path = index_library(tmp_path, 'SSNI-888-CD2-C.mp4')
+    plan = (change('ssni888-cd2-C.mp4', 'SSNI-888-cd2-C.mp4'),
+            change('ssni888-cd2.mp4', 'SSNI-888-cd2.mp4'),
+            change('ssni888-cd1-C.mp4', 'SSNI-888-cd1-C.mp4'))
+    new_plan, owned = library_index.find_owned(plan, library, 'skip')
+    assert owned == 1
+    assert new_plan[0].action == 'owned' and new_plan[0].new_name == path
+    assert new_plan[1].action == 'rename' and 'another variant' in new_plan[1].reason
+    assert new_plan[2] == plan[2]
+    library.close()
+
+
+def test_variant_read_again_when_loaded(tmp_path):
+    library, path = index_library(tmp_path, 'SSNI-888-CD2-C.mp4')
+    library.connection.execute("UPDATE library SET variant = 'no'")
+    library.close()
+    library = library_index.LibraryIndex(str(tmp_path / 'library.db'))
+    assert library.lookup('SSNI-888-CD2')[0].variant == 'c'
+    library.close()
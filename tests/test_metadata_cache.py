@@ -0,0 +1,32 @@
+import metadata_cache
+
+
+def test_movie_id_keeps_cd_and_variant():
+    assert metadata_cache.movie_id('ssni334-C-cd1.mp4') == 'SSNI-334-CD1-C'
+    assert metadata_cache.movie_id('SSNI-334-cd2-hack-c.mp4') == 'SSNI-334-CD2-hack-c'
+    assert metadata_cache.movie_id('SSNI-334.mp4') == 'SSNI-334'
+    assert metadata_cache.movie_id('holiday.mp4') is None
+
+
+def test_restore_names_the_nfo_after_the_file(tmp_path):
+    success = tmp_path / 'success'
+    folder = success / 'SSNI-334-C'
+    folder.mkdir(parents=True)
+    (folder / 'SSNI-334-C.mp4').write_bytes(b'movie')
+    (folder / 'SSNI-334-C.nfo').write_text('<movie><num>SSNI-334-C</num><poster>SSNI-334-C-poster.jpg</poster></movie>')
+    (folder / 'SSNI-334-C-poster.jpg').write_bytes(b'poster')
+    cache = metadata_cache.MetadataCache(str(tmp_path / 'cache.db'))
+    key = metadata_cache.movie_id('SSNI-334-C.mp4')
+    assert cache.capture(key, str(folder), 'SSNI-334-C.mp4', str(success))
+
+    source = tmp_path / 'SSNI-0334-C.mp4'
+    source.write_bytes(b'movie')
+    assert metadata_cache.movie_id(source.name) == key
+    target = cache.restore(cache.get(key), str(source), str(success))
+    restored = success / 'SSNI-0334-C'
+    assert target == str(restored / 'SSNI-0334-C.mp4')
+    assert sorted(path.name for path in restored.iterdir()) == [
+        'SSNI-0334-C-poster.jpg', 'SSNI-0334-C.mp4', 'SSNI-0334-C.nfo']
+    assert (restored / 'SSNI-0334-C.nfo').read_text() == (
+        '<movie><num>SSNI-0334-C</num><poster>SSNI-0334-C-poster.jpg</poster></movie>')
+    cache.close()
@@ -0,0 +1,25 @@
+import pytest
+
+import normalizer
+
+
+@pytest.mark.parametrize('name, mode', [
+    ('SSNI-888-CD2-C.mp4', 'c'),
+    ('SSNI-888-CD2-U.mp4', 'u'),
+    ('SSNI-888-CD2-UC.mp4', 'uc'),
+    ('SSNI-888-cd2-hack.mp4', 'u'),
+    ('SSNI-888-cd2-hack-c.mp4', 'uc'),
+    ('SSNI-888-C-cd2.mp4', 'c'),
+    ('SSNI888C-cd2.mp4', 'c'),
+    ('SSNI-888-2-C.mp4', 'c'),
+    ('SSNI-888-CD2.mp4', 'no'),
+])
+def test_infer_mode_with_cd(name, mode):
+    assert normalizer.infer_mode(name) == mode
+
+
+@pytest.mark.parametrize('mode', ['c', 'no', 'u', 'uc'])
+def test_clean_name_keeps_its_mode(mode):
+    name = normalizer.normalize('232[233.com]SSNI334-cd2.mp4', mode)
+    assert normalizer.infer_mode(name) == mode
+    assert normalizer.parse(name).cd == 'cd2'
@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+import pipeline
+from file_clean import PlannedChange
+
+
+def test_bounded_raises_the_producer_error():
+    def produce():
+        yield 1
+        yield 2
+        raise ValueError('walk failed')
+
+    consumed = []
+    with pytest.raises(ValueError, match='walk failed'):
+        for item in pipeline.bounded(produce()):
+            consumed.append(item)
+    assert consumed == [1, 2]
+
+
+def test_bounded_holds_the_producer_back():
+    produced = []
+
+    def produce():
+        for item in range(10000):
+            produced.append(item)
+            yield item
+
+    maxsize = 2 * pipeline.CHUNK_SIZE
+    items = pipeline.bounded(produce(), maxsize)
+    assert next(items) == 0
+    time.sleep(0.5)
+    # The chunk being read, the chunks in the queue and the one waiting to be put
+    assert len(produced) <= maxsize + 2 * pipeline.CHUNK_SIZE
+    items.close()
+    assert len(produced) < 10000
+
+
+def test_plan_spool_round_trip(tmp_path):
+    plan = [PlannedChange('rename', '/movies', 'abp123.mp4', 'ABP-123.mp4', 1024, 1.5, '2:00:00'),
+            PlannedChange('delete', '/movies', 'ad.mp4', None, 10, 2.0)]
+    spool = pipeline.PlanSpool(str(tmp_path))
+    spool.extend(plan)
+    assert len(spool) == 2
+    assert list(spool) == plan
+    # Read again, and after more changes
+    spool.append(plan[0])
+    assert list(spool) == plan + plan[:1]
+
+    path = spool.path
+    del spool
+    assert not os.path.exists(path)
+
+
+def test_chained_plans_read_twice(tmp_path):
+    first = pipeline.PlanSpool(str(tmp_path))
+    first.extend([1, 2])
+    chained = pipeline.ChainedPlans([first, (3,)])
+    assert len(chained) == 3
+    assert list(chained) == list(chained) == [1, 2, 3]
@@ -0,0 +1,23 @@
+import os
+
+import records
+
+
+def test_table_round_trip():
+    table = records.RecordTable()
+    table.add('/archive/a', 'SSNI-334.mp4', 1024, 1700000000.5)
+    table.add('/archive/b', 'sample.mp4', None, None, 'delete')
+    table.add('/archive/a', os.fsdecode(b'caf\xe9.mp4'), 7, 1.0, 'move', '/archive/café.mp4')
+    table.add('/archive/b', '', 0, 0.0, 'rename', 'x.mp4')
+
+    assert len(table) == 4
+    assert len(table.dirs) == 2
+    first, second, third, fourth = table
+    assert (first.name, first.size, first.mtime, first.action, first.target) == (
+        'SSNI-334.mp4', 1024, 1700000000.5, 'unchanged', None)
+    assert (second.size, second.mtime, second.action) == (None, None, 'delete')
+    assert os.fsencode(third.name) == b'caf\xe9.mp4'
+    assert third.target == '/archive/café.mp4'
+    assert (fourth.name, fourth.target) == ('', 'x.mp4')
+    assert table.path(first) == '/archive/a/SSNI-334.mp4'
+    assert [record.name for record in table.with_action('move')] == [third.name]
@@ -0,0 +1,57 @@
+import os
+
+import file_ops
+import rename_planner
+
+
+def rename(folder, name, new_name):
+    return file_ops.FileOp('rename', str(folder / name), str(folder / new_name), None)
+
+
+def apply(ops):
+    for op in ops:
+        assert file_ops.apply_op(op) == ('done', None)
+
+
+def test_chain_runs_from_its_free_end(tmp_path):
+    for name in ('a', 'b', 'c'):
+        (tmp_path / name).write_text(name)
+    ops, collisions = rename_planner.plan_renames([rename(tmp_path, 'a', 'b'), rename(tmp_path, 'b', 'c'),
+                                                   rename(tmp_path, 'c', 'd')])
+    assert collisions == []
+    assert [os.path.basename(op.src) for op in ops] == ['c', 'b', 'a']
+
+    apply(ops)
+    assert sorted(os.listdir(tmp_path)) == ['b', 'c', 'd']
+    assert [(tmp_path / name).read_text() for name in ('b', 'c', 'd')] == ['a', 'b', 'c']
+
+
+def test_swap_through_a_temporary_name(tmp_path):
+    (tmp_path / 'a').write_text('a')
+    (tmp_path / 'b').write_text('b')
+    ops, collisions = rename_planner.plan_renames([rename(tmp_path, 'a', 'b'), rename(tmp_path, 'b', 'a')])
+    assert [collision.resolution for collision in collisions] == ['cycle']
+    assert ops[0].dst == str(tmp_path / 'a') + rename_planner.TEMP_SUFFIX
+    assert ops[-1].src == ops[0].dst
+
+    apply(ops)
+    assert sorted(os.listdir(tmp_path)) == ['a', 'b']
+    assert (tmp_path / 'a').read_text() == 'b'
+    assert (tmp_path / 'b').read_text() == 'a'
+
+
+def test_suffix_against_a_file_on_disk(tmp_path):
+    (tmp_path / 'ABP-123-C.mp4').write_text('there')
+    (tmp_path / 'ABP-123-C (1).mp4').write_text('there too')
+    (tmp_path / 'abp123.mp4').write_text('new')
+    ops, collisions = rename_planner.plan_renames([rename(tmp_path, 'abp123.mp4', 'ABP-123-C.mp4')])
+    assert collisions == [rename_planner.Collision(str(tmp_path / 'abp123.mp4'), str(tmp_path / 'ABP-123-C.mp4'),
+                                                   str(tmp_path / 'ABP-123-C (2).mp4'), 'suffix')]
+
+    apply(ops)
+    assert (tmp_path / 'ABP-123-C (2).mp4').read_text() == 'new'
+    assert (tmp_path / 'ABP-123-C.mp4').read_text() == 'there'
+
+    # A second run leaves the suffixed copy where it is
+    again = rename(tmp_path, 'ABP-123-C (2).mp4', 'ABP-123-C.mp4')
+    assert rename_planner.plan_renames([again]) == ([], [])
@@ -0,0 +1,23 @@
+import os
+
+import scraper
+
+
+def test_mdc_that_can_not_start(tmp_path):
+    mdc_path = tmp_path / 'mdc'
+    mdc_path.write_text('not a program')
+    folders = [tmp_path / 'a', tmp_path / 'b']
+    jobs = []
+    for folder in folders:
+        folder.mkdir()
+        (folder / 'SSNI-334.mp4').write_bytes(b'movie')
+        jobs.append(scraper.ScrapeJob(str(folder / 'SSNI-334.mp4'), str(tmp_path / 'dest'), str(folder / 'failed')))
+
+    results = scraper.scrape_files(jobs, str(mdc_path), log_folder=str(tmp_path / 'logs'))
+    assert [result.status for result in results] == ['failed', 'failed']
+    assert all(result.returncode is None for result in results)
+    # One log per job, whatever the file names
+    assert len(set(result.log_path for result in results)) == 2
+    assert all(os.path.isfile(result.log_path) for result in results)
+    for folder in folders:
+        assert os.listdir(folder / 'failed') == ['SSNI-334.mp4']
@@ -0,0 +1,94 @@
+import os
+import errno
+import threading
+import time
+
+import transfer
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def read(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def test_copy_resumed_from_the_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, 'CHUNK_SIZE', 1024)
+    content = os.urandom(10 * 1024)
+    src, dst = str(tmp_path / 'src.mp4'), str(tmp_path / 'dest' / 'src.mp4')
+    write(src, content)
+    mtime = os.stat(src).st_mtime
+    # An interrupted run synced the first 4 KB, and wrote some more after its last record
+    write(dst + transfer.PART_SUFFIX, content[:6 * 1024])
+    journal = transfer.TransferJournal(str(tmp_path / 'transfers.db'))
+    journal.record(src, dst, len(content), mtime, 4 * 1024)
+
+    assert transfer.copy_file(src, dst, transfer.TokenBucket(), journal) == 4 * 1024
+    assert read(dst) == content
+    assert not os.path.exists(dst + transfer.PART_SUFFIX)
+    assert journal.copied(src, dst, len(content), mtime) == 0
+    journal.close()
+
+
+def test_changed_source_is_copied_again(tmp_path):
+    content = os.urandom(4096)
+    src, dst = str(tmp_path / 'src.mp4'), str(tmp_path / 'dest' / 'src.mp4')
+    write(src, content)
+    write(dst + transfer.PART_SUFFIX, b'\0' * 2048)
+    journal = transfer.TransferJournal(str(tmp_path / 'transfers.db'))
+    journal.record(src, dst, len(content), os.stat(src).st_mtime - 60, 2048)
+
+    assert transfer.copy_file(src, dst, transfer.TokenBucket(), journal) == 0
+    assert read(dst) == content
+    journal.close()
+
+
+def test_copy_verified_before_it_takes_the_name(tmp_path, monkeypatch):
+    src, dst = str(tmp_path / 'src.mp4'), str(tmp_path / 'dest' / 'src.mp4')
+    write(src, os.urandom(4096))
+
+    def corrupt(src_fd, dst_fd, offset, size, bucket):
+        os.pwrite(dst_fd, b'\0' * size, 0)
+        yield size
+
+    def cross_mount(src_path, dst_path):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    # Another mount: the rename fails and the file is copied, badly
+    monkeypatch.setattr(transfer, 'copy_range', corrupt)
+    monkeypatch.setattr(os, 'rename', cross_mount)
+    result = transfer.move_file(src, dst)
+    assert (result.strategy, result.status) == ('copy', 'failed')
+    assert result.error.errno == errno.EIO
+    assert os.path.exists(src)
+    assert not os.path.exists(dst) and not os.path.exists(dst + transfer.PART_SUFFIX)
+
+
+def test_taken_target_is_a_conflict(tmp_path, capsys):
+    staging, dest = str(tmp_path / 'organising'), str(tmp_path / 'dest')
+    write(os.path.join(staging, 'ABP-123', 'ABP-123.mp4'), b'new')
+    write(os.path.join(staging, 'ABP-123', 'ABP-123.nfo'), b'same')
+    write(os.path.join(dest, 'ABP-123', 'ABP-123.mp4'), b'old')
+    write(os.path.join(dest, 'ABP-123', 'ABP-123.nfo'), b'same')
+
+    results = transfer.transfer_tree(staging, dest)
+    assert sorted((os.path.basename(result.src), result.status) for result in results) == [
+        ('ABP-123.mp4', 'skipped'), ('ABP-123.nfo', 'done')]
+    assert os.listdir(os.path.join(staging, 'ABP-123')) == ['ABP-123.mp4']
+    assert read(os.path.join(dest, 'ABP-123', 'ABP-123.mp4')) == b'old'
+    assert '(CONFLICT)' in capsys.readouterr().out
+
+
+def test_bucket_not_locked_while_waiting():
+    bucket = transfer.TokenBucket(10)
+    waiting = threading.Thread(target=bucket.consume, args=(10,))
+    waiting.start()
+    time.sleep(0.1)
+    assert bucket.lock.acquire(timeout=0.2)
+    bucket.lock.release()
+    waiting.join()
@@ -0,0 +1,34 @@
+import watcher
+
+
+def follow(events, sizes, debounce=5, stable=30):
+    """Run settle once a second over the sizes of a file, return the second it is handed over at"""
+    seen = None
+    for now, size in enumerate(sizes):
+        last_event = max(event for event in events if event <= now)
+        verdict, seen = watcher.settle(last_event, seen, size, now, debounce, stable)
+        if verdict != 'wait':
+            return verdict, now
+    return 'wait', None
+
+
+def test_ready_once_quiet_and_stable():
+    # One event at 0, the size never changes: quiet at 5, first size at 5, stable at 35
+    assert follow([0], [100] * 60) == ('ready', 35)
+
+
+def test_new_events_push_the_debounce_back():
+    # Stable since 5, but an event at 32 is only quiet at 37
+    assert follow([0, 10, 32], [100] * 60) == ('ready', 37)
+
+
+def test_growing_file_waits_for_its_size():
+    # Still downloading without events (e.g. a mount that does not report them) until 20
+    sizes = [size * 10 for size in range(20)] + [200] * 40
+    assert follow([0], sizes) == ('ready', 50)
+
+
+def test_gone_file_is_dropped():
+    assert follow([0], [100] * 8 + [None] * 10) == ('gone', 8)
+    # Gone then back within the debounce is no different from never gone
+    assert follow([0], [None] * 3 + [100] * 50) == ('ready', 35)
@@ -0,0 +1,349 @@
+import os
+import time
+import fcntl
+import errno
+import shutil
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import walker
+import fingerprint
+
+# The folder of a source folder where MDC organises the files of a section whose dest is on another
+# mount, before they are transferred to the dest by transfer_tree
+STAGING_FOLDER = 'organising'
+
+# A copy in progress is written next to its target under this suffix, renamed once verified
+PART_SUFFIX = '.part'
+
+# Bytes copied per system call, and between two fsyncs recorded in the journal
+CHUNK_SIZE = 8 * 1024 * 1024
+JOURNAL_INTERVAL = 256 * 1024 * 1024
+
+# The errors of copy_file_range telling it can not copy between these two files, sendfile is used instead
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+# The ioctl making a file a copy-on-write clone of another on btrfs/XFS (FICLONE of linux/fs.h)
+FICLONE = 0x40049409
+
+# The organise modes: MDC moves the source files, or a reflink or hard link of each one, the source
+# tree is then left intact (e.g. still seeded)
+ORGANISE_MODES = ('move', 'reflink', 'hardlink')
+
+# The errors telling a reflink or a hard link can not be made between these two paths
+LINK_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EPERM,
+                           errno.EMLINK}
+
+# The outcome of a transfer. strategy is 'rename' (same mount), 'copy', or 'existing' (the target was
+# already a copy of the source, which is deleted), status is 'done', 'skipped' or 'failed', resumed is
+# the number of bytes a copy found already done by an interrupted run.
+TransferResult = namedtuple('TransferResult', ['src', 'dst', 'strategy', 'status', 'error', 'size', 'resumed',
+                                               'elapsed'])
+
+
+class TokenBucket:
+    """Global limit of the bytes per second copied by all the transfers, rate 0 means no limit
+
+    Each copy takes its chunk from the bucket before writing it, the bucket refills at rate bytes per
+    second up to one second of burst.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # A chunk larger than the burst only has to wait for a full bucket
+                needed = min(amount, self.rate)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            # Wait outside the lock, the other copies can check the bucket meanwhile
+            time.sleep(wait)
+
+
+class TransferJournal:
+    """On-disk record of the copies in progress, keyed by source path
+
+    A row gives the target, the (size, mtime) of the source and the bytes copied and synced to the
+    part file, a copy interrupted by a crash or a dropped mount goes on from there on the next run.
+    The row is deleted once the copy is verified.
+    """
+
+    def __init__(self, db_path=os.path.join('./', 'log', 'transfers.db')):
+        db_folder = os.path.dirname(db_path)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS transfers ("
+                                "src TEXT PRIMARY KEY, dst TEXT, size INTEGER, mtime REAL, copied INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS organised ("
+                                "src TEXT PRIMARY KEY, size INTEGER, mtime REAL, strategy TEXT)")
+        self.lock = threading.Lock()
+
+    def copied(self, src, dst, size, mtime):
+        """Return the bytes already copied of the source to the target, 0 if the source has changed"""
+        with self.lock:
+            row = self.connection.execute("SELECT dst, size, mtime, copied FROM transfers WHERE src = ?",
+                                          (src,)).fetchone()
+        if row is None or row[:3] != (dst, size, mtime):
+            return 0
+        return row[3]
+
+    def record(self, src, dst, size, mtime, copied):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?, ?)",
+                                    (src, dst, size, mtime, copied))
+            self.connection.commit()
+
+    def remove(self, src):
+        with self.lock:
+            self.connection.execute("DELETE FROM transfers WHERE src = ?", (src,))
+            self.connection.commit()
+
+    def organised(self, src, size, mtime):
+        """Whether the source, unchanged, was already organised by a reflink or a hard link"""
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime FROM organised WHERE src = ?", (src,)).fetchone()
+        return row == (size, mtime)
+
+    def mark_organised(self, src, size, mtime, strategy):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO organised VALUES (?, ?, ?, ?)",
+                                    (src, size, mtime, strategy))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def same_mount(path, other_path):
+    """Whether a rename can move a file from path to other_path, the nearest existing folders are compared"""
+    devices = []
+    for folder in (path, other_path):
+        folder = os.path.abspath(folder)
+        while not os.path.exists(folder):
+            folder = os.path.dirname(folder)
+        devices.append(os.stat(folder).st_dev)
+    return devices[0] == devices[1]
+
+
+def reflink(src, dst):
+    """Make dst a copy-on-write clone of src with the FICLONE ioctl, no data is copied"""
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        except OSError:
+            os.close(dst_fd)
+            os.remove(dst)
+            raise
+        os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+
+
+def link_file(src, dst, mode):
+    """Make dst a reflink ('reflink' mode) or a hard link ('hardlink' mode) of src, which stays in place
+
+    Return the strategy used, or None when the filesystem can not link these two paths (another mount,
+    no reflink support...), the caller then falls back to moving the file. A dst left by an earlier run
+    is replaced.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        if mode == 'reflink':
+            reflink(src, dst)
+        else:
+            os.link(src, dst)
+    except OSError as e:
+        if e.errno in LINK_UNSUPPORTED_ERRNOS:
+            return None
+        raise
+    return mode
+
+
+def copy_range(src_fd, dst_fd, offset, size, bucket):
+    """Copy the bytes of src_fd from offset to size into dst_fd at the same offsets, in the kernel
+
+    os.copy_file_range is tried first (a server-side copy on NFS/SMB, a reflink on btrfs/XFS), then
+    os.sendfile, then reads and writes as a last resort. Yield the offset reached after each chunk.
+    """
+    method = 'copy_file_range' if hasattr(os, 'copy_file_range') else 'sendfile'
+    while offset < size:
+        count = min(CHUNK_SIZE, size - offset)
+        bucket.consume(count)
+        try:
+            if method == 'copy_file_range':
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            elif method == 'sendfile':
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+            else:
+                copied = os.pwrite(dst_fd, os.pread(src_fd, count, offset), offset)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS or method == 'pwrite':
+                raise
+            method = 'sendfile' if method == 'copy_file_range' else 'pwrite'
+            continue
+        if not copied:
+            raise OSError(errno.EIO, f"source ended at {offset} of {size} bytes")
+        offset += copied
+        yield offset
+
+
+def copy_file(src, dst, bucket, journal=None):
+    """Copy src to dst through a part file, resumed from the journal, return the bytes resumed
+
+    The copy is verified by size and fingerprint.partial_hash before the part file takes the name
+    dst, with the mode and times of src. The source is left in place.
+    """
+    src_stat = os.stat(src)
+    size = src_stat.st_size
+    part_path = dst + PART_SUFFIX
+    resumed = 0
+    if journal is not None and os.path.exists(part_path):
+        resumed = min(journal.copied(src, dst, size, src_stat.st_mtime), os.path.getsize(part_path))
+
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            # Only the bytes synced before the interruption are trusted
+            os.ftruncate(dst_fd, resumed)
+            synced = resumed
+            for offset in copy_range(src_fd, dst_fd, resumed, size, bucket):
+                if journal is not None and offset - synced >= JOURNAL_INTERVAL:
+                    os.fsync(dst_fd)
+                    journal.record(src, dst, size, src_stat.st_mtime, offset)
+                    synced = offset
+            os.fsync(dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    if (os.path.getsize(part_path) != size
+            or fingerprint.partial_hash(part_path, size) != fingerprint.partial_hash(src, size)):
+        os.remove(part_path)
+        if journal is not None:
+            journal.remove(src)
+        raise OSError(errno.EIO, "the copy differs from the source")
+    shutil.copystat(src, part_path)
+    os.rename(part_path, dst)
+    if journal is not None:
+        journal.remove(src)
+    return resumed
+
+
+def move_file(src, dst, bucket=None, journal=None):
+    """Move a file, with a rename on the same mount or a verified copy then a delete of the source
+
+    Return the TransferResult. An existing target is never replaced: when it is a copy of the source
+    (same size and partial hash), the source is deleted, otherwise the transfer is skipped.
+    """
+    if bucket is None:
+        bucket = TokenBucket()
+    start = time.perf_counter()
+    strategy = 'rename'
+    size = resumed = 0
+    try:
+        size = os.path.getsize(src)
+        if os.path.lexists(dst):
+            if (os.path.getsize(dst) == size
+                    and fingerprint.partial_hash(dst, size) == fingerprint.partial_hash(src, size)):
+                os.remove(src)
+                return TransferResult(src, dst, 'existing', 'done', None, size, 0, time.perf_counter() - start)
+            return TransferResult(src, dst, strategy, 'skipped', 'target already exists, another file', size, 0,
+                                  time.perf_counter() - start)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.rename(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            strategy = 'copy'
+            resumed = copy_file(src, dst, bucket, journal)
+            os.remove(src)
+    except OSError as e:
+        return TransferResult(src, dst, strategy, 'failed', e, size, resumed, time.perf_counter() - start)
+    return TransferResult(src, dst, strategy, 'done', None, size, resumed, time.perf_counter() - start)
+
+
+def transfer_files(pairs, workers=2, bandwidth=0, journal=None):
+    """Move the (src, dst) files with move_file, workers at the same time, return their TransferResults
+
+    All the copies share one TokenBucket of bandwidth bytes per second (0 for no limit).
+    """
+    bucket = TokenBucket(bandwidth)
+    pairs = list(pairs)
+    start = time.perf_counter()
+
+    def run(pair):
+        result = move_file(*pair, bucket, journal)
+        if result.status == 'done':
+            resumed = f", resumed at {result.resumed / 1e6:.0f} MB" if result.resumed else ""
+            print(f"({result.strategy.upper()}) '{result.src}' -> '{result.dst}' in {result.elapsed:.1f} sec{resumed}")
+        elif result.status == 'skipped':
+            print(f"Skipped '{result.src}': {result.error}.")
+        else:
+            print(f"Failed '{result.src}': {result.error}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(run, pairs))
+
+    elapsed = time.perf_counter() - start
+    copied = sum(result.size - result.resumed for result in results
+                 if result.status == 'done' and result.strategy == 'copy')
+    done = sum(1 for result in results if result.status == 'done')
+    if results:
+        print("===================================================================================================")
+        print(f"Transferred {done}/{len(results)} files in {elapsed:.1f} sec, {copied / 1e6:.0f} MB copied "
+              f"({copied / 1e6 / max(elapsed, 1e-9):.1f} MB/s).")
+    return results
+
+
+def transfer_tree(src_folder, dst_folder, workers=2, bandwidth=0, journal=None):
+    """Move every file under src_folder to the same place under dst_folder, then remove the empty folders
+
+    Used to bring the folders organised by MDC in the staging folder over to a dest on another mount.
+    A file left by an interrupted run is moved on the next one, its copy resumed from the journal. A
+    file whose target is another file is a conflict: nothing is replaced, the file stays in src_folder
+    and is reported, for the next runs too until it is sorted out by hand.
+    """
+    pairs = []
+    for entry in walker.scan_tree(src_folder, stat=False):
+        pairs.append((entry.path, os.path.join(dst_folder, os.path.relpath(entry.path, src_folder))))
+    results = transfer_files(pairs, workers, bandwidth, journal)
+
+    conflicts = [result for result in results if result.status == 'skipped']
+    for result in conflicts:
+        print(f"(CONFLICT) '{result.src}' is left in place, '{result.dst}' is another file.")
+    if conflicts:
+        print(f"{len(conflicts)} files left in '{src_folder}', their target in '{dst_folder}' is taken.")
+
+    for dirpath, _, _ in os.walk(src_folder, topdown=False):
+        if dirpath != src_folder:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                # Not empty, a transfer was skipped or failed
+                continue
+    return results
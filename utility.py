@@ -1,6 +1,8 @@
 import re
 import threading
 
+import normalizer
+
 
 class InvalidFilenameError(Exception):
     pass
@@ -31,29 +33,15 @@ def clean_filename(filename):
 
 
 def parse_filename(filename):
-    # 正则表达式分解为：
-    # (\d{3,3})?[-_]?       匹配前缀前面的数字，强制限制为3，可选，可选的"-"或"_"连接符
-    # ([a-zA-Z]+)[-_]?      匹配前缀，只包含字母
-    # (\d{2,4})[-_]?        匹配2到4个数字
-    # ([a-zA-Z]+)?[-_]?     匹配第一个属性后缀
-    # ([a-zA-Z]+)?[-_]?     匹配第二个属性后缀
-    # (.*?)?[-_]?           匹配文件名中间可能存在的多余字符串，可能是垃圾讯息或表示cd的信息
-    # (cd\d+)?[-_]?         匹配"cd"字符串+一个数字，未使用
-    pattern = \
-        (r'(\d{3,3})?[-_]?'  # [0],前缀前面的数字
-         r'([a-zA-Z]+)[-_]?'  # [1],前缀
-         r'(\d{2,4})[-_]?'  # [2],2到4个数字
-         r'([a-zA-Z]+)?[-_]?'  # [3],第一个属性后缀
-         r'([a-zA-Z]+)?[-_]?'  # [4],第二个属性后缀
-         r'(cd\d{1,1})?[-_]?'  # [5],"cd"字符串
-         r'(\.\w+)$')  # [6],文件拓展名
-
-    match = re.match(pattern, filename)
-
-    if not match:
+    # 文件名由 normalizer 中同一个预编译的语法解析，与 file_clean 共用：
+    # [0] 前缀前面的数字, [1] 前缀, [2] 数字, [3] 第一个属性后缀,
+    # [4] 第二个属性后缀, [5] "cd"字符串, [6] 文件拓展名
+    parts = normalizer.parse(filename)
+
+    if parts is None:
         raise ValueError(f"文件名 '{filename}' 不匹配预期的格式")
 
-    parts = list(match.groups())
+    parts = list(parts)
     '''
     prefix_number  = parts[0]
     prefix         = parts[1]
@@ -198,8 +186,9 @@ def modify_filename(parts, postfix='', prefix_num=True):
     return result
 
 
-filename = "ssni-234-hack-c-cd1.mp4"
-print(parse_filename(filename))  # ['example', '1234', 'c', '.mp4']
-print(clean_filename(filename))
-filename = "example_1234_c.mp4"
-print(parse_filename(filename))  # ['SSNI', '469', 'C', '.mp4']
+if __name__ == "__main__":
+    filename = "ssni-234-hack-c-cd1.mp4"
+    print(parse_filename(filename))  # [None, 'ssni', '234', 'hack', 'c', 'cd1', '.mp4']
+    print(clean_filename(filename))
+    filename = "example_1234_c.mp4"
+    print(parse_filename(filename))  # [None, 'example', '1234', 'c', None, None, '.mp4']
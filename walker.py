@@ -0,0 +1,72 @@
+import os
+from collections import namedtuple
+
+# A regular file found by scan_tree. size, mtime and inode come from the cached DirEntry data,
+# size and mtime are None when the tree is scanned without stat.
+ScanEntry = namedtuple('ScanEntry', ['dirpath', 'name', 'path', 'size', 'mtime', 'inode'])
+
+
+def scan_tree(folder_path, stat=True, snapshot=None, skip=()):
+    """Walk the folder with os.scandir and yield a ScanEntry for every regular file
+
+    The file type comes from the d_type of the directory listing, so no extra syscall is needed to
+    tell files from folders. With stat=True, DirEntry.stat() is called once per file and its result
+    is reused for size and mtime. With stat=False, no stat call is made at all, which is the
+    fastest way to list a tree when only the names are needed.
+
+    With a snapshot (a stat_cache.StatCache), each folder is stat'ed first and a folder the snapshot
+    reports as unchanged is not listed again, its files and subfolders are taken from the snapshot.
+    Its subfolders are still checked one by one, so a change deep in the tree is never missed.
+
+    The folders in skip (e.g. the staging folder of transfer) are not walked.
+    """
+    pending = [folder_path]
+    while pending:
+        dirpath = pending.pop()
+        if dirpath in skip:
+            continue
+        if snapshot is not None:
+            # Stat the folder before the listing, a change during the listing is caught next run
+            try:
+                dir_stat = os.stat(dirpath)
+            except OSError:
+                continue
+            listing = snapshot.cached_listing(dirpath, dir_stat)
+            if listing is not None:
+                files, subdirs = listing
+                yield from files
+                pending.extend(reversed(subdirs))
+                continue
+
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            # Same as os.walk, skip the folder that can not be listed
+            continue
+
+        subdirs = []
+        file_paths = []
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    file_paths.append(entry.path)
+                    if stat:
+                        entry_stat = entry.stat()
+                        yield ScanEntry(dirpath, entry.name, entry.path,
+                                        entry_stat.st_size, entry_stat.st_mtime, entry.inode())
+                    else:
+                        yield ScanEntry(dirpath, entry.name, entry.path, None, None, entry.inode())
+                except OSError:
+                    # The file has gone between the listing and the stat
+                    continue
+
+        if snapshot is not None:
+            snapshot.record_listing(dirpath, dir_stat, file_paths, subdirs)
+
+        # Keep the os.walk top-down order, the first subfolder is visited first
+        pending.extend(reversed(subdirs))
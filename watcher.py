@@ -0,0 +1,186 @@
+import os
+import time
+import ctypes
+import select
+import struct
+import ctypes.util
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# Files still being downloaded by the common downloaders, never handled before they are renamed
+PARTIAL_EXTENSIONS = ('.part', '.!qb', '.crdownload', '.tmp', '.aria2', '.downloading')
+
+
+class Inotify:
+    """Recursive inotify watch of folder trees through the libc of the system"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            print(f"Can not watch '{path}': {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = path
+
+    def add_tree(self, folder_path, skip=()):
+        """Watch the folder and all its subfolders, return the files already in them"""
+        files = []
+        pending = [folder_path]
+        while pending:
+            dirpath = pending.pop()
+            if dirpath in skip:
+                continue
+            self.add_watch(dirpath)
+            try:
+                with os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.path)
+            except OSError:
+                continue
+        return files
+
+    def read_events(self, timeout):
+        """Return the (path, mask) of the events within timeout seconds"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            if wd in self.watches:
+                events.append((os.path.join(self.watches[wd], name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def settle(last_event, seen, size, now, debounce=5, stable=30):
+    """Return whether a watched file is ready at time now, and the (size, time) to remember for it
+
+    last_event is the time of the last event on the file, size its size now (None when it has gone)
+    and seen the (size, time) it was first seen with that size, None at first. The verdict is 'ready'
+    once no event has been seen for debounce seconds and the size has not changed for stable seconds,
+    'gone', or 'wait'. Only works on the given times, the caller reads the clock and the disk.
+    """
+    if now - last_event < debounce:
+        return 'wait', seen
+    if size is None:
+        return 'gone', None
+    if seen is None or seen[0] != size:
+        return 'wait', (size, now)
+    if now - seen[1] >= stable:
+        return 'ready', None
+    return 'wait', seen
+
+
+def watch_folders(folders, handler, debounce=5, stable=30, skip=()):
+    """Watch the folders and call handler(folder, paths) with the files that are ready to process
+
+    folders maps each watched folder to the key passed back to the handler. A file is ready once no
+    event has been seen on it for debounce seconds and its size has not changed for stable seconds,
+    i.e. its download has finished (see settle). Files with a PARTIAL_EXTENSIONS extension and the folders in skip
+    are never handed over. The files already in the folders when the watch starts are handed over
+    too. Runs until interrupted.
+    """
+    inotify = Inotify()
+    # path -> folder key, time of its last event
+    pending = {}
+    # path -> size, time the size was first seen (see settle)
+    sizes = {}
+
+    def enqueue(path, key, now):
+        if path.lower().endswith(PARTIAL_EXTENSIONS):
+            return
+        if any(path.startswith(skipped + os.sep) for skipped in skip):
+            return
+        pending[path] = (key, now)
+
+    for folder_path, key in folders.items():
+        for path in inotify.add_tree(folder_path, skip):
+            enqueue(path, key, time.monotonic())
+    print(f"Watching {len(inotify.watches)} folders, {len(pending)} files waiting.")
+
+    def key_of(path):
+        for folder_path, key in folders.items():
+            if path == folder_path or path.startswith(folder_path.rstrip(os.sep) + os.sep):
+                return key
+        return None
+
+    try:
+        while True:
+            now = time.monotonic()
+            for path, mask in inotify.read_events(timeout=1):
+                if path is None:
+                    # The event queue overflowed, look at the whole folders again
+                    print("inotify queue overflow, rescanning the watched folders.")
+                    for folder_path, key in folders.items():
+                        for file_path in inotify.add_tree(folder_path, skip):
+                            enqueue(file_path, key, now)
+                    continue
+                key = key_of(path)
+                if key is None:
+                    continue
+                if mask & IN_ISDIR:
+                    # A new folder, or a folder moved in with its files already inside
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        for file_path in inotify.add_tree(path, skip):
+                            enqueue(file_path, key, now)
+                    continue
+                enqueue(path, key, now)
+
+            # Hand over the files that are quiet and whose size is stable
+            ready = {}
+            now = time.monotonic()
+            for path, (key, last_event) in list(pending.items()):
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    size = None
+                verdict, seen = settle(last_event, sizes.get(path), size, now, debounce, stable)
+                if verdict == 'wait':
+                    sizes[path] = seen
+                    continue
+                del pending[path]
+                sizes.pop(path, None)
+                if verdict == 'ready':
+                    ready.setdefault(key, []).append(path)
+
+            for key, paths in ready.items():
+                handler(key, paths)
+    finally:
+        inotify.close()